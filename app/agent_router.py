@@ -1,7 +1,56 @@
-import os
-from .schemas import GenerateRequest, GenerateResponse, KPIBundle
-from .pipeline import generate as baseline_generate
+import asyncio, contextlib, importlib, os, threading, time
+from concurrent.futures import Future
+from types import ModuleType
+from typing import AsyncIterator, Dict, List, Tuple
+from .schemas import GenerateRequest, GenerateResponse, KPIBundle, BatchItemResult, CompareItem, CompareResponse
+from . import pipeline, gen_cache, llm_gateway, telemetry
 from .strategy_defaults import STRATEGY_DEFAULTS, DEFAULTS_BY_ASSET
+from .tools.kpi_compute import load_kpis
+
+# backend name -> module exposing run_graph/arun_graph/astream_graph(req, rs, kpis) and warm_up();
+# imported on first use only. "none" is app.pipeline, which has the same interface.
+BACKENDS = {"crewai": ".agents.graph_crewai", "langchain": ".agents.graph_langchain", "langgraph": ".agents.graph_langgraph"}
+
+_LOADED: Dict[str, ModuleType] = {}
+IMPORT_REPORT: Dict[str, Dict[str, object]] = {}
+
+def enabled_backends() -> List[str]:
+
+    raw = os.getenv("ENABLED_BACKENDS", ",".join(["none", *BACKENDS]))
+    return [b.strip().lower() for b in raw.split(",") if b.strip()]
+
+def load_backend(name: str) -> ModuleType | None:
+
+    if name not in BACKENDS or name not in enabled_backends():
+        return None
+    if name not in _LOADED:
+        t0 = time.perf_counter()
+        _LOADED[name] = importlib.import_module(BACKENDS[name], __package__)
+        IMPORT_REPORT[name] = {"import_s": round(time.perf_counter() - t0, 4)}
+    return _LOADED[name]
+
+def warm_up(names: List[str] | None = None) -> Dict[str, Dict[str, object]]:
+
+    if names is None:
+        raw = os.getenv("WARM_BACKENDS", os.getenv("AGENT_BACKEND", "none"))
+        names = [b.strip().lower() for b in raw.split(",") if b.strip()]
+
+    for name in names:
+        try:
+            if name == "none":
+                from . import pipeline as mod
+                IMPORT_REPORT.setdefault("none", {})
+            else:
+                mod = load_backend(name)
+                if mod is None:
+                    continue
+            t0 = time.perf_counter()
+            mod.warm_up()
+            IMPORT_REPORT[name]["warm_s"] = round(time.perf_counter() - t0, 4)
+        except Exception as e:  # a broken backend must not keep the API from starting
+            IMPORT_REPORT.setdefault(name, {})["warm_error"] = f"{type(e).__name__}: {e}"
+
+    return IMPORT_REPORT
 
 def _resolve(req: GenerateRequest):
 
@@ -14,35 +63,317 @@ def _resolve(req: GenerateRequest):
 
     out["asset_class"] = out["asset_class"] or "equities"
     out["benchmark_id"] = out["benchmark_id"] or DEFAULTS_BY_ASSET.get(out["asset_class"],{}).get("benchmark_id","SPX_TR")
+    out["region"] = req.region or "US"
     
     return out
 
-def generate(req: GenerateRequest, override_backend: str | None = None) -> GenerateResponse:
+def _response(req: GenerateRequest, rs: Dict[str, str], backend: str, result: Dict, trace: bool | None = None) -> GenerateResponse:
+    # result is the canonical (benchmark-level) draft; the strategy's own version is derived here, never cached
 
-    backend = (override_backend or os.getenv("AGENT_BACKEND","none")).lower()
-    
-    if backend == "none":
-        return baseline_generate(req)
-    
-    rs = _resolve(req)
-    
-    if backend == "crewai":
-        from .agents.graph_crewai import run_graph as run
-    
-    elif backend == "langchain":
-        from .agents.graph_langchain import run_graph as run
-
-    elif backend == "langgraph":
-        from .agents.graph_langgraph import run_graph as run
-    
-    else:
-        return baseline_generate(req)
-    
-    result = run(req, rs)
-    
+    notes = pipeline.NOTES if backend == "none" else f"Agent backend: {backend}"
+    assumptions = {"benchmark_id": rs["benchmark_id"], "asset_class": rs["asset_class"], "notes": notes}
+    with telemetry.stage("specialize"):
+        text, applied = pipeline.specialize(result["final_text"], req, result["kpis"])
+    if applied:
+        CANONICAL["specialized"] += 1
+        assumptions["specialized"] = ",".join(applied)
+    t = telemetry.current()
+    if t is not None and telemetry.attach_enabled(trace):
+        assumptions["timings"] = telemetry.timings_json(t)
     return GenerateResponse(
-        text=result["final_text"],
+        text=text,
         kpis=KPIBundle(**result["kpis"]),
-        assumptions={"benchmark_id": rs["benchmark_id"], "asset_class": rs["asset_class"], "notes": f"Agent backend: {backend}"},
+        assumptions=assumptions,
     )
 
+# Canonical drafts being written right now, by cache key. Strategies sharing a benchmark (share classes, SMA/fund
+# vehicles) resolve to the same key, so a concurrent request waits for the first one instead of paying for its
+# own writer + compliance calls; the heavy LLM work then scales with distinct benchmarks, not strategies.
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+CANONICAL = {"drafts": 0, "coalesced": 0, "specialized": 0}
+
+def canonical_stats() -> Dict[str, int]:
+    return {**CANONICAL, "in_flight": len(_INFLIGHT)}
+
+class _Abandoned(Exception):
+    # the owner was cancelled or its stream closed before a draft existed; waiters claim the key again
+    pass
+
+def _claim(key: str) -> Tuple[Future, bool]:
+    # -> (future, owner); the owner writes the draft, everyone else waits on the future
+
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is not None:
+            CANONICAL["coalesced"] += 1
+            return fut, False
+        fut = _INFLIGHT[key] = Future()
+        CANONICAL["drafts"] += 1
+        return fut, True
+
+def _release(key: str, fut: Future, result: Dict | None = None, error: BaseException | None = None) -> None:
+    # always runs when the owner stops. Only a real failure is shared with the waiters: a cancelled owner
+    # (client disconnect, GeneratorExit) must not abort requests that merely joined its draft
+
+    if result is not None:
+        gen_cache.CACHE.put(key, result)   # before release, so later arrivals hit the cache
+    _settle(key, fut, result, error)
+
+async def _arelease(key: str, fut: Future, result: Dict | None = None, error: BaseException | None = None) -> None:
+    # _release for the event loop: the SQLite write runs on a thread (nothing is awaited without a result,
+    # so a cancelled owner still settles synchronously)
+
+    if result is not None:
+        await asyncio.to_thread(gen_cache.CACHE.put, key, result)
+    _settle(key, fut, result, error)
+
+def _settle(key: str, fut: Future, result: Dict | None, error: BaseException | None) -> None:
+
+    with _INFLIGHT_LOCK:
+        if _INFLIGHT.get(key) is fut:
+            del _INFLIGHT[key]
+    if fut.done():
+        return
+    if result is not None:
+        fut.set_result(result)
+    else:
+        fut.set_exception(error if isinstance(error, Exception) else _Abandoned())
+
+def _join(key: str) -> Tuple[Future | None, Dict | None]:
+    # -> (future to release, None) when this caller owns the key, else (None, the owner's draft)
+
+    while True:
+        fut, owner = _claim(key)
+        if owner:
+            return fut, None
+        try:
+            return None, fut.result()
+        except _Abandoned:
+            continue
+
+async def _ajoin(key: str) -> Tuple[Future | None, Dict | None]:
+
+    while True:
+        fut, owner = _claim(key)
+        if owner:
+            return fut, None
+        try:   # shielded: a waiter that is cancelled must not cancel the shared future
+            return None, await asyncio.shield(asyncio.wrap_future(fut))
+        except _Abandoned:
+            continue
+
+def _canonical(key: str | None, run) -> Dict:
+
+    if key is None:
+        return run()
+    fut, result = _join(key)
+    if fut is None:
+        return result
+    error = None
+    try:
+        result = run()
+        return result
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _release(key, fut, result, error)
+
+async def _acanonical(key: str | None, arun) -> Dict:
+
+    if key is None:
+        return await arun()
+    fut, result = await _ajoin(key)
+    if fut is None:
+        return result
+    error = None
+    try:
+        result = await arun()
+        return result
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        await _arelease(key, fut, result, error)
+
+def _select(override_backend: str | None) -> Tuple[str, ModuleType]:
+
+    backend = (override_backend or os.getenv("AGENT_BACKEND","none")).lower()
+    mod = None if backend == "none" else load_backend(backend)
+
+    # unknown or disabled backends fall back to the baseline pipeline
+    return (backend, mod) if mod is not None else ("none", pipeline)
+
+def resolve_backend(override_backend: str | None) -> str:
+    # the backend name a request would actually run under (and be cached as)
+    return _select(override_backend)[0]
+
+def _prepare(req: GenerateRequest, backend: str, kpis: Dict | None, use_cache: bool):
+    # -> (rs, kpis, key, cached, pre). Without KPIs the pre-LLM DAG fetches them, overlapping the seed index and
+    # template loads, and the backend reuses that preparation (pre) instead of running the DAG again
+
+    rs = _resolve(req)
+    pre = None
+    if kpis is None:
+        pre = pipeline.prepare(req, rs)
+        kpis = pre["kpis"]
+    return (rs, kpis, *_lookup(req, backend, rs, kpis, use_cache), pre)
+
+async def _aprepare(req: GenerateRequest, backend: str, kpis: Dict | None, use_cache: bool):
+    # the DAG runs KPI loading on its thread pool, so a KPI cache miss never blocks the event loop
+
+    rs = _resolve(req)
+    pre = None
+    if kpis is None:
+        pre = await pipeline.aprepare(req, rs)
+        kpis = pre["kpis"]
+    # the key stats prompt files and seeds and the lookup reads SQLite: both stay off the event loop
+    return (rs, kpis, *await asyncio.to_thread(_lookup, req, backend, rs, kpis, use_cache), pre)
+
+def _shared(pre: Dict | None):
+    # callers that passed KPIs in keep whatever preparation is already shared (compare's)
+    return pipeline.shared(pre) if pre is not None else contextlib.nullcontext()
+
+def _lookup(req: GenerateRequest, backend: str, rs: Dict[str, str], kpis: Dict, use_cache: bool):
+    # -> (key, cached draft); (None, None) when caching is off
+
+    if not (use_cache and gen_cache.enabled()):
+        return None, None
+
+    with telemetry.stage("cache_lookup") as entry:
+        key = gen_cache.cache_key(backend, req.as_of_period_end, rs, kpis)
+        cached = gen_cache.CACHE.get(key)
+        entry["hit"] = cached is not None
+
+    return key, cached
+
+def generate(req: GenerateRequest, override_backend: str | None = None, kpis: Dict | None = None,
+             use_cache: bool = True, trace: bool | None = None) -> GenerateResponse:
+
+    backend, mod = _select(override_backend)
+    with telemetry.request(backend):
+        rs, kpis, key, cached, pre = _prepare(req, backend, kpis, use_cache)
+
+        if cached:
+            return _response(req, rs, backend, cached, trace)
+
+        with _shared(pre):
+            result = _canonical(key, lambda: mod.run_graph(req, rs, kpis))
+        return _response(req, rs, backend, result, trace)
+
+async def agenerate(req: GenerateRequest, override_backend: str | None = None, kpis: Dict | None = None,
+                    use_cache: bool = True, trace: bool | None = None) -> GenerateResponse:
+
+    backend, mod = _select(override_backend)
+    with telemetry.request(backend):
+        rs, kpis, key, cached, pre = await _aprepare(req, backend, kpis, use_cache)
+
+        if cached:
+            return _response(req, rs, backend, cached, trace)
+
+        with _shared(pre):
+            result = await _acanonical(key, lambda: mod.arun_graph(req, rs, kpis))
+        return _response(req, rs, backend, result, trace)
+
+async def astream_generate(req: GenerateRequest, override_backend: str | None = None, kpis: Dict | None = None,
+                           use_cache: bool = True, trace: bool | None = None) -> AsyncIterator[Tuple[str, object]]:
+    # yields ("token", str) while the writer runs, then ("final", GenerateResponse) after compliance
+
+    backend, mod = _select(override_backend)
+    with telemetry.request(backend):
+        rs, kpis, key, cached, pre = await _aprepare(req, backend, kpis, use_cache)
+
+        if cached:
+            yield "final", _response(req, rs, backend, cached, trace)
+            return
+
+        fut, result = await _ajoin(key) if key else (None, None)
+        if result is not None:   # the same draft was being written for another strategy
+            yield "final", _response(req, rs, backend, result, trace)
+            return
+        error = None
+        try:
+            with _shared(pre):
+                async for kind, payload in mod.astream_graph(req, rs, kpis):
+                    if kind == "token":
+                        yield kind, payload
+                    else:
+                        if fut is not None:
+                            await _arelease(key, fut, payload)
+                            fut = None
+                        yield "final", _response(req, rs, backend, payload, trace)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if fut is not None:   # closed or failed before the draft existed
+                _settle(key, fut, None, error)
+
+async def _acompare_one(req: GenerateRequest, name: str, kpis: Dict, use_cache: bool,
+                        trace: bool | None = None) -> CompareItem:
+
+    backend, t0 = name, time.perf_counter()
+    try:
+        backend, mod = _select(name)   # imports the backend: a missing package fails this result only
+        with telemetry.request(backend) as t:   # one trace per backend, so trace=true timings stay per result
+            rs, kpis, key, cached, _ = await _aprepare(req, backend, kpis, use_cache)
+            result = cached or await _acanonical(key, lambda: mod.arun_graph(req, rs, kpis))
+            response = _response(req, rs, backend, result, trace)
+        usage = [s for s in t.stages if "prompt_tokens" in s]
+        return CompareItem(backend=backend, ok=True, cached=bool(cached), seconds=round(time.perf_counter() - t0, 4),
+                           prompt_tokens=sum(s["prompt_tokens"] for s in usage),
+                           completion_tokens=sum(s["completion_tokens"] for s in usage),
+                           cost_usd=round(sum(s["cost_usd"] for s in usage), 6), response=response)
+    except Exception as e:   # one failing backend doesn't sink the comparison
+        return CompareItem(backend=backend, ok=False, seconds=round(time.perf_counter() - t0, 4), error=f"{type(e).__name__}: {e}")
+
+async def acompare(req: GenerateRequest, backends: List[str], kpis: Dict | None = None,
+                   use_cache: bool = True, trace: bool | None = None) -> CompareResponse:
+    # same request on several backends: KPIs, exemplars and prompts are prepared once, the LLM stages run concurrently
+
+    t0 = time.perf_counter()
+    # unknown/disabled ones collapse into "none"; nothing is imported until each backend's own run
+    names = list(dict.fromkeys(b if b in BACKENDS and b in enabled_backends() else "none" for b in (x.lower() for x in backends)))
+    rs = _resolve(req)
+    with telemetry.request("compare"), telemetry.stage("shared_prepare"):
+        pre = await pipeline.aprepare(req, rs, kpis)
+    shared_s = time.perf_counter() - t0
+
+    with pipeline.shared(pre):
+        results = await asyncio.gather(*(_acompare_one(req, n, pre["kpis"], use_cache, trace) for n in names))
+    return CompareResponse(kpis=KPIBundle(**pre["kpis"]), shared_seconds=round(shared_s, 4),
+                           total_seconds=round(time.perf_counter() - t0, 4), results=list(results))
+
+def compare(req: GenerateRequest, backends: List[str], kpis: Dict | None = None, use_cache: bool = True,
+            trace: bool | None = None) -> CompareResponse:
+    return asyncio.run(acompare(req, backends, kpis, use_cache, trace))
+
+def batch_concurrency(requested: int | None = None) -> int:
+    return max(1, requested or int(os.getenv("BATCH_CONCURRENCY", "8")))
+
+async def agenerate_batch(reqs: List[GenerateRequest], override_backend: str | None = None,
+                          concurrency: int | None = None) -> AsyncIterator[BatchItemResult]:
+
+    # one KPI fetch per distinct (period, benchmark); items sharing it reuse the same dict
+    keys = [(r.as_of_period_end, _resolve(r)["benchmark_id"]) for r in reqs]
+    distinct = list(dict.fromkeys(keys))
+    fetched = await asyncio.gather(*(asyncio.to_thread(load_kpis, *k) for k in distinct), return_exceptions=True)
+    kpis_by_key: Dict[Tuple, Dict | BaseException] = dict(zip(distinct, fetched))
+
+    sem = asyncio.Semaphore(batch_concurrency(concurrency))
+
+    async def run(i: int) -> BatchItemResult:
+        req, kpis = reqs[i], kpis_by_key[keys[i]]
+        try:
+            if isinstance(kpis, BaseException):
+                raise kpis
+            async with sem:
+                with llm_gateway.lane("batch"):   # interactive requests keep priority for rate-limit capacity
+                    resp = await agenerate(req, override_backend, kpis=kpis)
+            return BatchItemResult(index=i, strategy_name=req.strategy_name, ok=True, response=resp)
+        except Exception as e:
+            return BatchItemResult(index=i, strategy_name=req.strategy_name, ok=False, error=f"{type(e).__name__}: {e}")
+
+    for done in asyncio.as_completed([run(i) for i in range(len(reqs))]):
+        yield await done
@@ -1,28 +1,69 @@
-from typing import Dict
+import asyncio, contextvars, functools, os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Tuple
 from crewai import Agent, Task, Crew
-from ..tools.data_fetchers import fetch_kpis
-from ..tools.kpi_compute import normalize_kpis
-from ..prompt_loader import Prompt
-from ..tools import retrieval
+from .. import llm, pipeline, prompt_layout, telemetry
+from ..tools.compliance_rules import needs_llm_pass
 
-def run_graph(req, rs) -> Dict:
-    
-    kpis = normalize_kpis(fetch_kpis(req.as_of_period_end, rs["benchmark_id"]))
-    planner = Prompt("planner").render({"kpis_json": kpis, "banned_phrases": "we expect, we believe, positioned to"})
-    writer_vars = {**kpis, "as_of": str(req.as_of_period_end), "benchmark_id": rs["benchmark_id"],
-                   "banned_phrases": "we expect, we believe, positioned to", "word_target_min": 200, "word_target_max": 300,
-                   "style_exemplars": "\n---\n".join(retrieval.get_style_exemplars(k=2)), "plan_text": planner}
+# Crew.kickoff is blocking; async callers get a dedicated, bounded pool instead of the default executor
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("CREWAI_MAX_WORKERS", "8")), thread_name_prefix="crewai")
+
+@lru_cache(maxsize=1)
+def _agents():
+
+    # crewai reaches the provider through litellm; its shared httpx sessions go through llm_gateway too
+    import litellm
+    litellm.client_session = llm._gateway_http()
+    litellm.aclient_session = llm._gateway_http(async_=True)
+
+    writer = Agent(role="WriterAgent", goal="Write NB-style Market Context.", backstory="No outlook/attribution.", verbose=False, allow_delegation=False)
     
-    writer_prompt = Prompt("writer").render(writer_vars)
+    compliance = Agent(role="ComplianceAgent", goal="Enforce scope and numeric fidelity.", backstory="", verbose=False, allow_delegation=False)
+
+    return writer, compliance
+
+def warm_up() -> None:
+    _agents()
+
+def _kickoff(stage: str, agent, description: str, expected_output: str) -> str:
 
-    WriterAgent = Agent(role="WriterAgent", goal="Write NB-style Market Context.", backstory="No outlook/attribution.", verbose=False, allow_delegation=False)
+    with telemetry.stage(stage):
+        out = Crew(agents=[agent], tasks=[Task(description=description, agent=agent, expected_output=expected_output)], verbose=False).kickoff()
+    usage = getattr(out, "token_usage", None)
+    if usage is not None:
+        telemetry.record_usage(stage, llm.model_name(), getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+    return out.raw
+
+def run_graph(req, rs, kpis: Dict | None = None) -> Dict:
     
-    ComplianceAgent = Agent(role="ComplianceAgent", goal="Enforce scope and numeric fidelity.", backstory="", verbose=False, allow_delegation=False)
+    pre = pipeline.prepare(req, rs, kpis)
+    kpis = pre["kpis"]
+
+    WriterAgent, ComplianceAgent = _agents()
     
-    draft = Crew(agents=[WriterAgent], tasks=[Task(description=writer_prompt, agent=WriterAgent, expected_output="~200–300 words")], verbose=False).kickoff().raw
+    draft = _kickoff("writer_llm", WriterAgent, pre["writer_render"].combined(), "~200–300 words")
     
-    comp = Prompt("compliance").render({"draft_text": draft, "kpis_json": kpis, "banned_phrases":"we expect, we believe, positioned to","word_target_min":200,"word_target_max":300})
+    with telemetry.stage("compliance_rules"):
+        needs_pass = needs_llm_pass(draft, kpis, req.as_of_period_end)
+    if not needs_pass:
+        return {"draft": draft, "final_text": draft.strip(), "kpis": kpis}
+
+    comp = prompt_layout.compliance(draft, kpis)
     
-    final_text = Crew(agents=[ComplianceAgent], tasks=[Task(description=comp, agent=ComplianceAgent, expected_output="Clean text")], verbose=False).kickoff().raw
+    final_text = _kickoff("compliance_llm", ComplianceAgent, comp.combined(), "Clean text")
     
-    return {"final_text": final_text.strip(), "kpis": kpis}
+    return {"draft": draft, "final_text": final_text.strip(), "kpis": kpis}
+
+async def arun_graph(req, rs, kpis: Dict | None = None) -> Dict:
+
+    # copy the context so the request trace follows the call onto the pool thread
+    call = functools.partial(contextvars.copy_context().run, run_graph, req, rs, kpis)
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, call)
+
+async def astream_graph(req, rs, kpis: Dict | None = None) -> AsyncIterator[Tuple[str, object]]:
+
+    # crewai has no token stream; the draft arrives as one chunk once the crew finishes
+    result = await arun_graph(req, rs, kpis)
+    yield "token", result["draft"]
+    yield "result", result
@@ -1,30 +1,81 @@
-import os
-from typing import Dict
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Tuple
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from ..tools.data_fetchers import fetch_kpis
-from ..tools.kpi_compute import normalize_kpis
-from ..prompt_loader import Prompt
-from ..tools import retrieval
+from ..tools.compliance_rules import needs_llm_pass
+from .. import llm, pipeline, prompt_layout, telemetry
 
-llm = ChatOpenAI(model=os.getenv("OPENAI_MODEL","gpt-4o-mini"), temperature=0.2)
+@lru_cache(maxsize=1)
+def _chains():
 
-def run_graph(req, rs) -> Dict:
+    model = llm.get_chat_model()
+    writer = ChatPromptTemplate.from_messages([("system","{system}"),("user","{p}")]) | model
+    compliance = ChatPromptTemplate.from_messages([("system","{system}"),("user","{p}")]) | model
+    
+    return writer, compliance
 
-    kpis = normalize_kpis(fetch_kpis(req.as_of_period_end, rs["benchmark_id"]))
+def warm_up() -> None:
+    _chains()
 
-    planner = Prompt("planner").render({"kpis_json": kpis, "banned_phrases": "we expect, we believe, positioned to"})
-    
-    wvars = {**kpis, "as_of": str(req.as_of_period_end), "benchmark_id": rs["benchmark_id"],
-             "banned_phrases": "we expect, we believe, positioned to", "word_target_min":200, "word_target_max":300,
-             "style_exemplars": "\n---\n".join(retrieval.get_style_exemplars(k=2)), "plan_text": planner}
-    
-    wtext = Prompt("writer").render(wvars)
-    
-    draft = (ChatPromptTemplate.from_messages([("system","You are a factual financial writing assistant. Avoid outlook and attribution."),("user","{p}")]) | llm).invoke({"p": wtext}).content
-    
-    ctext = Prompt("compliance").render({"draft_text": draft, "kpis_json": kpis, "banned_phrases": "we expect, we believe, positioned to", "word_target_min":200, "word_target_max":300})
+COMPLIANCE_SYSTEM = "Ensure scope and numeric fidelity."
+
+def _inputs(prompt: prompt_layout.Assembled) -> Dict:
+    return {"system": prompt.system, "p": prompt.user}
+
+def _compliance_inputs(draft: str, kpis: Dict) -> Dict:
+    return _inputs(prompt_layout.compliance(draft, kpis, system=COMPLIANCE_SYSTEM))
+
+def run_graph(req, rs, kpis: Dict | None = None) -> Dict:
+
+    pre = pipeline.prepare(req, rs, kpis)
+    kpis = pre["kpis"]
+    writer_chain, compliance_chain = _chains()
+
+    with telemetry.stage("writer_llm"):
+        draft = telemetry.observe_llm("writer_llm", writer_chain.invoke(_inputs(pre["writer_render"]))).content
     
-    final_text = (ChatPromptTemplate.from_messages([("system","Ensure scope and numeric fidelity."),("user","{p}")]) | llm).invoke({"p": ctext}).content
+    final_text = draft
+    with telemetry.stage("compliance_rules"):
+        needs_pass = needs_llm_pass(draft, kpis, req.as_of_period_end)
+    if needs_pass:
+        with telemetry.stage("compliance_llm"):
+            final_text = telemetry.observe_llm("compliance_llm", compliance_chain.invoke(_compliance_inputs(draft, kpis))).content
     
-    return {"final_text": final_text.strip(), "kpis": kpis}
+    return {"draft": draft, "final_text": final_text.strip(), "kpis": kpis}
+
+async def arun_graph(req, rs, kpis: Dict | None = None) -> Dict:
+
+    pre = await pipeline.aprepare(req, rs, kpis)
+    kpis = pre["kpis"]
+    writer_chain = _chains()[0]
+
+    with telemetry.stage("writer_llm"):
+        draft = telemetry.observe_llm("writer_llm", await writer_chain.ainvoke(_inputs(pre["writer_render"]))).content
+
+    return {"draft": draft, "final_text": (await _acomply(draft, kpis, req.as_of_period_end)).strip(), "kpis": kpis}
+
+async def _acomply(draft: str, kpis: Dict, as_of) -> str:
+
+    with telemetry.stage("compliance_rules"):
+        needs_pass = needs_llm_pass(draft, kpis, as_of)
+    if not needs_pass:
+        return draft
+    with telemetry.stage("compliance_llm"):
+        return telemetry.observe_llm("compliance_llm", await _chains()[1].ainvoke(_compliance_inputs(draft, kpis))).content
+
+async def astream_graph(req, rs, kpis: Dict | None = None) -> AsyncIterator[Tuple[str, object]]:
+
+    pre = await pipeline.aprepare(req, rs, kpis)
+    kpis = pre["kpis"]
+    writer_chain = _chains()[0]
+
+    message = None
+    with telemetry.stage("writer_llm"):
+        async for chunk in writer_chain.astream(_inputs(pre["writer_render"])):
+            message = chunk if message is None else message + chunk
+            if chunk.content:
+                yield "token", chunk.content
+    if message is not None:
+        telemetry.observe_llm("writer_llm", message)
+
+    draft = message.content if message is not None else ""
+    yield "result", {"draft": draft, "final_text": (await _acomply(draft, kpis, req.as_of_period_end)).strip(), "kpis": kpis}
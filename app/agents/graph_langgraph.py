@@ -1,100 +1,150 @@
 # app/agents/graph_langgraph.py
-from typing import Dict, TypedDict
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Tuple, TypedDict
 from langgraph.graph import StateGraph, END
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 
-from ..tools.data_fetchers import fetch_kpis
-from ..tools.kpi_compute import normalize_kpis
 from ..prompt_loader import Prompt
-from ..tools import retrieval
-
-import os
-
-# single LLM config 
-llm = ChatOpenAI(model=os.getenv("OPENAI_MODEL","gpt-4o-mini"), temperature=0.2)
+from ..tools.compliance_rules import needs_llm_pass
+from .. import llm, pipeline, prompt_layout, telemetry
+
+COMPLIANCE_SYSTEM = "Ensure scope (no outlook/attribution) and exact numeric fidelity; if a number is not in KPIs, remove that sentence."
+
+# chains and the compiled graph are built once per process (see warm_up)
+@lru_cache(maxsize=2)
+def _writer_chain(prefix: bool = True):
+    if prefix:
+        # static charter/rules first so the provider can reuse the cached prefix; the tone charter may vary
+        messages = [("system", "{system}"), ("system", "{tone}"), ("user", "{p}")]
+    else:
+        messages = [
+            ("system", "{tone}"),
+            ("system", "You are a factual financial writing assistant. Use only the provided KPIs for numbers."),
+            ("user", "{p}"),
+        ]
+    return ChatPromptTemplate.from_messages(messages) | llm.get_chat_model()
+
+@lru_cache(maxsize=1)
+def _compliance_chain():
+    return ChatPromptTemplate.from_messages([
+        ("system", "{system}"),
+        ("user", "{p}"),
+    ]) | llm.get_chat_model()
 
 class MCState(TypedDict):
     req: dict    # GenerateRequest.model_dump()
     rs: dict     # resolved strategy (benchmark_id, asset_class)
     kpis: dict   # normalized KPI dict (source of truth)
+    exemplars: list       # style snippets from the pre-LLM stages
+    writer_system: str    # static system prefix from the pre-LLM stages (prompt_layout)
+    writer_prompt: str    # per-request writer prompt from the pre-LLM stages
+    prefix_layout: bool
     draft: str
+    needs_compliance: bool
     final: str
 
-def writer_node(state: MCState) -> MCState:
-    kpis = state["kpis"]
-    style = "\n---\n".join(retrieval.get_style_exemplars(2))
-
-    # 1) plan from KPIs
-    plan = Prompt("planner").render({
-        "kpis_json": kpis,
-        "banned_phrases": "we expect, we believe, positioned to",
-    })
-
-    # 2) writer prompt (data-bound)
-    wtext = Prompt("writer").render({
-        **kpis,
-        "as_of": state["req"]["as_of_period_end"],
-        "benchmark_id": state["rs"]["benchmark_id"],
-        "banned_phrases": "we expect, we believe, positioned to",
-        "word_target_min": 200,
-        "word_target_max": 300,
-        "style_exemplars": style,
-        "plan_text": plan,
-    })
-
-    # 3) system tone charter
+def _writer_inputs(state: MCState) -> Dict:
+    # system tone charter; planner + writer prompts were rendered by pipeline.PRE_LLM
     tone_system = ""
     try:
-        tone_system = Prompt("tone_system").render({"style_exemplars": style})
+        tone_system = Prompt("tone_system").render({"style_exemplars": "\n---\n".join(state["exemplars"])})
     except Exception:
         pass  # if tone_system prompt not present, continue
 
-    chain = ChatPromptTemplate.from_messages([
-        ("system", tone_system or "Write in a professional, neutral, client-friendly tone; no outlook or attribution."),
-        ("system", "You are a factual financial writing assistant. Use only the provided KPIs for numbers."),
-        ("user", "{p}"),
-    ]) | llm
+    return {
+        "tone": tone_system or "Write in a professional, neutral, client-friendly tone; no outlook or attribution.",
+        "system": state["writer_system"],
+        "p": state["writer_prompt"],
+    }
 
-    draft = chain.invoke({"p": wtext}).content
-    state["draft"] = draft
+def writer_node(state: MCState) -> MCState:
+    with telemetry.stage("tone_render"):
+        inputs = _writer_inputs(state)
+    with telemetry.stage("writer_llm"):
+        state["draft"] = telemetry.observe_llm("writer_llm", _writer_chain(state["prefix_layout"]).invoke(inputs)).content
     return state
 
-def compliance_node(state: MCState) -> MCState:
-    kpis = state["kpis"]
-    ctext = Prompt("compliance").render({
-        "draft_text": state["draft"],
-        "kpis_json": kpis,
-        "banned_phrases": "we expect, we believe, positioned to",
-        "word_target_min": 200,
-        "word_target_max": 300,
-    })
-
-    chain = ChatPromptTemplate.from_messages([
-        ("system", "Ensure scope (no outlook/attribution) and exact numeric fidelity; if a number is not in KPIs, remove that sentence."),
-        ("user", "{p}"),
-    ]) | llm
+async def awriter_node(state: MCState) -> MCState:
+    with telemetry.stage("tone_render"):
+        inputs = _writer_inputs(state)
+    with telemetry.stage("writer_llm"):
+        state["draft"] = telemetry.observe_llm("writer_llm", await _writer_chain(state["prefix_layout"]).ainvoke(inputs)).content
+    return state
 
-    state["final"] = chain.invoke({"p": ctext}).content.strip()
+def verify_node(state: MCState) -> MCState:
+    # deterministic rule check; a clean draft goes straight to END without the compliance LLM call
+    with telemetry.stage("compliance_rules"):
+        state["needs_compliance"] = needs_llm_pass(state["draft"], state["kpis"], state["req"]["as_of_period_end"])
+    if not state["needs_compliance"]:
+        state["final"] = state["draft"].strip()
     return state
 
-def run_graph(req, rs) -> Dict:
-    # fetch + normalize KPIs (MOCK=true returns stubs)
-    kpis = normalize_kpis(fetch_kpis(req.as_of_period_end, rs["benchmark_id"]))
+def _compliance_inputs(state: MCState) -> Dict:
+    prompt = prompt_layout.compliance(state["draft"], state["kpis"], system=COMPLIANCE_SYSTEM)
+    return {"system": prompt.system, "p": prompt.user}
+
+def compliance_node(state: MCState) -> MCState:
+    with telemetry.stage("compliance_llm"):
+        state["final"] = telemetry.observe_llm("compliance_llm", _compliance_chain().invoke(_compliance_inputs(state))).content.strip()
+    return state
 
+async def acompliance_node(state: MCState) -> MCState:
+    with telemetry.stage("compliance_llm"):
+        state["final"] = telemetry.observe_llm("compliance_llm", await _compliance_chain().ainvoke(_compliance_inputs(state))).content.strip()
+    return state
+
+@lru_cache(maxsize=1)
+def compiled_graph():
     graph = StateGraph(MCState)
-    graph.add_node("writer", writer_node)
-    graph.add_node("compliance", compliance_node)
+    # sync + async implementations so the same compiled graph serves invoke() and ainvoke()
+    graph.add_node("writer", RunnableLambda(writer_node, afunc=awriter_node))
+    graph.add_node("verify", verify_node)
+    graph.add_node("compliance", RunnableLambda(compliance_node, afunc=acompliance_node))
     graph.set_entry_point("writer")
-    graph.add_edge("writer", "compliance")
+    graph.add_edge("writer", "verify")
+    graph.add_conditional_edges("verify", lambda s: "compliance" if s["needs_compliance"] else END)
     graph.add_edge("compliance", END)
+    return graph.compile()
+
+def warm_up() -> None:
+    _writer_chain(prompt_layout.prefix_mode())
+    _compliance_chain()
+    compiled_graph()
 
-    app = graph.compile()
-    out = app.invoke({
+def _initial_state(req, rs, pre: Dict) -> MCState:
+    return {
         "req": req.model_dump(),
         "rs": rs,
-        "kpis": kpis,
+        "kpis": pre["kpis"],
+        "exemplars": pre["exemplars"],
+        "writer_system": pre["writer_render"].system,
+        "writer_prompt": pre["writer_render"].user,
+        "prefix_layout": pre["writer_render"].prefix,
         "draft": "",
+        "needs_compliance": True,
         "final": "",
-    })
-    return {"final_text": out["final"], "kpis": kpis}
+    }
+
+def run_graph(req, rs, kpis: Dict | None = None) -> Dict:
+    state = _initial_state(req, rs, pipeline.prepare(req, rs, kpis))
+    out = compiled_graph().invoke(state)
+    return {"draft": out["draft"], "final_text": out["final"], "kpis": state["kpis"]}
+
+async def arun_graph(req, rs, kpis: Dict | None = None) -> Dict:
+    state = _initial_state(req, rs, await pipeline.aprepare(req, rs, kpis))
+    out = await compiled_graph().ainvoke(state)
+    return {"draft": out["draft"], "final_text": out["final"], "kpis": state["kpis"]}
+
+async def astream_graph(req, rs, kpis: Dict | None = None) -> AsyncIterator[Tuple[str, object]]:
+    # "messages" carries LLM tokens tagged with the emitting node; "values" carries the final state
+    state = _initial_state(req, rs, await pipeline.aprepare(req, rs, kpis))
+    out = state
+    async for mode, chunk in compiled_graph().astream(state, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message, meta = chunk
+            if meta.get("langgraph_node") == "writer" and message.content:
+                yield "token", message.content
+        else:
+            out = chunk
+    yield "result", {"draft": out["draft"], "final_text": out["final"], "kpis": state["kpis"]}
@@ -0,0 +1,153 @@
+import asyncio, contextvars, os, time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+from . import telemetry
+
+# Small dependency-graph executor for the pre-LLM stages. A stage starts as soon as its deps are done, so
+# independent stages overlap and the wait before the first LLM call is the critical path, not the sum.
+# Stage functions take the results so far (inputs + finished stages) and return their own value.
+
+_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("DAG_MAX_WORKERS", "16")), thread_name_prefix="dag")
+
+@dataclass(frozen=True)
+class Stage:
+
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    timeout_s: float | None = None
+    inline: bool = False                                  # cheap CPU work: run on the caller, skip the pool hop
+    fallback: Callable[[Dict[str, Any]], Any] | None = None   # on error/timeout use fallback(results) instead of failing
+
+class DAG:
+
+    def __init__(self, stages: Iterable[Stage]):
+
+        self.stages: Dict[str, Stage] = {}
+        for s in stages:
+            if s.name in self.stages:
+                raise ValueError(f"Duplicate stage: {s.name}")
+            self.stages[s.name] = s
+        self.order = self._toposort()
+
+    def _toposort(self) -> List[str]:
+
+        order, seen, visiting = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in seen or name not in self.stages:   # unknown deps are run inputs
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle through stage: {name}")
+            visiting.add(name)
+            for d in self.stages[name].deps:
+                visit(d)
+            visiting.discard(name)
+            seen.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _pending(self, inputs: Dict[str, Any]) -> List[str]:
+
+        # a stage whose result is passed in (e.g. KPIs already loaded by the router) is not run
+        pending = [n for n in self.order if n not in inputs]
+        for n in pending:
+            missing = [d for d in self.stages[n].deps if d not in self.stages and d not in inputs]
+            if missing:
+                raise KeyError(f"Stage {n} needs inputs {missing}")
+        return pending
+
+    @staticmethod
+    def _call(stage: Stage, results: Dict[str, Any]) -> Any:
+        with telemetry.stage(stage.name):
+            return stage.fn(results)
+
+    @staticmethod
+    def _recover(stage: Stage, results: Dict[str, Any], exc: BaseException) -> Any:
+        if stage.fallback is None:
+            raise exc
+        return stage.fallback(results)
+
+    def run(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+
+        results = dict(inputs)
+        pending = self._pending(inputs)
+        running: Dict[Future, Tuple[Stage, float]] = {}
+
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in [n for n in pending if all(d in results for d in self.stages[n].deps)]:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    if stage.inline:
+                        try:
+                            results[name] = self._call(stage, results)
+                        except Exception as e:
+                            results[name] = self._recover(stage, results, e)
+                        progressed = True
+                    else:
+                        fut = _POOL.submit(contextvars.copy_context().run, self._call, stage, dict(results))
+                        deadline = time.monotonic() + stage.timeout_s if stage.timeout_s else float("inf")
+                        running[fut] = (stage, deadline)
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Unsatisfiable stages: {pending}")
+                break
+
+            nearest = min(d for _, d in running.values())
+            done, _ = wait(list(running), timeout=None if nearest == float("inf") else max(0.0, nearest - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, _ = running.pop(fut)
+                try:
+                    results[stage.name] = fut.result()
+                except Exception as e:
+                    results[stage.name] = self._recover(stage, results, e)
+            now = time.monotonic()
+            for fut, (stage, deadline) in list(running.items()):
+                if deadline <= now:   # the thread can't be interrupted; its result is dropped
+                    del running[fut]
+                    results[stage.name] = self._recover(stage, results, TimeoutError(f"Stage {stage.name} exceeded {stage.timeout_s}s"))
+
+        return results
+
+    async def arun(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+
+        results = dict(inputs)
+        loop = asyncio.get_running_loop()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(stage: Stage) -> Any:
+            if stage.inline:
+                return self._call(stage, results)
+            if asyncio.iscoroutinefunction(stage.fn):
+                with telemetry.stage(stage.name):
+                    return await asyncio.wait_for(stage.fn(results), stage.timeout_s)
+            call = loop.run_in_executor(_POOL, contextvars.copy_context().run, self._call, stage, dict(results))
+            return await asyncio.wait_for(call, stage.timeout_s)
+
+        async def run_stage(stage: Stage) -> None:
+            await asyncio.gather(*(tasks[d] for d in stage.deps if d in tasks))
+            try:
+                results[stage.name] = await execute(stage)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, TimeoutError):
+                    e = TimeoutError(f"Stage {stage.name} exceeded {stage.timeout_s}s")
+                results[stage.name] = self._recover(stage, results, e)
+
+        for name in self._pending(inputs):   # topological, so deps already have tasks
+            tasks[name] = asyncio.create_task(run_stage(self.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for t in tasks.values():
+                t.cancel()
+        return results
@@ -0,0 +1,100 @@
+import hashlib, json, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Dict
+from . import llm, prompt_layout
+from .prompt_loader import REGISTRY
+from .tools import retrieval
+
+# Content-addressed store of generation artifacts (draft + final text + KPIs). The key covers everything
+# that shapes the output, so editing a prompt, switching model/temperature or reseeding style changes the key
+# and old entries simply age out under the size bound.
+
+CACHE_PATH = Path(os.getenv("GEN_CACHE_PATH", ".cache/gen_cache.sqlite"))
+PROMPTS_USED = ("planner", "writer", "compliance", "tone_system", *prompt_layout.PROMPTS)
+
+def enabled() -> bool:
+    return os.getenv("GEN_CACHE", "true").lower() == "true"
+
+def _prompt_hash(name: str) -> str:
+
+    try:
+        return REGISTRY.content_hash(name)
+    except FileNotFoundError:
+        return ""
+
+def cache_key(backend: str, as_of: str, rs: Dict[str, str], kpis: Dict) -> str:
+
+    # credentials/endpoint: without a client the backends fall back to the template stub, which must stop
+    # answering once a model is configured
+    material = {
+        "backend": backend, "as_of": str(as_of), "benchmark_id": rs["benchmark_id"], "asset_class": rs["asset_class"],
+        "region": rs.get("region"),
+        "kpis": kpis, "prompts": {n: _prompt_hash(n) for n in PROMPTS_USED}, "layout": prompt_layout.layout(),
+        "model": llm.model_name(), "temperature": llm.TEMPERATURE, "seeds": retrieval.INDEX.refresh().fingerprint(),
+        "llm": {"credentials": llm.has_credentials(), "endpoint": llm.endpoint()},
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class GenerationCache:
+
+    def __init__(self, path: Path | str = CACHE_PATH, max_bytes: int | None = None):
+
+        self.path = Path(path)
+        self.max_bytes = max_bytes or int(os.getenv("GEN_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _db(self) -> sqlite3.Connection:
+
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, payload TEXT, size INTEGER, last_access REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS generations_lru ON generations (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Dict | None:
+
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT payload FROM generations WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            db.execute("UPDATE generations SET last_access=? WHERE key=?", (time.time(), key))
+            db.commit()
+            self.counters["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, artifacts: Dict) -> None:
+
+        payload = json.dumps(artifacts)
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?)", (key, payload, len(payload), time.time()))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+            # evict least recently used entries until back under the byte budget
+            for old_key, size in db.execute("SELECT key, size FROM generations ORDER BY last_access").fetchall():
+                if total <= self.max_bytes or old_key == key:
+                    break
+                db.execute("DELETE FROM generations WHERE key=?", (old_key,))
+                total -= size
+                self.counters["evictions"] += 1
+            db.commit()
+
+    def has(self, key: str) -> bool:
+
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM generations WHERE key=?", (key,)).fetchone() is not None
+
+    def stats(self) -> Dict[str, int]:
+
+        with self._lock:
+            items, size = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+            return {**self.counters, "items": items, "bytes": size}
+
+CACHE = GenerationCache()
@@ -0,0 +1,237 @@
+import argparse, contextlib, hashlib, json, multiprocessing, os, signal, socket, sqlite3, threading, time, uuid
+from pathlib import Path
+from typing import Dict, List, Tuple
+from .schemas import GenerateRequest
+from . import agent_router, llm_gateway
+
+# Durable queue for long generations. POST /jobs/market-context stores the request in SQLite and returns a job id at
+# once; worker processes (python -m app.jobs --workers N, scaled apart from the API) claim the next job by priority
+# under a lease, run agent_router.generate and write the response back. Workers renew the lease while they run, so a
+# job whose worker died is claimed again once the lease lapses, up to JOBS_MAX_ATTEMPTS. A generation that raises is
+# failed at once: transient LLM errors were already retried by the gateway.
+# Admission control caps the queued jobs (429 + Retry-After past JOBS_MAX_QUEUED); an Idempotency-Key returns the
+# job it first created instead of enqueueing a duplicate.
+
+JOBS_PATH = Path(os.getenv("JOBS_PATH", ".cache/jobs.sqlite"))
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}   # lower runs first; "low" also takes the gateway's batch lane
+
+class QueueFull(Exception):
+
+    def __init__(self, queued: int, retry_after_s: int):
+        super().__init__(f"{queued} jobs already queued")
+        self.retry_after_s = retry_after_s
+
+class IdempotencyConflict(Exception):
+    pass
+
+def _digest(req: GenerateRequest, backend: str | None) -> str:
+    return hashlib.sha256(f"{backend}|{req.model_dump_json()}".encode("utf-8")).hexdigest()
+
+class JobQueue:
+
+    def __init__(self, path: Path | str = JOBS_PATH, max_queued: int | None = None, lease_s: float | None = None,
+                 max_attempts: int | None = None):
+
+        self.path = Path(path)
+        self.max_queued = max_queued or int(os.getenv("JOBS_MAX_QUEUED", "200"))
+        self.lease_s = lease_s or float(os.getenv("JOBS_LEASE_S", "60"))
+        self.max_attempts = max_attempts or int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.counters = {"submitted": 0, "deduplicated": 0, "rejected": 0}
+
+    def _db(self) -> sqlite3.Connection:
+
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # autocommit; claims take BEGIN IMMEDIATE so concurrent workers never grab the same job
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, digest TEXT, "
+                         "priority INTEGER, backend TEXT, request TEXT, status TEXT, attempts INTEGER DEFAULT 0, "
+                         "worker TEXT, lease_until REAL, response TEXT, error TEXT, created REAL, started REAL, finished REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_next ON jobs (status, priority, created)")
+            self._conn = conn
+        return self._conn
+
+    @contextlib.contextmanager
+    def _tx(self):
+
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _retry_after(self, db: sqlite3.Connection, queued: int) -> int:
+        # queue depth x recent run time, spread over the jobs currently running (a proxy for live workers)
+
+        avg, = db.execute("SELECT AVG(finished - started) FROM (SELECT finished, started FROM jobs "
+                          "WHERE status='done' ORDER BY finished DESC LIMIT 50)").fetchone()
+        running, = db.execute("SELECT COUNT(*) FROM jobs WHERE status='running'").fetchone()
+        return max(1, round((avg or self.lease_s) * queued / max(1, running)))
+
+    def submit(self, req: GenerateRequest, backend: str | None = None, priority: str = "normal",
+               idempotency_key: str | None = None) -> Tuple[Dict, bool]:
+        # -> (job, created); created is False when the idempotency key already names a job
+
+        digest = _digest(req, backend)
+        with self._tx() as db:
+            if idempotency_key:
+                row = db.execute("SELECT * FROM jobs WHERE idempotency_key=?", (idempotency_key,)).fetchone()
+                if row is not None:
+                    if row["digest"] != digest:
+                        raise IdempotencyConflict(f"idempotency key {idempotency_key!r} was used for a different request")
+                    self.counters["deduplicated"] += 1
+                    return self._job(db, row), False
+
+            queued, = db.execute("SELECT COUNT(*) FROM jobs WHERE status='queued'").fetchone()
+            if queued >= self.max_queued:
+                self.counters["rejected"] += 1
+                raise QueueFull(queued, self._retry_after(db, queued))
+
+            job_id = uuid.uuid4().hex
+            db.execute("INSERT INTO jobs (id, idempotency_key, digest, priority, backend, request, status, created) "
+                       "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                       (job_id, idempotency_key, digest, PRIORITIES[priority], backend, req.model_dump_json(), time.time()))
+            self.counters["submitted"] += 1
+            return self._job(db, db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()), True
+
+    def claim(self, worker: str) -> Dict | None:
+        # next queued job, or a running one whose worker stopped renewing its lease
+
+        now = time.time()
+        with self._tx() as db:
+            db.execute("UPDATE jobs SET status='failed', finished=?, error=? WHERE status='running' AND lease_until<? "
+                       "AND attempts>=?", (now, f"worker lost {self.max_attempts} times", now, self.max_attempts))
+            row = db.execute("SELECT id FROM jobs WHERE status='queued' OR (status='running' AND lease_until<?) "
+                             "ORDER BY priority, created LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status='running', worker=?, attempts=attempts+1, started=?, lease_until=? WHERE id=?",
+                       (worker, now, now + self.lease_s, row["id"]))
+            return self._job(db, db.execute("SELECT * FROM jobs WHERE id=?", (row["id"],)).fetchone())
+
+    def renew(self, job_id: str, worker: str) -> bool:
+
+        with self._tx() as db:
+            return db.execute("UPDATE jobs SET lease_until=? WHERE id=? AND worker=? AND status='running'",
+                              (time.time() + self.lease_s, job_id, worker)).rowcount == 1
+
+    def finish(self, job_id: str, worker: str, response: Dict | None = None, error: str | None = None) -> bool:
+        # only the current lease holder writes; a worker that lost its lease just drops its result
+
+        with self._tx() as db:
+            return db.execute("UPDATE jobs SET status=?, response=?, error=?, finished=?, lease_until=NULL "
+                              "WHERE id=? AND worker=? AND status='running'",
+                              ("failed" if error else "done", json.dumps(response) if response else None, error,
+                               time.time(), job_id, worker)).rowcount == 1
+
+    def get(self, job_id: str) -> Dict | None:
+
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+            return self._job(db, row) if row is not None else None
+
+    def _job(self, db: sqlite3.Connection, row: sqlite3.Row) -> Dict:
+
+        job = {"id": row["id"], "status": row["status"], "priority": {v: k for k, v in PRIORITIES.items()}[row["priority"]],
+               "backend": row["backend"], "attempts": row["attempts"], "created": row["created"], "started": row["started"],
+               "finished": row["finished"], "error": row["error"], "request": json.loads(row["request"]),
+               "response": json.loads(row["response"]) if row["response"] else None, "position": None}
+        if row["status"] == "queued":
+            job["position"], = db.execute("SELECT COUNT(*) FROM jobs WHERE status='queued' AND (priority<? OR "
+                                          "(priority=? AND created<?))", (row["priority"], row["priority"], row["created"])).fetchone()
+        return job
+
+    def stats(self) -> Dict[str, object]:
+
+        with self._lock:
+            db = self._db()
+            counts = {s: 0 for s in ("queued", "running", "done", "failed")}
+            counts.update(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest, = db.execute("SELECT MIN(created) FROM jobs WHERE status='queued'").fetchone()
+            return {**self.counters, **counts, "max_queued": self.max_queued,
+                    "oldest_queued_s": round(time.time() - oldest, 3) if oldest else 0.0}
+
+QUEUE = JobQueue()
+
+def stats() -> Dict[str, object]:
+    return QUEUE.stats()
+
+def run_job(queue: JobQueue, job: Dict, worker: str) -> None:
+
+    done = threading.Event()
+    def heartbeat():
+        while not done.wait(queue.lease_s / 3):
+            queue.renew(job["id"], worker)
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    try:
+        req = GenerateRequest.model_validate(job["request"])
+        with llm_gateway.lane("batch" if job["priority"] == "low" else "interactive"):
+            resp = agent_router.generate(req, job["backend"])
+        queue.finish(job["id"], worker, response=resp.model_dump(mode="json"))
+    except Exception as e:
+        queue.finish(job["id"], worker, error=f"{type(e).__name__}: {e}")
+    finally:
+        done.set()
+
+def work(queue: JobQueue, worker: str, stop: threading.Event, poll_s: float | None = None) -> None:
+    # claims and runs jobs until stopped; a job already started is finished first
+
+    poll_s = poll_s or float(os.getenv("JOBS_POLL_S", "0.5"))
+    while not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            stop.wait(poll_s)
+        else:
+            run_job(queue, job, worker)
+
+def start_threads(n: int, queue: JobQueue | None = None) -> Tuple[threading.Event, List[threading.Thread]]:
+    # in-process workers (JOBS_EMBEDDED_WORKERS) for a single-box deployment or local development
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=work, args=(queue or QUEUE, f"{socket.gethostname()}:{os.getpid()}:t{i}", stop),
+                                daemon=True, name=f"jobs-worker-{i}") for i in range(n)]
+    for t in threads:
+        t.start()
+    return stop, threads
+
+def embedded_workers() -> int:
+    return int(os.getenv("JOBS_EMBEDDED_WORKERS", "0"))
+
+def _process(index: int) -> None:
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    agent_router.warm_up()
+    work(QUEUE, f"{socket.gethostname()}:{os.getpid()}:p{index}", stop)
+
+def main():
+    ap = argparse.ArgumentParser(description="Run Market Context job workers")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("JOBS_WORKERS", "2")), help="worker processes")
+    ap.add_argument("--stats", action="store_true", help="print queue counts and exit")
+    a = ap.parse_args()
+
+    if a.stats:
+        print(json.dumps(stats(), indent=2))
+        return
+    procs = [multiprocessing.Process(target=_process, args=(i,), name=f"jobs-worker-{i}") for i in range(a.workers)]
+    for p in procs:
+        p.start()
+    # forward SIGTERM so each worker finishes its current job before exiting (Ctrl-C reaches them directly)
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in procs])
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+from functools import lru_cache
+
+TEMPERATURE = 0.2
+SYSTEM_WRITER = "You are a factual financial writing assistant. Avoid outlook and attribution."
+
+def model_name() -> str:
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+def has_credentials() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_API_KEY"))
+
+def endpoint() -> str:
+    return os.getenv("OPENAI_BASE_URL") or os.getenv("AZURE_OPENAI_ENDPOINT") or "https://api.openai.com/v1"
+
+def _gateway_http(async_: bool = False):
+    # every client sends through the llm_gateway transport (rate limits, lanes, retries, hedging), wrapped in an
+    # httpx client with the OpenAI SDK's default timeout and pool limits; LLM_GATEWAY=false opts out (None)
+    from . import llm_gateway
+    if not llm_gateway.enabled():
+        return None
+    import httpx
+    opts = {"timeout": httpx.Timeout(600.0, connect=5.0), "follow_redirects": True,
+            "limits": httpx.Limits(max_connections=1000, max_keepalive_connections=100)}
+    if async_:
+        return httpx.AsyncClient(transport=llm_gateway.AsyncGatewayTransport(), **opts)
+    return httpx.Client(transport=llm_gateway.GatewayTransport(), **opts)
+
+def _sdk_kwargs(async_: bool = False) -> dict:
+    # the gateway owns retries, so the SDK's own are switched off
+    http = _gateway_http(async_)
+    return {"http_client": http, "max_retries": 0} if http is not None else {}
+
+@lru_cache(maxsize=1)
+def get_client():
+    # openai is only imported the first time a client is actually needed
+    if not has_credentials():
+        return None
+    from openai import OpenAI
+    return OpenAI(**_sdk_kwargs())
+
+@lru_cache(maxsize=1)
+def get_async_client():
+    if not has_credentials():
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(**_sdk_kwargs(async_=True))
+
+@lru_cache(maxsize=1)
+def get_chat_model():
+    from langchain_openai import ChatOpenAI
+    kw = _sdk_kwargs()
+    if kw:
+        kw["http_async_client"] = _gateway_http(async_=True)
+    return ChatOpenAI(model=model_name(), temperature=TEMPERATURE, stream_usage=True, **kw)
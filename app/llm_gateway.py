@@ -0,0 +1,362 @@
+import asyncio, contextvars, json, os, random, threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Tuple
+import httpx
+from . import telemetry
+
+# Single gateway for every LLM call. llm.py builds the OpenAI and ChatOpenAI clients (and crewai's litellm
+# session) on httpx clients whose transport is GatewayTransport / AsyncGatewayTransport, so every backend shares:
+#   - token buckets for requests/min and tokens/min, clamped to the provider's x-ratelimit-* headers;
+#   - priority lanes: "interactive" may drain the buckets, "batch" stops at LLM_BATCH_RESERVE of capacity and
+#     yields while interactive calls are waiting;
+#   - retries on 429/5xx/transport errors with full-jitter backoff (Retry-After honoured), SDK retries off;
+#   - optional hedging (LLM_HEDGE=true): a non-streaming completion still running after the lane's p95 gets a
+#     duplicate, and whichever returns first is used.
+# Only /chat/completions calls are scheduled; anything else passes straight through.
+
+RPM = float(os.getenv("LLM_RPM", "500"))
+TPM = float(os.getenv("LLM_TPM", "200000"))
+BATCH_RESERVE = float(os.getenv("LLM_BATCH_RESERVE", "0.2"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_S = float(os.getenv("LLM_BACKOFF_S", "0.5"))
+HEDGE = os.getenv("LLM_HEDGE", "false").lower() == "true"
+HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))     # fixed hedge delay; 0 = the lane's observed p95
+HEDGE_MIN_SAMPLES = 20
+COMPLETION_TOKENS_EST = int(os.getenv("LLM_COMPLETION_TOKENS_EST", "500"))
+
+LANES = ("interactive", "batch")
+RETRYABLE = {408, 409, 429, 500, 502, 503, 504}
+
+_LANE: contextvars.ContextVar[str] = contextvars.ContextVar("llm_lane", default="interactive")
+
+def enabled() -> bool:
+    return os.getenv("LLM_GATEWAY", "true").lower() == "true"
+
+def current_lane() -> str:
+    return _LANE.get()
+
+@contextmanager
+def lane(name: str) -> Iterator[None]:
+
+    if name not in LANES:
+        raise ValueError(f"Unknown LLM lane '{name}'; expected one of {LANES}")
+    token = _LANE.set(name)
+    try:
+        yield
+    finally:
+        _LANE.reset(token)
+
+class Bucket:
+
+    def __init__(self, per_minute: float):
+        self.capacity = self.level = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def sync(self, limit: str | None, remaining: str | None) -> None:
+        # provider headers describe the account-wide budget, which other processes also spend
+        try:
+            if limit:
+                self.capacity = float(limit)
+                self.rate = self.capacity / 60.0
+            if remaining is not None:
+                self.level = min(self.level, float(remaining))
+        except ValueError:
+            pass
+
+class RateLimiter:
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None, batch_reserve: float | None = None):
+        self.requests, self.tokens = Bucket(rpm or RPM), Bucket(tpm or TPM)
+        self.batch_reserve = BATCH_RESERVE if batch_reserve is None else batch_reserve
+        self.waiting = {name: 0 for name in LANES}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, lane_name: str, tokens: int) -> float:
+        # 0.0 when granted, otherwise roughly how long until it could be
+
+        with self._lock:
+            floor = self.batch_reserve if lane_name == "batch" else 0.0
+            if floor and self.waiting["interactive"]:
+                return 0.05
+            now, delay = time.monotonic(), 0.0
+            for bucket, n in ((self.requests, 1), (self.tokens, tokens)):
+                bucket.refill(now)
+                # a request larger than the bucket is let through once it is full; the debt is paid down after
+                need = min(n, bucket.capacity * (1 - floor)) + floor * bucket.capacity - bucket.level
+                if need > 0:
+                    delay = max(delay, need / bucket.rate)
+            if delay:
+                return delay
+            self.requests.level -= 1
+            self.tokens.level -= tokens
+            return 0.0
+
+    @contextmanager
+    def _queued(self, lane_name: str) -> Iterator[None]:
+        with self._lock:
+            self.waiting[lane_name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.waiting[lane_name] -= 1
+
+    def acquire(self, lane_name: str, tokens: int) -> float:
+
+        t0 = time.monotonic()
+        with self._queued(lane_name):
+            while (delay := self.try_acquire(lane_name, tokens)) > 0:
+                time.sleep(min(delay, 1.0))
+        return time.monotonic() - t0
+
+    async def aacquire(self, lane_name: str, tokens: int) -> float:
+
+        t0 = time.monotonic()
+        with self._queued(lane_name):
+            while (delay := self.try_acquire(lane_name, tokens)) > 0:
+                await asyncio.sleep(min(delay, 1.0))
+        return time.monotonic() - t0
+
+    def settle(self, estimated: int, actual: int) -> None:
+        with self._lock:
+            self.tokens.level += estimated - actual
+
+    def observe(self, headers: httpx.Headers) -> None:
+        with self._lock:
+            self.requests.sync(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"))
+            self.tokens.sync(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"))
+
+def _inspect(request: httpx.Request) -> Tuple[bool, bool, int]:
+    # -> (is a chat completion, streams, estimated prompt + completion tokens)
+
+    if not request.url.path.endswith("/chat/completions"):
+        return False, False, 0
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return True, False, COMPLETION_TOKENS_EST
+    prompt = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4   # ~4 chars per token
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or COMPLETION_TOKENS_EST
+    return True, bool(body.get("stream")), prompt + int(completion)
+
+def _usage(response: httpx.Response) -> int | None:
+    try:
+        return int(json.loads(response.content)["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+class Gateway:
+
+    def __init__(self, limiter: RateLimiter | None = None, max_retries: int | None = None, backoff_s: float | None = None,
+                 hedge: bool | None = None, hedge_after_s: float | None = None):
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_s = BACKOFF_S if backoff_s is None else backoff_s
+        self.hedge = HEDGE if hedge is None else hedge
+        self.hedge_after_s = HEDGE_AFTER_S if hedge_after_s is None else hedge_after_s
+        self.latencies: Dict[str, Deque[float]] = {name: deque(maxlen=200) for name in LANES}
+        self.counters = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "wait_s": 0.0}
+        self._pool: ThreadPoolExecutor | None = None
+
+    def _count(self, event: str, lane_name: str) -> None:
+        self.counters[event] += 1
+        telemetry.LLM_EVENTS.inc(event=event, lane=lane_name)
+
+    def _waited(self, seconds: float, lane_name: str) -> None:
+        self.counters["wait_s"] += seconds
+        telemetry.LLM_WAIT_SECONDS.observe(seconds, lane=lane_name)
+
+    def hedge_delay(self, lane_name: str) -> float | None:
+
+        if not self.hedge:
+            return None
+        if self.hedge_after_s:
+            return self.hedge_after_s
+        seen = sorted(self.latencies[lane_name])
+        return seen[int(0.95 * (len(seen) - 1))] if len(seen) >= HEDGE_MIN_SAMPLES else None
+
+    def backoff(self, attempt: int, response: httpx.Response | None) -> float:
+
+        if response is not None:
+            try:
+                if "retry-after-ms" in response.headers:
+                    return min(60.0, float(response.headers["retry-after-ms"]) / 1000)
+                if "retry-after" in response.headers:
+                    return min(60.0, float(response.headers["retry-after"]))
+            except ValueError:
+                pass
+        return random.uniform(0, min(30.0, self.backoff_s * 2 ** attempt))   # full jitter
+
+    def _finish(self, lane_name: str, stream: bool, tokens: int, response: httpx.Response, elapsed: float) -> None:
+
+        self.limiter.observe(response.headers)
+        if stream or response.status_code != 200:
+            return
+        self.latencies[lane_name].append(elapsed)
+        actual = _usage(response)
+        if actual is not None:
+            self.limiter.settle(tokens, actual)
+
+    # -- sync ---------------------------------------------------------------------------------------------------
+
+    def _once(self, inner: httpx.BaseTransport, request: httpx.Request, stream: bool) -> httpx.Response:
+        response = inner.handle_request(request)
+        if not stream:
+            response.read()
+        return response
+
+    def _hedged(self, inner: httpx.BaseTransport, request: httpx.Request, lane_name: str, tokens: int,
+                delay: float) -> httpx.Response:
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "32")), thread_name_prefix="llm-hedge")
+        first = self._pool.submit(self._once, inner, request, False)
+        if wait([first], timeout=delay).done:
+            return first.result()
+        self._count("hedges", lane_name)
+        self._waited(self.limiter.acquire(lane_name, tokens), lane_name)   # the duplicate is a real request
+        second = self._pool.submit(self._once, inner, request, False)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                for f in pending:   # a thread can't be cancelled; drop the loser's response when it lands
+                    f.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                if winner is second:
+                    self._count("hedge_wins", lane_name)
+                return winner.result()
+        return first.result()
+
+    def send(self, inner: httpx.BaseTransport, request: httpx.Request) -> httpx.Response:
+
+        completion, stream, tokens = _inspect(request)
+        if not completion:
+            return inner.handle_request(request)
+        lane_name = current_lane()
+        for attempt in range(self.max_retries + 1):
+            self._waited(self.limiter.acquire(lane_name, tokens), lane_name)
+            self._count("requests", lane_name)
+            delay = None if stream else self.hedge_delay(lane_name)
+            t0 = time.monotonic()
+            try:
+                response = self._hedged(inner, request, lane_name, tokens, delay) if delay else self._once(inner, request, stream)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            if response is not None:
+                self._finish(lane_name, stream, tokens, response, time.monotonic() - t0)
+                if response.status_code not in RETRYABLE or attempt == self.max_retries:
+                    return response
+            self._count("retries", lane_name)
+            pause = self.backoff(attempt, response)
+            if response is not None:
+                response.close()
+            time.sleep(pause)
+
+    # -- async --------------------------------------------------------------------------------------------------
+
+    async def _aonce(self, inner: httpx.AsyncBaseTransport, request: httpx.Request, stream: bool) -> httpx.Response:
+        response = await inner.handle_async_request(request)
+        if not stream:
+            await response.aread()
+        return response
+
+    async def _ahedged(self, inner: httpx.AsyncBaseTransport, request: httpx.Request, lane_name: str, tokens: int,
+                       delay: float) -> httpx.Response:
+
+        first = asyncio.ensure_future(self._aonce(inner, request, False))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self._count("hedges", lane_name)
+        self._waited(await self.limiter.aacquire(lane_name, tokens), lane_name)
+        second = asyncio.ensure_future(self._aonce(inner, request, False))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((t for t in done if t.exception() is None), None)
+            if winner is not None:
+                for t in pending:
+                    t.cancel()
+                if winner is second:
+                    self._count("hedge_wins", lane_name)
+                return winner.result()
+        return first.result()
+
+    async def asend(self, inner: httpx.AsyncBaseTransport, request: httpx.Request) -> httpx.Response:
+
+        completion, stream, tokens = _inspect(request)
+        if not completion:
+            return await inner.handle_async_request(request)
+        lane_name = current_lane()
+        for attempt in range(self.max_retries + 1):
+            self._waited(await self.limiter.aacquire(lane_name, tokens), lane_name)
+            self._count("requests", lane_name)
+            delay = None if stream else self.hedge_delay(lane_name)
+            t0 = time.monotonic()
+            try:
+                if delay:
+                    response = await self._ahedged(inner, request, lane_name, tokens, delay)
+                else:
+                    response = await self._aonce(inner, request, stream)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            if response is not None:
+                self._finish(lane_name, stream, tokens, response, time.monotonic() - t0)
+                if response.status_code not in RETRYABLE or attempt == self.max_retries:
+                    return response
+            self._count("retries", lane_name)
+            pause = self.backoff(attempt, response)
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(pause)
+
+    def stats(self) -> Dict:
+
+        p95 = {}
+        for name, seen in self.latencies.items():
+            s = sorted(seen)
+            p95[name] = round(s[int(0.95 * (len(s) - 1))], 4) if s else None
+        return {**self.counters, "wait_s": round(self.counters["wait_s"], 4), "p95_s": p95,
+                "waiting": dict(self.limiter.waiting), "hedging": self.hedge,
+                "requests_available": round(self.limiter.requests.level, 1), "tokens_available": round(self.limiter.tokens.level)}
+
+GATEWAY = Gateway()
+
+class GatewayTransport(httpx.BaseTransport):
+
+    def __init__(self, gateway: Gateway | None = None, inner: httpx.BaseTransport | None = None):
+        self.gateway = gateway or GATEWAY
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.gateway.send(self.inner, request)
+
+    def close(self) -> None:
+        self.inner.close()
+
+class AsyncGatewayTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, gateway: Gateway | None = None, inner: httpx.AsyncBaseTransport | None = None):
+        self.gateway = gateway or GATEWAY
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.gateway.asend(self.inner, request)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+def stats() -> Dict:
+    return GATEWAY.stats()
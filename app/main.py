@@ -1,9 +1,32 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import RedirectResponse
-from .schemas import GenerateRequest, GenerateResponse
-from .agent_router import generate
+import asyncio, contextlib, json
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Literal
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
+from pydantic import ValidationError
+from .schemas import GenerateRequest, GenerateResponse, BatchGenerateRequest, CompareResponse, JobStatus, ReviseRequest
+from .agent_router import acompare, agenerate, agenerate_batch, canonical_stats, astream_generate, warm_up, enabled_backends, IMPORT_REPORT
+from .tools import kpi_cache, providers
+from . import gen_cache, jobs, llm_gateway, pregen, revise, telemetry
 
-app = FastAPI(title="NB Market Context Writer (Agent Toggle)")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # import + compile the configured backends (WARM_BACKENDS, default AGENT_BACKEND) before taking traffic
+    warm_up()
+    # PREGEN_SCHEDULER=true: pre-generate every strategy as soon as a new period end's KPIs land
+    watcher = asyncio.create_task(pregen.watch()) if pregen.scheduler_enabled() else None
+    # JOBS_EMBEDDED_WORKERS>0: drain the job queue in this process too (otherwise run python -m app.jobs)
+    stop_workers, _ = jobs.start_threads(jobs.embedded_workers())
+    yield
+    stop_workers.set()
+    if watcher is not None:
+        watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await watcher
+
+app = FastAPI(title="NB Market Context Writer (Agent Toggle)", lifespan=lifespan)
 
 # app/main.py
 @app.get("/")
@@ -18,6 +41,141 @@ def swagger_redirect():
 def health():
 	return {"status": "ok"}
 
-@app.post("/generate/market-context", response_model=GenerateResponse)
-def route_generate(req: GenerateRequest, backend: str | None = Query(default=None)):
-    return generate(req, override_backend=backend)
+@app.get("/backends")
+def backends():
+    return {"enabled": enabled_backends(), "loaded": IMPORT_REPORT}
+
+@app.get("/cache/kpis")
+def kpi_cache_stats():
+    return kpi_cache.CACHE.stats()
+
+@app.post("/cache/kpis/invalidate")
+def kpi_cache_invalidate(as_of_period_end: str | None = Query(default=None), benchmark_id: str | None = Query(default=None)):
+    # call after a data revision; every worker drops its in-process copy on its next lookup
+    return {"removed": kpi_cache.CACHE.invalidate(as_of_period_end, benchmark_id)}
+
+@app.get("/providers")
+def provider_stats():
+    return providers.stats()
+
+@app.get("/llm/gateway")
+def llm_gateway_stats():
+    return llm_gateway.stats()
+
+@app.get("/cache/generations")
+def generation_cache_stats():
+    return {**gen_cache.CACHE.stats(), "canonical": canonical_stats()}
+
+@app.get("/pregen/status")
+def pregen_status(as_of_period_end: date | None = Query(default=None), backends: str | None = Query(default=None)):
+    # warm/cold/pending coverage of the pre-generated commentaries (default: latest closed period)
+    names = [b.strip().lower() for b in backends.split(",")] if backends else None
+    return pregen.status(as_of_period_end, names)
+
+@app.post("/pregen/run", status_code=202)
+def pregen_run(tasks: BackgroundTasks, as_of_period_end: date | None = Query(default=None), backends: str | None = Query(default=None)):
+    if not pregen.claim():   # taken here, not when the task starts, so a second POST sees it
+        return {"scheduled": False, "reason": "a pre-generation run is already in progress"}
+    names = [b.strip().lower() for b in backends.split(",")] if backends else None
+    tasks.add_task(pregen.arun, as_of_period_end, names, claimed=True)
+    return {"scheduled": True, "period": str(as_of_period_end or pregen.latest_period())}
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/generate/market-context", response_model=GenerateResponse | CompareResponse)
+async def route_generate(req: GenerateRequest, backend: str | None = Query(default=None), cache: bool = Query(default=True),
+                         trace: bool | None = Query(default=None), backends: str | None = Query(default=None)):
+    # trace=true (or TRACE_IN_RESPONSE=true) adds per-stage timings/tokens/cost to assumptions["timings"]
+    # backends=none,langgraph,...: one shared KPI/prompt preparation, backends run concurrently -> CompareResponse;
+    # with trace each result carries its own backend's timings (the shared part is shared_seconds)
+    if backends:
+        return await acompare(req, [b.strip().lower() for b in backends.split(",") if b.strip()], use_cache=cache, trace=trace)
+    return await agenerate(req, override_backend=backend, use_cache=cache, trace=trace)
+
+@app.post("/generate/market-context/revise", response_model=GenerateResponse)
+async def route_revise(body: ReviseRequest, backend: str | None = Query(default=None)):
+    # re-runs only the sections whose KPIs changed since `previous`; assumptions["revision"] reports what was redone
+    kpis = body.kpis.model_dump() if body.kpis else None
+    return await revise.arevise(body.request, body.previous, kpis, override_backend=backend)
+
+@app.post("/jobs/market-context", response_model=JobStatus, status_code=202)
+def submit_job(req: GenerateRequest, response: Response, backend: str | None = Query(default=None),
+               priority: Literal["high", "normal", "low"] = Query(default="normal"),
+               idempotency_key: str | None = Header(default=None)):
+    # returns at once; poll GET /jobs/{id}. A repeated Idempotency-Key returns the original job with 200
+    try:
+        job, created = jobs.QUEUE.submit(req, backend.lower() if backend else None, priority, idempotency_key)
+    except jobs.QueueFull as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after_s)})
+    except jobs.IdempotencyConflict as e:
+        raise HTTPException(409, str(e))
+    if not created:
+        response.status_code = 200
+    return job
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job(job_id: str):
+    job = jobs.QUEUE.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"unknown job {job_id}")
+    return job
+
+@app.get("/jobs")
+def job_stats():
+    return jobs.stats()
+
+@app.post("/generate/market-context/batch")
+async def route_generate_batch(batch: BatchGenerateRequest, backend: str | None = Query(default=None)):
+    # NDJSON: one BatchItemResult per line in completion order, then a summary line
+    async def lines():
+        ok = failed = 0
+        async for item in agenerate_batch(batch.items, backend or batch.backend, batch.concurrency):
+            ok, failed = ok + item.ok, failed + (not item.ok)
+            yield item.model_dump_json() + "\n"
+        yield json.dumps({"done": True, "total": len(batch.items), "succeeded": ok, "failed": failed}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+def _stream(req: GenerateRequest, backend: str | None, cache: bool) -> StreamingResponse:
+    # SSE: "token" events carry writer output as it is produced; "final" carries the compliance-cleaned response
+    async def events():
+        try:
+            async for kind, payload in astream_generate(req, override_backend=backend, use_cache=cache):
+                if kind == "token":
+                    yield _sse("token", json.dumps({"text": payload}))
+                else:
+                    yield _sse("final", payload.model_dump_json())
+        except Exception as e:
+            yield _sse("error", json.dumps({"error": f"{type(e).__name__}: {e}"}))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/generate/market-context/stream")
+async def route_generate_stream(req: GenerateRequest, backend: str | None = Query(default=None), cache: bool = Query(default=True)):
+    return _stream(req, backend, cache)
+
+@app.get("/generate/market-context/stream")
+async def route_generate_stream_get(as_of_period_end: date, strategy_name: str, benchmark_id: str | None = None,
+                                    asset_class: str | None = None, region: str | None = "US",
+                                    style: str | None = None, portfolio_meta: str | None = None,
+                                    backend: str | None = Query(default=None), cache: bool = Query(default=True)):
+    # EventSource can only issue GETs, so the request fields come in as query parameters; the nested ones
+    # (style, portfolio_meta) as JSON. Invalid fields are a 422, as they are for the POST body
+    fields = {"as_of_period_end": as_of_period_end, "strategy_name": strategy_name, "benchmark_id": benchmark_id,
+              "asset_class": asset_class, "region": region}
+    try:
+        for name, raw in (("style", style), ("portfolio_meta", portfolio_meta)):
+            if raw is not None:
+                fields[name] = json.loads(raw)
+        req = GenerateRequest.model_validate(fields)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("query", name), "msg": f"Invalid JSON: {e}", "input": raw}])
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("query", *err["loc"])} for err in e.errors(include_url=False, include_context=False)])
+    return _stream(req, backend, cache)
@@ -1,15 +1,13 @@
-import os
-from typing import Dict
+import contextvars, os, re
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
 from .schemas import GenerateRequest, GenerateResponse, KPIBundle
 from .strategy_defaults import STRATEGY_DEFAULTS, DEFAULTS_BY_ASSET
 from .prompt_loader import Prompt
-from .tools.data_fetchers import fetch_kpis
-from .tools.kpi_compute import normalize_kpis
+from .tools.kpi_compute import load_kpis
 from .tools import retrieval
-from openai import OpenAI
-
-client = OpenAI() if (os.getenv("OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_API_KEY")) else None
-BANNED = ["we expect", "we believe", "positioned to"]
+from .tools.compliance_rules import BANNED, figures
+from . import dag, llm, prompt_layout, telemetry
 
 def resolve_strategy(req: GenerateRequest) -> Dict[str, str]:
 
@@ -22,6 +20,7 @@ def resolve_strategy(req: GenerateRequest) -> Dict[str, str]:
    
     out["asset_class"] = out["asset_class"] or "equities"
     out["benchmark_id"] = out["benchmark_id"] or DEFAULTS_BY_ASSET.get(out["asset_class"], {}).get("benchmark_id", "SPX_TR")
+    out["region"] = req.region or "US"
     
     return out
 
@@ -31,29 +30,91 @@ def plan_blocks(kpis: Dict) -> Dict:
     
     return {"rendered": rendered}
 
-def write_commentary(req: GenerateRequest, kpis: Dict, plan_text: str) -> str:
+def _exemplars(r: Dict[str, Any]):
+    index = r["seed_index"]
+    return index.top_k(retrieval.build_query(r["kpis"], r["rs"]["asset_class"]), 2) if index is not None else []
+
+# Pre-LLM stages shared by every backend. Template compilation and the seed index don't need KPIs, so they
+# overlap the KPI fetch; style exemplars are best-effort and fall back to none rather than delay the writer.
+PRE_LLM = dag.DAG([
+    dag.Stage("kpis", lambda r: load_kpis(r["req"].as_of_period_end, r["rs"]["benchmark_id"]),
+              timeout_s=float(os.getenv("KPI_STAGE_TIMEOUT", "30"))),
+    dag.Stage("seed_index", lambda r: retrieval.INDEX.refresh(), timeout_s=float(os.getenv("EXEMPLAR_TIMEOUT", "2")),
+              fallback=lambda r: None),
+    dag.Stage("templates", lambda r: [Prompt(n) for n in ("planner", "writer", *prompt_layout.PROMPTS)]),   # compile/stat off the critical path
+    dag.Stage("exemplars", _exemplars, deps=("kpis", "seed_index"), inline=True, fallback=lambda r: []),
+    # the prefix layout carries the outline rules in its static system prompt, so the planner is legacy-only
+    dag.Stage("planner_render", lambda r: "" if prompt_layout.prefix_mode() else plan_blocks(r["kpis"])["rendered"],
+              deps=("kpis", "templates"), inline=True),
+    dag.Stage("writer_render", lambda r: prompt_layout.writer(r["req"], r["rs"], r["kpis"], r["exemplars"], r["planner_render"]),
+              deps=("kpis", "templates", "exemplars", "planner_render"), inline=True),
+])
+
+_SHARED: contextvars.ContextVar[Dict[str, Any] | None] = contextvars.ContextVar("mc_shared_stages", default=None)
+
+@contextmanager
+def shared(pre: Dict[str, Any]) -> Iterator[None]:
+    # backends run inside this block reuse a finished prepare() for the same request: PRE_LLM skips every
+    # stage already present in its inputs (multi-backend comparisons render the prompts once)
+
+    token = _SHARED.set(pre)
+    try:
+        yield
+    finally:
+        _SHARED.reset(token)
+
+def _pre_inputs(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None) -> Dict[str, Any]:
+    return {**(_SHARED.get() or {}), "req": req, "rs": rs, **({"kpis": kpis} if kpis is not None else {})}
 
-    exemplars = retrieval.get_style_exemplars(k=2)
-    variables = {**kpis, "as_of": str(req.as_of_period_end), "benchmark_id": resolve_strategy(req)["benchmark_id"],
-                 "banned_phrases": ", ".join(BANNED), "word_target_min": 200, "word_target_max": 300,
-                 "style_exemplars": "\n---\n".join(exemplars), "plan_text": plan_text}
-    prompt_text = Prompt("writer").render(variables)
+def prepare(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None = None) -> Dict[str, Any]:
+    # -> {"kpis", "exemplars", "planner_render", "writer_render" (prompt_layout.Assembled), ...}
+    return PRE_LLM.run(_pre_inputs(req, rs, kpis))
 
+async def aprepare(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None = None) -> Dict[str, Any]:
+    return await PRE_LLM.arun(_pre_inputs(req, rs, kpis))
+
+def _writer_messages(prompt: prompt_layout.Assembled) -> list:
+    return [{"role":"system","content":prompt.system}, {"role":"user","content": prompt.user}]
+
+def _template_text(kpis: Dict, as_of) -> str:
+
+    return (f"In {as_of}, {kpis['benchmark_name']} returned {kpis['benchmark_return_pct']}%. "
+            f"VIX ended {kpis['vix_end']} and the 10-year Treasury yield finished near {kpis['ten_year_yield']}%. "
+            f"Inflation ({kpis['inflation_series']}) was {kpis['inflation_yoy_pct']}% YoY. "
+            f"Leaders: {', '.join(kpis['sector_leaders'])}; laggards: {', '.join(kpis['sector_laggards'])}. "
+            f"EPS growth {kpis['eps_growth_pct']}% with beat rate {kpis['eps_beat_rate_pct']}%.")
+
+def write_commentary(req: GenerateRequest, kpis: Dict, writer_prompt: prompt_layout.Assembled) -> str:
+
+    client = llm.get_client()
     if client is None:
-        return (f"In {variables['as_of']}, {kpis['benchmark_name']} returned {kpis['benchmark_return_pct']}%. "
-                f"VIX ended {kpis['vix_end']} and the 10-year Treasury yield finished near {kpis['ten_year_yield']}%. "
-                f"Inflation ({kpis['inflation_series']}) was {kpis['inflation_yoy_pct']}% YoY. "
-                f"Leaders: {', '.join(kpis['sector_leaders'])}; laggards: {', '.join(kpis['sector_laggards'])}. "
-                f"EPS growth {kpis['eps_growth_pct']}% with beat rate {kpis['eps_beat_rate_pct']}%.")
+        return _template_text(kpis, req.as_of_period_end)
     
-    resp = client.chat.completions.create(model=os.getenv("OPENAI_MODEL","gpt-4o-mini"), temperature=0.2,
-        messages=[{"role":"system","content":"You are a factual financial writing assistant. Avoid outlook and attribution."},
-                  {"role":"user","content": prompt_text}])
+    messages = _writer_messages(writer_prompt)
+    with telemetry.stage("writer_llm"):
+        resp = telemetry.observe_llm("writer_llm", client.chat.completions.create(model=llm.model_name(), temperature=llm.TEMPERATURE, messages=messages))
     
     return resp.choices[0].message.content.strip()
 
+async def awrite_commentary(req: GenerateRequest, kpis: Dict, writer_prompt: prompt_layout.Assembled) -> str:
+
+    client = llm.get_async_client()
+    if client is None:
+        return _template_text(kpis, req.as_of_period_end)
+
+    messages = _writer_messages(writer_prompt)
+    with telemetry.stage("writer_llm"):
+        resp = telemetry.observe_llm("writer_llm", await client.chat.completions.create(model=llm.model_name(), temperature=llm.TEMPERATURE, messages=messages))
+
+    return resp.choices[0].message.content.strip()
+
 def compliance_clean(text: str, kpis: Dict) -> str:
 
+    with telemetry.stage("compliance_code"):
+        return _compliance_clean(text, kpis)
+
+def _compliance_clean(text: str, kpis: Dict) -> str:
+
     t = text
 
     for phrase in BANNED:
@@ -64,13 +125,116 @@ def compliance_clean(text: str, kpis: Dict) -> str:
     
     return t.strip()
 
-def generate(req: GenerateRequest) -> GenerateResponse:
+# Canonical drafts are written once per (period, benchmark, asset class, region) and shared by every strategy and
+# vehicle on that benchmark; specialize() then fits one to the strategy. It only renames the benchmark and deletes
+# whole sentences, so no figure is introduced and the canonical draft's compliance pass still holds.
+WORD_TOLERANCE = float(os.getenv("WORD_COUNT_TOLERANCE", "0.15"))
 
-    rs = resolve_strategy(req)
-    kpis = normalize_kpis(fetch_kpis(req.as_of_period_end, rs["benchmark_id"]))
-    plan = plan_blocks(kpis)
-    draft = write_commentary(req, kpis, plan["rendered"])
-    final = compliance_clean(draft, kpis)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[A-Z(])")
+
+def benchmark_label(req: GenerateRequest) -> str | None:
+    return req.style.get("benchmark_label") or STRATEGY_DEFAULTS.get(req.strategy_name, {}).get("benchmark_label")
+
+def _trim(text: str, max_words: int, keep: str) -> str:
+    # drops sentences from the end (lowest-priority section first): fact-free ones, then any but the one holding `keep`
+
+    paras = [_SENTENCE.split(p) for p in re.split(r"\n\s*\n", text.strip())]
+    words = sum(len(x.split()) for p in paras for x in p)
+    for droppable in (lambda x: not any(True for _ in figures(x)), lambda x: keep not in x):
+        for p in reversed(paras):
+            for i in range(len(p) - 1, -1, -1):
+                if words <= max_words:
+                    break
+                if droppable(p[i]):
+                    words -= len(p.pop(i).split())
+    return "\n\n".join(" ".join(p) for p in paras if p)
+
+def specialize(text: str, req: GenerateRequest, kpis: Dict) -> Tuple[str, List[str]]:
+    # -> (strategy text, steps applied)
+
+    applied = []
+    label = benchmark_label(req)
+    if label and label != kpis["benchmark_name"] and kpis["benchmark_name"] in text:
+        text = text.replace(kpis["benchmark_name"], label)
+        applied.append("benchmark_label")
+    # every request carries a target (the schema default is 240), so a draft within target + tolerance is returned
+    # as written, whitespace included; only one that runs over loses sentences
+    target = req.style.get("word_count_target")
+    words = len(text.split())
+    if target and words > int(int(target) * (1 + WORD_TOLERANCE)):
+        trimmed = _trim(text, int(int(target) * (1 + WORD_TOLERANCE)), f"{kpis['benchmark_return_pct']}%")
+        if len(trimmed.split()) < words:
+            text = trimmed
+            applied.append("word_count")
+    return text, applied
+
+def warm_up() -> None:
+
+    for name in ("planner", "writer", "compliance", *prompt_layout.PROMPTS):
+        Prompt(name)
+    retrieval.INDEX.refresh()
+    llm.get_client()
+    llm.get_async_client()
+
+NOTES = "Baseline (MOCK KPIs if no keys)."
+
+def _response(rs: Dict[str, str], kpis: Dict, final: str) -> GenerateResponse:
 
     return GenerateResponse(text=final, kpis=KPIBundle(**kpis),
-        assumptions={"benchmark_id": rs["benchmark_id"], "asset_class": rs["asset_class"], "notes":"Baseline (MOCK KPIs if no keys)."})
+        assumptions={"benchmark_id": rs["benchmark_id"], "asset_class": rs["asset_class"], "notes": NOTES})
+
+def run_graph(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None = None) -> Dict:
+
+    pre = prepare(req, rs, kpis)
+    kpis = pre["kpis"]
+    draft = write_commentary(req, kpis, pre["writer_render"])
+
+    return {"draft": draft, "final_text": compliance_clean(draft, kpis), "kpis": kpis}
+
+async def arun_graph(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None = None) -> Dict:
+
+    pre = await aprepare(req, rs, kpis)
+    kpis = pre["kpis"]
+    draft = await awrite_commentary(req, kpis, pre["writer_render"])
+
+    return {"draft": draft, "final_text": compliance_clean(draft, kpis), "kpis": kpis}
+
+def generate(req: GenerateRequest, kpis: Dict | None = None) -> GenerateResponse:
+
+    rs = resolve_strategy(req)
+    result = run_graph(req, rs, kpis)
+
+    return _response(rs, result["kpis"], specialize(result["final_text"], req, result["kpis"])[0])
+
+async def agenerate(req: GenerateRequest, kpis: Dict | None = None) -> GenerateResponse:
+
+    rs = resolve_strategy(req)
+    result = await arun_graph(req, rs, kpis)
+
+    return _response(rs, result["kpis"], specialize(result["final_text"], req, result["kpis"])[0])
+
+async def astream_graph(req: GenerateRequest, rs: Dict[str, str], kpis: Dict | None = None) -> AsyncIterator[Tuple[str, object]]:
+
+    pre = await aprepare(req, rs, kpis)
+    kpis = pre["kpis"]
+
+    client = llm.get_async_client()
+    parts = []
+    if client is None:
+        for word in _template_text(kpis, req.as_of_period_end).split(" "):
+            parts.append(word + " ")
+            yield "token", word + " "
+    else:
+        with telemetry.stage("writer_llm"):
+            stream = await client.chat.completions.create(model=llm.model_name(), temperature=llm.TEMPERATURE,
+                                                          messages=_writer_messages(pre["writer_render"]), stream=True, stream_options={"include_usage": True})
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    telemetry.observe_llm("writer_llm", chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield "token", delta
+
+    draft = "".join(parts).strip()
+    yield "result", {"draft": draft, "final_text": compliance_clean(draft, kpis), "kpis": kpis}
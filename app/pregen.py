@@ -0,0 +1,129 @@
+import argparse, asyncio, json, os, threading, time
+from datetime import date
+from typing import Dict, List
+import pandas as pd
+from .schemas import GenerateRequest
+from .strategy_defaults import STRATEGY_DEFAULTS
+from .tools.kpi_compute import load_kpis
+from . import agent_router, gen_cache, pipeline
+
+# Period-end pre-generation. Once the KPIs for the latest completed period end load, every strategy in
+# STRATEGY_DEFAULTS is generated for every PREGEN_BACKENDS backend through the batch path (shared KPI fetches,
+# PREGEN_CONCURRENCY, batch LLM lane) and stored in the generation cache, so POST /generate/market-context for
+# that period is a lookup. Coverage is read straight off the cache keys, so nothing else needs to be persisted.
+# Runs as a CLI (python -m app.pregen), as POST /pregen/run, or as a watcher loop started with PREGEN_SCHEDULER=true.
+
+INTERVAL_S = float(os.getenv("PREGEN_INTERVAL_S", "900"))
+
+STATE: Dict = {"running": False, "last_run": None}
+_CLAIM = threading.Lock()
+
+def claim() -> bool:
+    # marks a run as active; False if one already is. POST /pregen/run claims before scheduling its background
+    # task, so two quick requests can't both start a run
+
+    with _CLAIM:
+        if STATE["running"]:
+            return False
+        STATE["running"] = True
+        return True
+
+def scheduler_enabled() -> bool:
+    return os.getenv("PREGEN_SCHEDULER", "false").lower() == "true"
+
+def backends() -> List[str]:
+    raw = os.getenv("PREGEN_BACKENDS", os.getenv("AGENT_BACKEND", "none"))
+    return [b.strip().lower() for b in raw.split(",") if b.strip()]
+
+def concurrency() -> int:
+    return agent_router.batch_concurrency(int(os.getenv("PREGEN_CONCURRENCY", "0")) or None)
+
+def latest_period(today: date | None = None, window: str | None = None) -> date:
+    # most recent month (KPI_WINDOW=Q: quarter) end strictly before today, i.e. the last period that has closed
+
+    window = (window or os.getenv("KPI_WINDOW", "M")).upper()
+    offset = pd.offsets.QuarterEnd() if window == "Q" else pd.offsets.MonthEnd()
+    return (pd.Timestamp(today or date.today()) - offset).date()
+
+def requests_for(period: date) -> List[GenerateRequest]:
+    return [GenerateRequest(as_of_period_end=period, strategy_name=name) for name in STRATEGY_DEFAULTS]
+
+def _kpis(req: GenerateRequest) -> Dict | None:
+    try:
+        return load_kpis(req.as_of_period_end, pipeline.resolve_strategy(req)["benchmark_id"])
+    except Exception:   # not landed yet (missing history rows, provider has no data for the period)
+        return None
+
+def status(period: date | None = None, names: List[str] | None = None) -> Dict:
+    # per (strategy, backend): warm (cached), cold (KPIs loaded, not generated) or pending (KPIs not landed)
+
+    period = period or latest_period()
+    names = names or backends()
+    coverage: Dict[str, Dict[str, str]] = {}
+    for req in requests_for(period):
+        kpis, rs = _kpis(req), pipeline.resolve_strategy(req)
+        row = coverage[req.strategy_name] = {}
+        for b in names:
+            if kpis is None:
+                row[b] = "pending"
+                continue
+            key = gen_cache.cache_key(agent_router.resolve_backend(b), req.as_of_period_end, rs, kpis)
+            row[b] = "warm" if gen_cache.CACHE.has(key) else "cold"
+
+    counts = {k: sum(v == k for row in coverage.values() for v in row.values()) for k in ("warm", "cold", "pending")}
+    total = sum(counts.values())
+    return {"period": str(period), "kpis_ready": not counts["pending"], "backends": names, **counts,
+            "coverage_pct": round(100.0 * counts["warm"] / total, 1) if total else 100.0, "strategies": coverage,
+            "running": STATE["running"], "last_run": STATE["last_run"]}
+
+async def arun(period: date | None = None, names: List[str] | None = None, claimed: bool = False) -> Dict:
+    # generates only the cold pairs; pending ones are picked up by a later run, failures are reported, not raised.
+    # claimed=True: the caller already holds the run (claim()); otherwise a run already in progress wins
+
+    period = period or latest_period()
+    names = names or backends()
+    if not claimed and not claim():
+        return {"period": str(period), "reason": "a pre-generation run is already in progress"}
+    t0 = time.time()
+    report = {"period": str(period), "generated": 0, "failed": []}
+    try:
+        before = await asyncio.to_thread(status, period, names)
+        report.update(skipped=before["warm"], pending=before["pending"])
+        for b in names:
+            cold = [r for r in requests_for(period) if before["strategies"][r.strategy_name][b] == "cold"]
+            async for item in agent_router.agenerate_batch(cold, b, concurrency()):
+                if item.ok:
+                    report["generated"] += 1
+                else:
+                    report["failed"].append({"strategy": item.strategy_name, "backend": b, "error": item.error})
+    finally:
+        STATE["running"] = False
+        report["seconds"] = round(time.time() - t0, 3)
+        STATE["last_run"] = report
+    return report
+
+async def watch(interval_s: float | None = None) -> None:
+    # re-checks every interval; a new period end is pending until its KPIs land, then cold, which triggers a run
+
+    while True:
+        try:
+            st = await asyncio.to_thread(status)
+            if st["cold"] and claim():
+                await arun(date.fromisoformat(st["period"]), st["backends"], claimed=True)
+        except Exception as e:   # keep the loop alive across provider outages
+            STATE["last_run"] = {"error": f"{type(e).__name__}: {e}", "at": time.time()}
+        await asyncio.sleep(interval_s or INTERVAL_S)
+
+def main():
+    ap = argparse.ArgumentParser(description="Pre-generate Market Context for every configured strategy")
+    ap.add_argument("--period", type=date.fromisoformat, default=None, help="period end (default: latest closed period)")
+    ap.add_argument("--backends", default=None, help="comma-separated (default: PREGEN_BACKENDS or AGENT_BACKEND)")
+    ap.add_argument("--status", action="store_true", help="print warm/cold coverage and exit")
+    a = ap.parse_args()
+
+    names = [b.strip().lower() for b in a.backends.split(",")] if a.backends else None
+    out = status(a.period, names) if a.status else asyncio.run(arun(a.period, names))
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json, math, os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List
+from .prompt_loader import Prompt
+from .tools.compliance_rules import BANNED, WORD_MIN, WORD_MAX
+from . import llm
+
+# Prompt assembly for the writer and compliance calls.
+#   prefix (default): static charter + rules form the system message, byte-identical across requests, so the
+#                     provider's prompt-prefix cache can hit; exemplars, then compact KPI JSON come last.
+#   legacy:           the original writer/compliance templates (facts first, KPI dict repr, inlined planner prompt).
+# Token counts use tiktoken when its encodings are available (chars/4 otherwise); exemplars are dropped until the writer fits.
+
+WRITER_BUDGET = int(os.getenv("WRITER_TOKEN_BUDGET", "1500"))
+COMPLIANCE_BUDGET = int(os.getenv("COMPLIANCE_TOKEN_BUDGET", "2500"))
+PROMPTS = ("writer_static", "writer_request", "compliance_static", "compliance_request")
+
+class PromptBudgetExceeded(ValueError):
+    pass
+
+def layout() -> str:
+    return os.getenv("PROMPT_LAYOUT", "prefix").lower()
+
+def prefix_mode() -> bool:
+    return layout() == "prefix"
+
+@dataclass(frozen=True)
+class Assembled:
+
+    system: str
+    user: str
+    tokens: int
+    exemplars_used: int = 0
+    prefix: bool = True
+
+    def combined(self) -> str:
+        # single-string consumers (crewai task descriptions); legacy prompts carried everything in the user part
+        return "\n\n".join(p for p in (self.system, self.user) if p) if self.prefix else self.user
+
+@lru_cache(maxsize=4)
+def _encoder(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:   # encodings are downloaded on first use; offline hosts fall back to the estimate
+        return None
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    enc = _encoder(model or llm.model_name())
+    return len(enc.encode(text)) if enc is not None else math.ceil(len(text) / 4)
+
+def compact_json(d: Dict) -> str:
+    # nulls dropped: an absent field already means "omit", and the model never sees "None"
+    return json.dumps({k: v for k, v in d.items() if v is not None}, separators=(",", ":"), ensure_ascii=False)
+
+def _static_vars() -> Dict:
+    return {"banned_phrases": ", ".join(BANNED), "word_target_min": WORD_MIN, "word_target_max": WORD_MAX}
+
+@lru_cache(maxsize=8)
+def _static(name: str, content_hash: str) -> str:
+    # keyed by content hash so an edited prompt file still takes effect
+    return Prompt(name).render(_static_vars())
+
+def static_text(name: str) -> str:
+    return _static(name, Prompt(name).content_hash)
+
+def writer_variables(req, rs: Dict[str, str], kpis: Dict, exemplars: List[str], plan_text: str) -> Dict:
+
+    return {**kpis, "as_of": str(req.as_of_period_end), "benchmark_id": rs["benchmark_id"], **_static_vars(),
+            "style_exemplars": "\n---\n".join(exemplars), "plan_text": plan_text}
+
+def writer(req, rs: Dict[str, str], kpis: Dict, exemplars: List[str], plan_text: str = "",
+           system: str = llm.SYSTEM_WRITER, budget: int | None = None) -> Assembled:
+
+    budget = budget or WRITER_BUDGET
+    prefix = prefix_mode()
+    if prefix:
+        system = f"{system}\n\n{static_text('writer_static')}"
+    fixed = count_tokens(system)
+
+    for n in range(len(exemplars), -1, -1):
+        if prefix:
+            user = Prompt("writer_request").render({"as_of": str(req.as_of_period_end), "benchmark_id": rs["benchmark_id"],
+                                                    "style_exemplars": "\n---\n".join(exemplars[:n]), "facts_json": compact_json(kpis)})
+        else:
+            user = Prompt("writer").render(writer_variables(req, rs, kpis, exemplars[:n], plan_text))
+        tokens = fixed + count_tokens(user)
+        if tokens <= budget:
+            return Assembled(system, user, tokens, n, prefix)
+    raise PromptBudgetExceeded(f"Writer prompt is {tokens} tokens without exemplars (budget {budget})")
+
+def compliance(draft: str, kpis: Dict, system: str = "", budget: int | None = None) -> Assembled:
+
+    budget = budget or COMPLIANCE_BUDGET
+    if prefix_mode():
+        system = "\n\n".join(p for p in (system, static_text("compliance_static")) if p)
+        user = Prompt("compliance_request").render({"kpis_json": compact_json(kpis), "draft_text": draft})
+    else:
+        user = Prompt("compliance").render({"draft_text": draft, "kpis_json": kpis, **_static_vars()})
+    tokens = count_tokens(system) + count_tokens(user)
+    if tokens > budget:   # nothing here can be trimmed without changing what is checked
+        raise PromptBudgetExceeded(f"Compliance prompt is {tokens} tokens (budget {budget})")
+    return Assembled(system, user, tokens, 0, prefix_mode())
@@ -1,19 +1,110 @@
-import json, pathlib
-from jinja2 import Template
-from typing import Dict, Any
+import hashlib, json, os, pathlib, tempfile, threading
+from dataclasses import dataclass, replace
+from jinja2 import Environment, FunctionLoader, FileSystemBytecodeCache, Template
+from typing import Dict, Any, FrozenSet, Tuple
 
 PROMPTS_DIR = pathlib.Path(__file__).resolve().parent.parent / "prompts"
+BYTECODE_DIR = pathlib.Path(os.getenv("PROMPT_BYTECODE_DIR", pathlib.Path(tempfile.gettempdir()) / "nb_mc_jinja"))
+
+def _bytecode_cache() -> FileSystemBytecodeCache | None:
+
+    try:
+        BYTECODE_DIR.mkdir(parents=True, exist_ok=True)
+        return FileSystemBytecodeCache(str(BYTECODE_DIR))
+    except OSError:
+        return None
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+
+    name: str
+    text: str
+    meta: Dict[str, Any]
+    template: Template
+    required_vars: FrozenSet[str]
+    content_hash: str
+    stamp: Tuple[int, int, int, int]
+
+class PromptRegistry:
+    # Process-wide cache of compiled prompt templates. A reload costs two stat() calls;
+    # templates are recompiled only when the mtime/size changed AND the content hash differs.
+
+    def __init__(self, prompts_dir: pathlib.Path = PROMPTS_DIR):
+
+        self.prompts_dir = pathlib.Path(prompts_dir)
+        self._sources: Dict[str, str] = {}
+        self._entries: Dict[str, CompiledPrompt] = {}
+        self._lock = threading.Lock()
+        # cache_size=0: the registry owns caching; the bytecode cache only skips parsing across processes.
+        self.env = Environment(loader=FunctionLoader(self._sources.get), bytecode_cache=_bytecode_cache(),
+                               cache_size=0, auto_reload=False)
+
+    def _paths(self, name: str) -> Tuple[pathlib.Path, pathlib.Path]:
+        return self.prompts_dir / f"{name}.txt", self.prompts_dir / f"{name}.json"
+
+    def _stamp(self, name: str) -> Tuple[int, int, int, int]:
+
+        txt, meta = (p.stat() for p in self._paths(name))
+        return (txt.st_mtime_ns, txt.st_size, meta.st_mtime_ns, meta.st_size)
+
+    def _compile(self, name: str, stamp: Tuple[int, int, int, int]) -> CompiledPrompt:
+
+        txt_path, meta_path = self._paths(name)
+        text = txt_path.read_text(encoding="utf-8")
+        meta_raw = meta_path.read_text(encoding="utf-8")
+        digest = hashlib.sha256(f"{text}\0{meta_raw}".encode("utf-8")).hexdigest()
+
+        current = self._entries.get(name)
+        if current and current.content_hash == digest:
+            # touched but unchanged: keep the compiled template, just remember the new stamp
+            return replace(current, stamp=stamp)
+
+        meta = json.loads(meta_raw)
+        self._sources[f"{name}.txt"] = text
+        template = self.env.get_template(f"{name}.txt")
+
+        return CompiledPrompt(name=name, text=text, meta=meta, template=template,
+                              required_vars=frozenset(meta.get("required_vars", [])), content_hash=digest, stamp=stamp)
+
+    def get(self, name: str) -> CompiledPrompt:
+
+        stamp = self._stamp(name)
+        entry = self._entries.get(name)
+        if entry is not None and entry.stamp == stamp:
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.stamp != stamp:
+                entry = self._entries[name] = self._compile(name, stamp)
+        return entry
+
+    def content_hash(self, name: str) -> str:
+        return self.get(name).content_hash
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._entries.clear()
+            self._sources.clear()
+
+REGISTRY = PromptRegistry()
 
 class Prompt:
 
     def __init__(self, name: str):
-        
+
         self.name = name
-        self.text = (PROMPTS_DIR / f"{name}.txt").read_text(encoding="utf-8")
-        self.meta = json.loads((PROMPTS_DIR / f"{name}.json").read_text(encoding="utf-8"))
+        self._compiled = REGISTRY.get(name)
+        self.text = self._compiled.text
+        self.meta = self._compiled.meta
+
+    @property
+    def content_hash(self) -> str:
+        return self._compiled.content_hash
 
     def render(self, variables: Dict[str, Any]) -> str:
 
-        missing = [k for k in self.meta.get("required_vars", []) if k not in variables]
-        if missing: raise ValueError(f"Missing variables for prompt '{self.name}': {missing}")
-        return Template(self.text).render(**variables)
+        missing = self._compiled.required_vars.difference(variables)
+        if missing: raise ValueError(f"Missing variables for prompt '{self.name}': {sorted(missing)}")
+        return self._compiled.template.render(**variables)
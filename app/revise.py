@@ -0,0 +1,214 @@
+import asyncio, json, re
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+from .prompt_loader import Prompt
+from .schemas import GenerateRequest, GenerateResponse, KPIBundle
+from .tools.compliance_rules import BANNED, figures, verify
+from .tools.kpi_compute import load_kpis
+from . import agent_router, llm, pipeline, prompt_layout, telemetry
+
+# Incremental regeneration after a KPI revision. The new KPIs are diffed against the ones stored with a previous
+# response and each changed field is mapped to its section of the writer's fixed order (benchmark, macro, sectors,
+# earnings) and to the paragraphs that carry its old value (sentences, when the text is one paragraph).
+#   patch:    same sign, same number of sectors, renamed series -> the figures/names are swapped in place
+#   drop:     the field is gone from the new KPIs -> the sentences that used it are removed
+#   reprompt: anything else (sign flip, ambiguous figure, newly available field) -> that paragraph alone is rewritten
+# Only the units that changed are re-verified; sentences still failing the code checks are dropped.
+
+SECTIONS = {
+    "benchmark": ("benchmark_name", "benchmark_return_pct"),
+    "macro": ("vix_end", "vix_change", "ten_year_yield", "ten_year_change_bps", "inflation_series", "inflation_yoy_pct"),
+    "sectors": ("sector_leaders", "sector_laggards"),
+    "earnings": ("eps_growth_pct", "eps_beat_rate_pct"),
+}
+FIELD_SECTION = {f: s for s, fields in SECTIONS.items() for f in fields}
+NUMERIC = ("benchmark_return_pct", "vix_end", "vix_change", "ten_year_yield", "ten_year_change_bps",
+           "inflation_yoy_pct", "eps_growth_pct", "eps_beat_rate_pct")
+
+_PARAGRAPH = re.compile(r"(\n\s*\n)")
+_SENTENCE = re.compile(r"(?<=[.!?])(\s+)(?=[A-Z(])")
+
+def _same(a, b) -> bool:
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(float(a) - float(b)) < 1e-9
+    return a == b
+
+def changed_fields(old: Dict, new: Dict) -> List[str]:
+    return [f for f in FIELD_SECTION if not _same(old.get(f), new.get(f))]
+
+def _scales(f: str):
+    return (1.0, 0.01) if f == "ten_year_change_bps" else (1.0,)   # 5 bp is also written 0.05%
+
+def carries(unit: str, f: str, kpis: Dict) -> bool:
+
+    v = kpis.get(f)
+    if v is None:
+        return False
+    if isinstance(v, list):
+        return any(name in unit for name in v)
+    if isinstance(v, str):
+        return v in unit
+    return any(abs(value - abs(float(v)) * s) < 1e-9 for _, value, _ in figures(unit) for s in _scales(f))
+
+def _join(parts: List[str]) -> str:
+    # parts alternate content / separator (re.split with a capture group); empty content drops its separator
+    out: List[str] = []
+    for i in range(0, len(parts), 2):
+        if parts[i].strip():
+            if out:
+                out.append(parts[i - 1])
+            out.append(parts[i])
+    return "".join(out)
+
+def _drop_sentences(unit: str, keep) -> str:
+    parts = _SENTENCE.split(unit)
+    return _join([p if i % 2 or keep(p) else "" for i, p in enumerate(parts)])
+
+def _format_like(m: re.Match, value: float) -> str:
+    # keep the figure's precision unless the revised value needs more
+    shown = len(m.group("dec")) - 1 if m.group("dec") else 0
+    digits = f"{value:.6f}".rstrip("0").rstrip(".")
+    needed = len(digits.split(".")[1]) if "." in digits else 0
+    return f"{value:.{max(shown, needed)}f}"
+
+def patch(unit: str, fields: List[str], old: Dict, new: Dict) -> str | None:
+    # deterministic rewrite of `fields` in one unit; None when the wording might no longer hold
+
+    sign = lambda x: (float(x) > 0) - (float(x) < 0)
+    if any(f in NUMERIC and sign(old[f]) != sign(new[f]) for f in fields):
+        return None   # a sign flip turns "rose" into "fell"
+
+    spans = []
+    for m, value, _ in figures(unit):
+        hits = [(f, s) for f in NUMERIC if old.get(f) is not None for s in _scales(f) if abs(value - abs(float(old[f])) * s) < 1e-9]
+        mine = [(f, s) for f, s in hits if f in fields]
+        if not mine:
+            continue
+        if len(hits) > 1:
+            return None   # the same figure stands for more than one field
+        f, s = mine[0]
+        spans.append((m.start("num"), m.end("dec") if m.group("dec") else m.end("num"), _format_like(m, abs(float(new[f])) * s)))
+    for start, end, text in reversed(spans):
+        unit = unit[:start] + text + unit[end:]
+
+    renames: Dict[str, str] = {}
+    for f in fields:
+        if f in ("benchmark_name", "inflation_series"):
+            renames[old[f]] = new[f]
+        elif f in ("sector_leaders", "sector_laggards"):
+            if len(old[f]) != len(new[f]):
+                return None
+            renames.update(zip(old[f], new[f]))
+    if renames:   # one pass, so swapped names (A<->B) don't cascade
+        pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(k) for k in sorted(renames, key=len, reverse=True)) + r")(?!\w)")
+        unit = pattern.sub(lambda m: renames[m.group(1)], unit)
+    return unit
+
+@dataclass
+class Revision:
+
+    parts: List[str]
+    changed: List[str]
+    patched: Set[int] = field(default_factory=set)
+    reprompt: Dict[int, List[str]] = field(default_factory=dict)   # unit index -> fields to work in
+
+    @property
+    def sections(self) -> List[str]:
+        return [s for s in SECTIONS if any(FIELD_SECTION[f] == s for f in self.changed)]
+
+    @property
+    def mode(self) -> str:
+        return "reprompt" if self.reprompt else "patch" if self.changed else "unchanged"
+
+    def text(self) -> str:
+        return _join(self.parts)
+
+    def summary(self) -> Dict:
+        units = len(self.parts[::2])
+        return {"mode": self.mode, "changed_fields": self.changed, "sections": self.sections, "units": units,
+                "patched": len(self.patched), "reprompted": len(self.reprompt)}
+
+def plan(text: str, old: Dict, new: Dict) -> Revision:
+
+    parts = _PARAGRAPH.split(text.strip())
+    if len(parts) == 1:
+        parts = _SENTENCE.split(parts[0])
+    rev = Revision(parts, changed_fields(old, new))
+    units = range(0, len(parts), 2)
+
+    carried = {i: [f for f in rev.changed if carries(parts[i], f, old)] for i in units}
+    for f in rev.changed:
+        if new.get(f) is None or any(f in c for c in carried.values()):
+            continue
+        # newly available (or never mentioned): the unit holding its section, else the last one before it
+        order = list(SECTIONS)
+        before = order[:order.index(FIELD_SECTION[f]) + 1]
+        holders = [i for i in units if any(carries(parts[i], g, old) for g in FIELD_SECTION if FIELD_SECTION[g] in before)]
+        rev.reprompt.setdefault(holders[-1] if holders else 0, []).append(f)
+
+    for i, fields in carried.items():
+        if i in rev.reprompt:
+            rev.reprompt[i] += fields
+            continue
+        if not fields:
+            continue
+        gone = [f for f in fields if new.get(f) is None]
+        unit = _drop_sentences(parts[i], lambda s: not any(carries(s, f, old) for f in gone)) if gone else parts[i]
+        patched = patch(unit, [f for f in fields if f not in gone], old, new)
+        if patched is None:
+            rev.reprompt[i] = fields
+        else:
+            parts[i] = patched
+            rev.patched.add(i)
+    return rev
+
+def scrub(unit: str, kpis: Dict, as_of) -> str:
+    # code-side compliance on a changed unit: drop sentences with unsupported figures or out-of-scope phrases
+    bad = lambda s: any(v.kind in ("number", "scope") for v in verify(s, kpis, as_of, 0, 10 ** 6))
+    return _drop_sentences(unit, lambda s: not bad(s))
+
+def _prompt(unit: str, fields: List[str], new: Dict) -> List[Dict]:
+
+    sections = {FIELD_SECTION[f] for f in fields}
+    facts = {f: new.get(f) for f in FIELD_SECTION if FIELD_SECTION[f] in sections or f == "benchmark_name"}
+    user = Prompt("revise_paragraph").render({"paragraph": unit, "facts_json": prompt_layout.compact_json(facts),
+                                               "changed_fields": ", ".join(fields), "banned_phrases": ", ".join(BANNED)})
+    return [{"role": "system", "content": llm.SYSTEM_WRITER}, {"role": "user", "content": user}]
+
+async def _areprompt(client, unit: str, fields: List[str], new: Dict) -> str:
+    resp = await client.chat.completions.create(model=llm.model_name(), temperature=0.0, messages=_prompt(unit, fields, new))
+    return telemetry.observe_llm("revise_llm", resp).choices[0].message.content.strip()
+
+def _annotate(resp: GenerateResponse, summary: Dict) -> GenerateResponse:
+    resp.assumptions["revision"] = json.dumps(summary, separators=(",", ":"))
+    return resp
+
+async def arevise(req: GenerateRequest, previous: GenerateResponse, kpis: Dict | None = None,
+                  override_backend: str | None = None) -> GenerateResponse:
+
+    backend = agent_router.resolve_backend(override_backend)
+    rs = pipeline.resolve_strategy(req)
+    if kpis is None:
+        kpis = await asyncio.to_thread(load_kpis, req.as_of_period_end, rs["benchmark_id"])
+    rev = plan(previous.text, previous.kpis.model_dump(), kpis)
+
+    client = llm.get_async_client() if rev.reprompt else None
+    if rev.reprompt and client is None:
+        # nothing can rewrite a paragraph without a model; the baseline template is cheap to regenerate in full
+        resp = await agent_router.agenerate(req, backend, kpis=kpis)
+        return _annotate(resp, {**rev.summary(), "mode": "full"})
+
+    with telemetry.request(backend):
+        if rev.reprompt:
+            with telemetry.stage("revise_llm"):
+                idx = list(rev.reprompt)
+                texts = await asyncio.gather(*(_areprompt(client, rev.parts[i], rev.reprompt[i], kpis) for i in idx))
+            for i, t in zip(idx, texts):
+                rev.parts[i] = t
+        with telemetry.stage("compliance_rules"):
+            for i in rev.patched | set(rev.reprompt):
+                rev.parts[i] = scrub(rev.parts[i], kpis, req.as_of_period_end)
+        # never written to the generation cache: the untouched units are client-supplied text
+        text = rev.text()
+
+    return _annotate(GenerateResponse(text=text, kpis=KPIBundle(**kpis), assumptions=dict(previous.assumptions)), rev.summary())
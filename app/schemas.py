@@ -38,3 +38,51 @@ class GenerateResponse(BaseModel):
     text: str
     kpis: KPIBundle
     assumptions: Dict[str, str]
+
+class CompareItem(BaseModel):
+    backend: str
+    ok: bool
+    cached: bool = False
+    seconds: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    response: Optional[GenerateResponse] = None
+    error: Optional[str] = None
+
+class CompareResponse(BaseModel):
+    kpis: KPIBundle                 # the one set every compared text was written from
+    shared_seconds: float           # KPI fetch, exemplars and prompt rendering, done once
+    total_seconds: float
+    results: List[CompareItem]
+
+class ReviseRequest(BaseModel):
+    request: GenerateRequest
+    previous: GenerateResponse
+    kpis: Optional[KPIBundle] = None   # default: reload the KPIs for request.as_of_period_end
+
+class BatchGenerateRequest(BaseModel):
+    items: List[GenerateRequest] = Field(min_length=1)
+    backend: Optional[str] = None
+    concurrency: Optional[int] = Field(default=None, ge=1)
+
+class BatchItemResult(BaseModel):
+    index: int
+    strategy_name: str
+    ok: bool
+    response: Optional[GenerateResponse] = None
+    error: Optional[str] = None
+
+class JobStatus(BaseModel):
+    id: str
+    status: Literal["queued","running","done","failed"]
+    priority: Literal["high","normal","low"]
+    backend: Optional[str] = None
+    attempts: int
+    position: Optional[int] = None   # queued jobs ahead of this one
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    request: GenerateRequest
+    response: Optional[GenerateResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,176 @@
+import contextvars, json, os, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+from . import llm
+
+# Per-stage wall time, token and cost accounting. Everything lands in Prometheus-format metrics (GET /metrics)
+# and, per request, in a Trace that can be attached to GenerateResponse.assumptions["timings"].
+# OpenTelemetry spans are emitted as well when opentelemetry-api is installed.
+
+try:
+    from opentelemetry import trace as _otel
+    _TRACER = _otel.get_tracer("nb-market-context")
+except ImportError:
+    _TRACER = None
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per 1M (input, output) tokens; LLM_PRICE_PER_1M="in,out" overrides for the configured model
+PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00), "gpt-4.1-mini": (0.40, 1.60), "gpt-4.1": (2.00, 8.00)}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self._series: Dict[Labels, List[float]] = {}   # bucket counts..., sum, count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            s = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i in range(bisect_left(self.buckets, value), len(self.buckets)):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in self._series.items():
+                for b, c in zip(self.buckets, s):
+                    out.append(f"{self.name}_bucket{_fmt(key + (('le', str(b)),))} {c:g}")
+                out.append(f"{self.name}_bucket{_fmt(key + (('le', '+Inf'),))} {s[-1]:g}")
+                out.append(f"{self.name}_sum{_fmt(key)} {s[-2]:.6f}")
+                out.append(f"{self.name}_count{_fmt(key)} {s[-1]:g}")
+        return out
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help = name, help_text
+        self._series: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            out += [f"{self.name}{_fmt(key)} {v:g}" for key, v in self._series.items()]
+        return out
+
+def _fmt(labels: Labels) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+REQUEST_SECONDS = Histogram("mc_request_seconds", "End-to-end generation latency by backend.")
+STAGE_SECONDS = Histogram("mc_stage_seconds", "Wall time per generation stage.")
+LLM_TOKENS = Counter("mc_llm_tokens_total", "LLM tokens by stage and kind (prompt/completion).")
+LLM_COST = Counter("mc_llm_cost_usd_total", "Estimated LLM spend in USD.")
+LLM_WAIT_SECONDS = Histogram("mc_llm_gateway_wait_seconds", "Time LLM calls waited for rate-limit capacity by lane.")
+LLM_EVENTS = Counter("mc_llm_gateway_events_total", "LLM gateway requests, retries, hedges and hedge wins by lane.")
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, LLM_TOKENS, LLM_COST, LLM_WAIT_SECONDS, LLM_EVENTS]
+
+@dataclass
+class Trace:
+
+    backend: str
+    stages: List[Dict] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> Dict:
+        return {"backend": self.backend, "total_s": round(time.perf_counter() - self.started, 4), "stages": self.stages}
+
+_CURRENT: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("mc_trace", default=None)
+
+def current() -> Trace | None:
+    return _CURRENT.get()
+
+def _backend() -> str:
+    t = _CURRENT.get()
+    return t.backend if t else "unknown"
+
+@contextmanager
+def request(backend: str) -> Iterator[Trace]:
+
+    t = Trace(backend)
+    token = _CURRENT.set(t)
+    try:
+        yield t
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - t.started, backend=backend)
+        _CURRENT.reset(token)
+
+@contextmanager
+def stage(name: str) -> Iterator[Dict]:
+
+    entry: Dict = {"stage": name}
+    span = _TRACER.start_as_current_span(f"mc.{name}") if _TRACER else None
+    if span:
+        span.__enter__()
+    t0 = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        entry["seconds"] = round(time.perf_counter() - t0, 4)
+        STAGE_SECONDS.observe(entry["seconds"], stage=name, backend=_backend())
+        t = _CURRENT.get()
+        if t is not None:
+            t.stages.append(entry)
+        if span:
+            span.__exit__(None, None, None)
+
+def price_per_1m(model: str) -> Tuple[float, float]:
+
+    override = os.getenv("LLM_PRICE_PER_1M")
+    if override:
+        p_in, p_out = (float(x) for x in override.split(","))
+        return p_in, p_out
+    return PRICES.get(model, (0.0, 0.0))
+
+def record_usage(stage_name: str, model: str, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+
+    prompt_tokens, completion_tokens = int(prompt_tokens or 0), int(completion_tokens or 0)
+    backend = _backend()
+    p_in, p_out = price_per_1m(model)
+    cost = (prompt_tokens * p_in + completion_tokens * p_out) / 1e6
+
+    LLM_TOKENS.inc(prompt_tokens, stage=stage_name, backend=backend, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, stage=stage_name, backend=backend, kind="completion")
+    LLM_COST.inc(cost, stage=stage_name, backend=backend, model=model)
+
+    t = _CURRENT.get()
+    if t is not None:
+        t.stages.append({"stage": stage_name, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "cost_usd": round(cost, 6)})
+
+def record_message_usage(stage_name: str, model: str, message) -> None:
+    # langchain AIMessage/AIMessageChunk carry usage_metadata; OpenAI responses carry .usage
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record_usage(stage_name, model, usage.get("input_tokens"), usage.get("output_tokens"))
+        return
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        record_usage(stage_name, model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+def observe_llm(stage_name: str, message, model: str | None = None):
+    # pass-through so call sites can wrap the LLM result inline
+    record_message_usage(stage_name, model or llm.model_name(), message)
+    return message
+
+def attach_enabled(requested: bool | None = None) -> bool:
+    return requested if requested is not None else os.getenv("TRACE_IN_RESPONSE", "false").lower() == "true"
+
+def timings_json(t: Trace) -> str:
+    return json.dumps(t.summary(), separators=(",", ":"))
+
+def render() -> str:
+    return "\n".join(line for m in METRICS for line in m.render()) + "\n"
@@ -0,0 +1,107 @@
+import os, re
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+# Code-side compliance check run on every draft. When it finds nothing, the LLM compliance pass is skipped.
+
+BANNED = ["we expect", "we believe", "positioned to"]
+OUTLOOK_AND_ATTRIBUTION = [
+    "we anticipate", "we think", "going forward", "looking ahead", "in the coming", "outlook", "will likely", "is likely to",
+    "should benefit", "we remain", "the portfolio", "our portfolio", "the fund", "overweight", "underweight",
+    "contributed to performance", "detracted from performance", "we added", "we trimmed", "we sold", "we bought",
+    "recommend",
+]
+WORD_MIN, WORD_MAX = 200, 300
+
+_NUMBER = re.compile(
+    r"(?<![\w.])(?P<sign>[-+−])?(?P<num>\d{1,3}(?:,\d{3})+|\d+)(?P<dec>\.\d+)?"
+    r"(?P<tail>(?:\s*(?:%|percent\b|per cent\b|bps\b|bp\b|basis points?\b))|[-–]?[A-Za-z]+)?"
+)
+# suffixes that make a number a label; any other attached word ("$45bn", "21x", "200-day") is a figure to check
+_LABELS = frozenset({"year", "years", "yr", "y", "st", "nd", "rd", "th"})
+_ISO_DATE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+_WORD = re.compile(r"\b[\w'’-]+\b")
+_NUMERIC_FIELDS = ("benchmark_return_pct", "vix_end", "vix_change", "ten_year_yield", "ten_year_change_bps",
+                   "inflation_yoy_pct", "eps_growth_pct", "eps_beat_rate_pct")
+
+def phrase_matcher(phrases: Iterable[str]) -> re.Pattern:
+    # longest first so overlapping phrases report the most specific match
+    alts = sorted({re.escape(p.lower()) for p in phrases}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alts) + r")\b", re.IGNORECASE)
+
+_SCOPE = phrase_matcher(BANNED + OUTLOOK_AND_ATTRIBUTION)
+
+@dataclass(frozen=True)
+class Violation:
+
+    kind: str      # "number" | "scope" | "length" | "coverage"
+    detail: str
+
+    def __str__(self) -> str:
+        return f"{self.kind}: {self.detail}"
+
+def _allowed_values(kpis: Dict, as_of: date | str | None) -> Set[float]:
+
+    allowed: Set[float] = set()
+    for field in _NUMERIC_FIELDS:
+        v = kpis.get(field)
+        if v is None:
+            continue
+        allowed.add(abs(float(v)))
+        if field == "ten_year_change_bps":
+            allowed.add(abs(float(v)) / 100.0)   # 5 bp == 0.05%
+    # numbers that are part of names ("S&P 500", "Russell 2000", "CPI") are not data
+    for field in ("benchmark_name", "inflation_series"):
+        allowed.update(float(n) for n in re.findall(r"\d+(?:\.\d+)?", str(kpis.get(field) or "")))
+    if as_of:
+        d = as_of if isinstance(as_of, date) else date.fromisoformat(str(as_of))
+        allowed.update({float(d.year), float(d.day)})
+    return allowed
+
+def _matches(value: float, allowed: Set[float]) -> bool:
+    return any(abs(value - a) < 1e-9 for a in allowed)
+
+def figures(text: str) -> Iterator[Tuple[re.Match, float, str]]:
+    # (match, absolute value, unit tail) for every figure; match offsets index into text
+
+    for m in _NUMBER.finditer(_ISO_DATE.sub(lambda d: " " * len(d.group(0)), text)):
+        tail = (m.group("tail") or "").strip().lower().lstrip("-–")
+        if tail in _LABELS:
+            continue   # "10-year", "10Y", "2nd" are labels, not figures ("Q2" never matches: a letter precedes it)
+        yield m, float(m.group("num").replace(",", "") + (m.group("dec") or "")), tail
+
+def unmatched_numbers(text: str, kpis: Dict, as_of: date | str | None = None) -> List[str]:
+
+    allowed = _allowed_values(kpis, as_of)
+    out = []
+    for m, value, tail in figures(text):
+        if tail.startswith("bp") or tail.startswith("basis"):
+            ok = _matches(value, allowed)
+        else:
+            ok = _matches(value, allowed) or (not tail and 1900 <= value <= 2100 and not m.group("dec"))
+        if not ok:
+            out.append(m.group(0).strip())
+    return out
+
+def verify(text: str, kpis: Dict, as_of: date | str | None = None,
+           word_min: int = WORD_MIN, word_max: int = WORD_MAX) -> List[Violation]:
+
+    violations = [Violation("scope", m.group(0)) for m in _SCOPE.finditer(text)]
+    violations += [Violation("number", n) for n in unmatched_numbers(text, kpis, as_of)]
+
+    words = len(_WORD.findall(text))
+    if not word_min <= words <= word_max:
+        violations.append(Violation("length", f"{words} words (target {word_min}-{word_max})"))
+
+    r = kpis.get("benchmark_return_pct")
+    if r is not None and not any(abs(float(x) - abs(float(r))) < 1e-9 for x in re.findall(r"\d+(?:\.\d+)?(?=\s*%)", text)):
+        violations.append(Violation("coverage", "benchmark return missing"))
+
+    return violations
+
+def enabled() -> bool:
+    return os.getenv("COMPLIANCE_VERIFIER", "true").lower() == "true"
+
+def needs_llm_pass(text: str, kpis: Dict, as_of: date | str | None = None) -> bool:
+    return not enabled() or bool(verify(text, kpis, as_of))
@@ -1,14 +1,34 @@
 from typing import Dict
 from datetime import date
-import os
+import hashlib, os
 
 SECTOR_ETF_MAP = {"InfoTech":"XLK","Financials":"XLF","Energy":"XLE","HealthCare":"XLV","Industrials":"XLI","CommServices":"XLC","ConsumerDisc":"XLY","ConsumerStaples":"XLP","Materials":"XLB","Utilities":"XLU","RealEstate":"XLRE"}
 
 BENCHMARK_NAME = {"SPX_TR":"S&P 500 Total Return","R2000_TR":"Russell 2000 Total Return","R3000_TR":"Russell 3000 Total Return","AGG_TR":"US Agg Total Return"}
 
+class NoKPISource(RuntimeError):
+    # configuration, not a data outage: no KPI source is enabled
+    pass
+
+def mock() -> bool:
+    return os.getenv("MOCK", "true").lower() == "true"
+
+def source() -> str:
+    # the branch fetch_kpis takes right now; part of the KPI cache key, so switching MOCK, dropping in new history
+    # files or enabling providers never serves KPIs computed the other way
+
+    if mock():
+        return "mock"
+    from .kpi_compute import history_stamp
+    stamp = history_stamp()
+    if stamp is not None:
+        return "history:" + hashlib.sha256(repr(stamp).encode("utf-8")).hexdigest()[:12]
+    from . import providers
+    return "providers" if providers.enabled() else "none"
+
 def fetch_kpis(as_of: date, benchmark_id: str) -> Dict:
 
-    if os.getenv("MOCK", "true").lower() == "true":
+    if mock():
 
         return {"benchmark_name": BENCHMARK_NAME.get(benchmark_id, benchmark_id), "benchmark_return_pct": 3.2,
                 "vix_end": 14.1, "vix_change": 0.6, "ten_year_yield": 4.22, "ten_year_change_bps": 5,
@@ -16,4 +36,16 @@ def fetch_kpis(as_of: date, benchmark_id: str) -> Dict:
                 "sector_leaders": ["InfoTech", "Energy"], "sector_laggards": ["Utilities", "RealEstate"],
                 "eps_growth_pct": 12.8, "eps_beat_rate_pct": 78.0}
     
-    raise NotImplementedError("Replace MOCK with real Yahoo/FRED fetchers when ready.")
+    # local price/macro histories (KPI_HISTORY_DIR) take precedence over network providers
+    from .kpi_compute import history_engine
+    engine = history_engine()
+    if engine is not None:
+        return engine.lookup(as_of, benchmark_id, os.getenv("KPI_WINDOW", "M").upper())
+
+    # live Yahoo/FRED/internal series through the pooled adapters (KPI_PROVIDERS=false to disable)
+    from . import providers
+    if providers.enabled():
+        return providers.fetch_kpis(as_of, benchmark_id, os.getenv("KPI_WINDOW", "M").upper())
+
+    raise NoKPISource("No KPI source enabled: set MOCK=true for fixture KPIs, put prices.parquet/prices.csv in "
+                      "KPI_HISTORY_DIR for local history, or set KPI_PROVIDERS=true for live Yahoo/FRED series.")
@@ -0,0 +1,140 @@
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+# Two tiers in front of fetch_kpis + normalize_kpis:
+#   L1: per-process LRU with TTL
+#   L2: SQLite file shared by every uvicorn worker on the pod (KPI_DISK_TTL, default a day; a stale copy is still
+#       served when the provider fails)
+# Entries are keyed by (as_of, benchmark_id, source): MOCK, local history and live providers never share values.
+# invalidate() bumps an epoch row in L2 so every worker drops its L1 on the next lookup.
+
+CACHE_PATH = Path(os.getenv("KPI_CACHE_PATH", ".cache/kpi_cache.sqlite"))
+
+Key = Tuple[str, str, str]
+
+class KPICache:
+
+    def __init__(self, path: Path | str = CACHE_PATH, max_items: int | None = None, ttl_s: float | None = None,
+                 disk_ttl_s: float | None = None, fetch_timeout_s: float | None = None):
+
+        self.path = Path(path)
+        self.max_items = max_items or int(os.getenv("KPI_CACHE_MAX_ITEMS", "512"))
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("KPI_CACHE_TTL", "900"))
+        self.disk_ttl_s = disk_ttl_s if disk_ttl_s is not None else float(os.getenv("KPI_DISK_TTL", "86400"))  # 0 = never expires
+        self.fetch_timeout_s = fetch_timeout_s if fetch_timeout_s is not None else float(os.getenv("KPI_FETCH_TIMEOUT", "10"))
+        self._mem: "OrderedDict[Key, Tuple[float, Dict]]" = OrderedDict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="kpi-fetch")
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale_served": 0, "fetch_errors": 0}
+
+    def _db(self) -> sqlite3.Connection:
+
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if "source" not in [c[1] for c in conn.execute("PRAGMA table_info(kpis)")]:   # pre-source layout: start over
+                conn.execute("DROP TABLE IF EXISTS kpis")
+            conn.execute("CREATE TABLE IF NOT EXISTS kpis (as_of TEXT, benchmark_id TEXT, source TEXT, payload TEXT, fetched_at REAL, "
+                         "PRIMARY KEY (as_of, benchmark_id, source))")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', 0)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _sync_epoch(self) -> None:
+
+        epoch = self._db().execute("SELECT value FROM meta WHERE key='epoch'").fetchone()[0]
+        if epoch != self._epoch:
+            self._mem.clear()
+            self._epoch = epoch
+
+    def _disk_get(self, key: Key) -> Tuple[Dict, float] | None:
+
+        row = self._db().execute("SELECT payload, fetched_at FROM kpis WHERE as_of=? AND benchmark_id=? AND source=?", key).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _remember(self, key: Key, kpis: Dict) -> None:
+
+        self._mem[key] = (time.monotonic(), kpis)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def get(self, as_of: date, benchmark_id: str, loader: Callable[[date, str], Dict], source: str = "") -> Dict:
+
+        key = (str(as_of), benchmark_id, source)
+        with self._lock:
+            self._sync_epoch()
+            hit = self._mem.get(key)
+            if hit and time.monotonic() - hit[0] < self.ttl_s:
+                self._mem.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return hit[1]
+
+            stored = self._disk_get(key)
+            if stored and (not self.disk_ttl_s or time.time() - stored[1] < self.disk_ttl_s):
+                self.counters["disk_hits"] += 1
+                self._remember(key, stored[0])
+                return stored[0]
+            self.counters["misses"] += 1
+
+        # fetch outside the lock; with a stale copy on disk a slow provider is bounded by fetch_timeout_s
+        future = self._pool.submit(loader, as_of, benchmark_id)
+        try:
+            kpis = future.result(timeout=self.fetch_timeout_s if stored else None)
+        except Exception:
+            with self._lock:
+                self.counters["fetch_errors"] += 1
+                if not stored:
+                    raise
+                self.counters["stale_served"] += 1
+                self._remember(key, stored[0])
+            # a slow fetch that eventually succeeds still refreshes the cache
+            future.add_done_callback(lambda f: f.exception() is None and self._store(key, f.result()))
+            return stored[0]
+
+        self._store(key, kpis)
+        return kpis
+
+    def _store(self, key: Key, kpis: Dict) -> None:
+
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO kpis VALUES (?, ?, ?, ?, ?)", (*key, json.dumps(kpis), time.time()))
+            self._db().commit()
+            self._remember(key, kpis)
+
+    def invalidate(self, as_of: date | str | None = None, benchmark_id: str | None = None) -> int:
+
+        clauses, args = [], []
+        if as_of is not None:
+            clauses.append("as_of=?"); args.append(str(as_of))
+        if benchmark_id is not None:
+            clauses.append("benchmark_id=?"); args.append(benchmark_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            db = self._db()
+            removed = db.execute(f"DELETE FROM kpis{where}", args).rowcount
+            db.execute("UPDATE meta SET value = value + 1 WHERE key='epoch'")
+            db.commit()
+            self._sync_epoch()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+
+        with self._lock:
+            disk_items = self._db().execute("SELECT COUNT(*) FROM kpis").fetchone()[0]
+            return {**self.counters, "memory_items": len(self._mem), "disk_items": disk_items}
+
+CACHE = KPICache()
+
+def enabled() -> bool:
+    return os.getenv("KPI_CACHE", "true").lower() == "true"
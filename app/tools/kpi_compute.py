@@ -1,5 +1,161 @@
-from typing import Dict
+import os
+from pathlib import Path
+from typing import Dict, List
+from datetime import date
+import numpy as np
+import pandas as pd
+from .data_fetchers import fetch_kpis, source, SECTOR_ETF_MAP, BENCHMARK_NAME
+from . import kpi_cache
+
+# Local histories: one wide daily frame (date index; benchmark ids, sector ETFs, VIX, US10Y, CPI as columns),
+# plus an optional long eps file (date, benchmark_id, eps_growth_pct, eps_beat_rate_pct).
+HISTORY_DIR = Path(os.getenv("KPI_HISTORY_DIR", "data/market"))
+WINDOWS = {"M": 1, "Q": 3}   # lag in month-end rows
+VIX, TEN_YEAR, CPI = "VIX", "US10Y", "CPI"
+
+_ROUNDING = {"benchmark_return_pct": 2, "vix_end": 2, "vix_change": 2, "ten_year_yield": 2,
+             "inflation_yoy_pct": 1, "eps_growth_pct": 1, "eps_beat_rate_pct": 1}
 
 def normalize_kpis(raw: Dict) -> Dict:
-    
-    return raw
+
+    out = dict(raw)
+    for k, nd in _ROUNDING.items():
+        if out.get(k) is not None:
+            out[k] = round(float(out[k]), nd)
+    if out.get("ten_year_change_bps") is not None:
+        out["ten_year_change_bps"] = int(round(out["ten_year_change_bps"]))
+    return out
+
+def _read_frame(path: Path) -> pd.DataFrame:
+
+    if path.suffix == ".parquet":
+        df = pd.read_parquet(path, memory_map=True)
+    else:
+        df = pd.read_csv(path, memory_map=True)
+    if "date" in df.columns:
+        df = df.set_index("date")
+    df.index = pd.to_datetime(df.index)
+    return df.sort_index()
+
+class KPIEngine:
+    # Every KPIBundle field for every benchmark, period end and window is computed in one vectorized pass
+    # at load time; lookup() is then a dict hit plus a row read.
+
+    def __init__(self, prices: pd.DataFrame, eps: pd.DataFrame | None = None):
+
+        month_end = prices.resample("ME").last()
+        self.periods = month_end.index
+        self._row = {ts.date(): i for i, ts in enumerate(self.periods)}
+
+        self.benchmarks = [c for c in month_end.columns if c in BENCHMARK_NAME]
+        self.sector_names = [s for s, etf in SECTOR_ETF_MAP.items() if etf in month_end.columns]
+        priced = self.benchmarks + [SECTOR_ETF_MAP[s] for s in self.sector_names]
+
+        # log price is the prefix sum of log returns, so any window's return is one subtraction
+        log_px = np.log(month_end[priced].to_numpy(dtype=np.float64))
+        n = len(self.periods)
+        self.tables: Dict[str, Dict[str, np.ndarray]] = {}
+
+        for window, lag in WINDOWS.items():
+            ret = np.full((n, len(priced)), np.nan)
+            ret[lag:] = np.expm1(log_px[lag:] - log_px[:-lag]) * 100.0
+            t = {"returns": ret[:, :len(self.benchmarks)]}
+
+            sec = ret[:, len(self.benchmarks):]
+            if sec.shape[1]:
+                order = np.argsort(np.where(np.isnan(sec), -np.inf, sec), axis=1)   # ascending; NaN sorts first
+                t["leaders"], t["laggards"] = order[:, ::-1][:, :2], order[:, :2]
+                t["sector_ok"] = ~np.isnan(sec).any(axis=1)
+
+            t.update(self._level_and_change(month_end, VIX, lag, "vix"))
+            t.update(self._level_and_change(month_end, TEN_YEAR, lag, "ten_year"))
+            self.tables[window] = t
+
+        self.cpi_yoy = np.full(n, np.nan)
+        if CPI in month_end.columns:
+            cpi = month_end[CPI].ffill().to_numpy(dtype=np.float64)
+            self.cpi_yoy[12:] = (cpi[12:] / cpi[:-12] - 1.0) * 100.0
+
+        self.eps: Dict[tuple, Dict] = {}
+        if eps is not None and len(eps):
+            eps = eps.reset_index()
+            eps["period"] = pd.to_datetime(eps["date"]) + pd.offsets.MonthEnd(0)
+            for rec in eps.to_dict("records"):
+                self.eps[(rec["period"].date(), rec["benchmark_id"])] = rec
+
+    @staticmethod
+    def _level_and_change(frame: pd.DataFrame, col: str, lag: int, prefix: str) -> Dict[str, np.ndarray]:
+
+        n = len(frame)
+        level = frame[col].to_numpy(dtype=np.float64) if col in frame.columns else np.full(n, np.nan)
+        change = np.full(n, np.nan)
+        change[lag:] = level[lag:] - level[:-lag]
+        return {f"{prefix}_level": level, f"{prefix}_change": change}
+
+    @staticmethod
+    def _val(x: float) -> float | None:
+        return None if np.isnan(x) else float(x)
+
+    def lookup(self, as_of: date, benchmark_id: str, window: str = "M") -> Dict:
+
+        period = (pd.Timestamp(as_of) + pd.offsets.MonthEnd(0)).date()
+        if period not in self._row or benchmark_id not in self.benchmarks:
+            raise KeyError(f"No history for {benchmark_id} at {period}")
+        i, t = self._row[period], self.tables[window]
+        ret = t["returns"][i, self.benchmarks.index(benchmark_id)]
+        if np.isnan(ret):
+            raise KeyError(f"Insufficient history for a {window} return of {benchmark_id} at {period}")
+
+        bps = self._val(t["ten_year_change"][i])
+        out = {"benchmark_name": BENCHMARK_NAME.get(benchmark_id, benchmark_id), "benchmark_return_pct": float(ret),
+               "vix_end": self._val(t["vix_level"][i]), "vix_change": self._val(t["vix_change"][i]),
+               "ten_year_yield": self._val(t["ten_year_level"][i]),
+               "ten_year_change_bps": None if bps is None else bps * 100.0,
+               "inflation_series": "CPI YoY" if not np.isnan(self.cpi_yoy[i]) else None,
+               "inflation_yoy_pct": self._val(self.cpi_yoy[i]),
+               "sector_leaders": None, "sector_laggards": None, "eps_growth_pct": None, "eps_beat_rate_pct": None}
+
+        if "leaders" in t and t["sector_ok"][i]:
+            out["sector_leaders"] = [self.sector_names[j] for j in t["leaders"][i]]
+            out["sector_laggards"] = [self.sector_names[j] for j in t["laggards"][i]]
+
+        eps = self.eps.get((period, benchmark_id))
+        if eps:
+            out["eps_growth_pct"], out["eps_beat_rate_pct"] = eps.get("eps_growth_pct"), eps.get("eps_beat_rate_pct")
+        return out
+
+def _history_files() -> List[Path]:
+
+    for name in ("prices.parquet", "prices.csv"):
+        if (HISTORY_DIR / name).exists():
+            prices = HISTORY_DIR / name
+            eps = next((p for p in (HISTORY_DIR / "eps.parquet", HISTORY_DIR / "eps.csv") if p.exists()), None)
+            return [prices] + ([eps] if eps else [])
+    return []
+
+_ENGINE: Dict[str, object] = {"stamp": None, "engine": None}
+
+def history_stamp() -> tuple | None:
+    files = _history_files()
+    return tuple((str(f), f.stat().st_mtime_ns) for f in files) if files else None
+
+def history_engine() -> KPIEngine | None:
+
+    stamp = history_stamp()
+    if stamp is None:
+        return None
+    files = [Path(f) for f, _ in stamp]
+    if _ENGINE["stamp"] != stamp:
+        eps = _read_frame(files[1]) if len(files) > 1 else None
+        _ENGINE["engine"], _ENGINE["stamp"] = KPIEngine(_read_frame(files[0]), eps), stamp
+    return _ENGINE["engine"]
+
+def _fetch_normalized(as_of: date, benchmark_id: str) -> Dict:
+
+    return normalize_kpis(fetch_kpis(as_of, benchmark_id))
+
+def load_kpis(as_of: date, benchmark_id: str) -> Dict:
+
+    if not kpi_cache.enabled():
+        return _fetch_normalized(as_of, benchmark_id)
+    return kpi_cache.CACHE.get(as_of, benchmark_id, _fetch_normalized, source())
@@ -0,0 +1,311 @@
+import asyncio, importlib.util, json, os, random, threading, time
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
+import httpx
+import pandas as pd
+
+# HTTP adapters for live KPI series (Yahoo chart, FRED, internal series API). Every adapter shares one pooled
+# httpx.AsyncClient on a dedicated event loop, so callers on any thread (the KPI cache fetch pool, uvicorn
+# workers) reuse keep-alive connections and identical in-flight series requests coalesce into one call.
+# Failures retry with jittered backoff; a per-provider circuit breaker serves the last good series for the same
+# window when open, never one fetched for a different period.
+
+MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "64"))
+MAX_PER_HOST = int(os.getenv("PROVIDER_MAX_PER_HOST", "8"))
+TIMEOUT_S = float(os.getenv("PROVIDER_TIMEOUT", "10"))
+HTTP2 = os.getenv("PROVIDER_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+RETRYABLE = {408, 425, 429, 500, 502, 503, 504}
+
+class ProviderError(RuntimeError):
+    pass
+
+class CircuitOpen(ProviderError):
+    pass
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive errors; after reset_s one probe is let through (half-open)
+
+    def __init__(self, failures: int | None = None, reset_s: float | None = None):
+        self.threshold = failures or int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))
+        self.reset_s = reset_s if reset_s is not None else float(os.getenv("PROVIDER_BREAKER_RESET", "30"))
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures, self.opened_at, self._probing = 0, None, False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class Pool:
+    # one background event loop owning the AsyncClient; sync and async callers submit coroutines to it
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self.transport = transport
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="providers", daemon=True).start()
+        return self._loop
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2, transport=self.transport, timeout=TIMEOUT_S, follow_redirects=True,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS))
+        return self._client
+
+    def host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(MAX_PER_HOST)
+        return self._hosts[host]
+
+    def run(self, coro, timeout: float | None = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop()).result(timeout)
+
+    async def arun(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop()))
+
+POOL = Pool()
+
+Window = Tuple[str, str]
+
+class Provider:
+    # subclasses build the request for a list of series ids and parse the payload into {id: pd.Series}
+
+    name = "base"
+    batch_size = 1
+
+    def __init__(self, base_url: str, pool: Pool | None = None, max_retries: int | None = None, backoff_s: float = 0.25,
+                 breaker: CircuitBreaker | None = None):
+        self.base_url = base_url.rstrip("/")
+        self.pool = pool or POOL
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("PROVIDER_MAX_RETRIES", "3"))
+        self.backoff_s = backoff_s
+        self.breaker = breaker or CircuitBreaker()
+        self._inflight: Dict[Tuple[str, Window], asyncio.Future] = {}
+        self.last_good: Dict[Tuple[str, Window], pd.Series] = {}
+        self.counters = {"requests": 0, "retries": 0, "coalesced": 0, "fallbacks": 0}
+
+    def request(self, ids: List[str], start: date, end: date) -> Tuple[str, Dict]:
+        raise NotImplementedError
+
+    def parse(self, payload: Dict, ids: List[str]) -> Dict[str, pd.Series]:
+        raise NotImplementedError
+
+    async def _call(self, ids: List[str], start: date, end: date) -> Dict[str, pd.Series]:
+
+        url, params = self.request(ids, start, end)   # a config error here must not take the half-open probe
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.name} circuit open")
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.pool.host_slot(url):
+                    self.counters["requests"] += 1
+                    r = await self.pool.client().get(url, params=params)
+                if r.status_code in RETRYABLE:
+                    raise ProviderError(f"{self.name} HTTP {r.status_code}")
+                r.raise_for_status()
+                try:
+                    out = self.parse(r.json(), ids)
+                except (KeyError, TypeError, IndexError) as e:   # an unexpected payload shape is a bad response
+                    raise ProviderError(f"{self.name} malformed payload: {type(e).__name__}: {e}") from e
+            except httpx.HTTPStatusError as e:    # other 4xx: retrying won't help and the service is up
+                self.breaker.success()
+                raise ProviderError(f"{self.name} HTTP {e.response.status_code}") from e
+            except (ProviderError, httpx.TransportError, ValueError) as e:
+                if attempt == self.max_retries:
+                    self.breaker.failure()
+                    raise ProviderError(f"{self.name} failed after {attempt + 1} attempts: {e}") from e
+                self.counters["retries"] += 1
+                await asyncio.sleep(random.uniform(0, min(5.0, self.backoff_s * 2 ** attempt)))   # full jitter
+                continue
+            self.breaker.success()
+            return out
+
+    async def _resolve(self, ids: List[str], start: date, end: date, futures: Dict[str, asyncio.Future]) -> None:
+
+        window = (str(start), str(end))
+        try:
+            got = await self._call(ids, start, end)
+        except ProviderError as e:
+            for i in ids:
+                if (i, window) in self.last_good:
+                    self.counters["fallbacks"] += 1
+                    futures[i].set_result(self.last_good[(i, window)])
+                else:
+                    futures[i].set_exception(e)
+            return
+        except BaseException as e:
+            # anything else still settles every future, or its (series, window) stays in _inflight and later
+            # fetches coalesce onto a future nobody will resolve
+            for i in ids:
+                if not futures[i].done():
+                    if isinstance(e, Exception):
+                        futures[i].set_exception(ProviderError(f"{self.name} failed: {type(e).__name__}: {e}"))
+                    else:
+                        futures[i].cancel()
+            raise
+        for i in ids:
+            if i in got:
+                self.last_good[(i, window)] = got[i]
+                futures[i].set_result(got[i])
+            else:
+                futures[i].set_exception(ProviderError(f"{self.name} returned no data for {i}"))
+
+    async def fetch(self, ids: Iterable[str], start: date, end: date) -> Dict[str, pd.Series]:
+        # must run on the pool loop (see fetch_frame); in-flight futures are keyed by (series, window)
+
+        window = (str(start), str(end))
+        loop = asyncio.get_running_loop()
+        mine: Dict[str, asyncio.Future] = {}
+        waits: Dict[str, asyncio.Future] = {}
+        for i in dict.fromkeys(ids):
+            fut = self._inflight.get((i, window))
+            if fut is None:
+                fut = mine[i] = self._inflight[(i, window)] = loop.create_future()
+                fut.add_done_callback(lambda _, k=(i, window): self._inflight.pop(k, None))
+            else:
+                self.counters["coalesced"] += 1
+            waits[i] = fut
+
+        new = list(mine)
+        await asyncio.gather(*(self._resolve(new[k:k + self.batch_size], start, end, mine)
+                               for k in range(0, len(new), self.batch_size)))
+        return {i: await f for i, f in waits.items()}
+
+class YahooChart(Provider):
+    # GET /v8/finance/chart/{symbol}; one symbol per call, adjusted close when present
+
+    name = "yahoo"
+
+    def request(self, ids, start, end):
+        ts = lambda d: int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+        return f"{self.base_url}/v8/finance/chart/{ids[0]}", {"period1": ts(start), "period2": ts(end) + 86400, "interval": "1d"}
+
+    def parse(self, payload, ids):
+        res = ((payload.get("chart") or {}).get("result") or [None])[0]
+        if not res or not res.get("timestamp"):
+            return {}
+        ind = res["indicators"]
+        closes = (ind.get("adjclose") or [{}])[0].get("adjclose") or ind["quote"][0]["close"]
+        idx = pd.to_datetime(res["timestamp"], unit="s").normalize()
+        return {ids[0]: pd.Series(closes, index=idx, dtype="float64").dropna()}
+
+class Fred(Provider):
+    # GET /fred/series/observations; one series per call, "." marks a missing observation
+
+    name = "fred"
+
+    def request(self, ids, start, end):
+        key = os.getenv("FRED_API_KEY")
+        if not key:
+            raise ProviderError("FRED_API_KEY is not set")
+        return f"{self.base_url}/fred/series/observations", {"series_id": ids[0], "api_key": key, "file_type": "json",
+                                                             "observation_start": str(start), "observation_end": str(end)}
+
+    def parse(self, payload, ids):
+        obs = [(o["date"], float(o["value"])) for o in payload.get("observations", []) if o.get("value") not in (None, ".")]
+        if not obs:
+            return {}
+        d, v = zip(*obs)
+        return {ids[0]: pd.Series(v, index=pd.to_datetime(list(d)), dtype="float64")}
+
+class InternalSeries(Provider):
+    # GET /series?ids=A,B&start=&end= -> {"series": {"A": {"dates": [...], "values": [...]}}}; batches ids
+
+    name = "internal"
+    batch_size = int(os.getenv("INTERNAL_SERIES_BATCH", "25"))
+
+    def request(self, ids, start, end):
+        return f"{self.base_url}/series", {"ids": ",".join(ids), "start": str(start), "end": str(end)}
+
+    def parse(self, payload, ids):
+        out = {}
+        for i, s in (payload.get("series") or {}).items():
+            out[i] = pd.Series(s["values"], index=pd.to_datetime(s["dates"]), dtype="float64").dropna()
+        return out
+
+def _providers() -> Dict[str, Provider]:
+
+    out: Dict[str, Provider] = {"yahoo": YahooChart(os.getenv("YAHOO_BASE_URL", "https://query1.finance.yahoo.com")),
+                                "fred": Fred(os.getenv("FRED_BASE_URL", "https://api.stlouisfed.org"))}
+    if os.getenv("INTERNAL_SERIES_URL"):
+        out["internal"] = InternalSeries(os.environ["INTERNAL_SERIES_URL"])
+    return out
+
+PROVIDERS: Dict[str, Provider] = _providers()
+
+# KPIEngine column -> "provider:series". Total-return indices where Yahoo carries them, ETF proxies otherwise.
+SOURCES = {"SPX_TR": "yahoo:^SP500TR", "R2000_TR": "yahoo:IWM", "R3000_TR": "yahoo:IWV", "AGG_TR": "yahoo:AGG",
+           "VIX": "yahoo:^VIX", "US10Y": "fred:DGS10", "CPI": "fred:CPIAUCSL"}
+SOURCES.update(json.loads(os.getenv("KPI_SOURCES", "{}")))
+
+def enabled() -> bool:
+    return os.getenv("KPI_PROVIDERS", "true").lower() == "true"
+
+async def afetch_frame(columns: Dict[str, str], start: date, end: date) -> pd.DataFrame:
+
+    by_provider: Dict[str, Dict[str, str]] = {}
+    for col, src in columns.items():
+        prov, series = src.split(":", 1)
+        by_provider.setdefault(prov, {})[series] = col
+
+    async def one(prov: str, series: Dict[str, str]) -> Dict[str, pd.Series]:
+        got = await PROVIDERS[prov].fetch(list(series), start, end)
+        return {series[s]: v for s, v in got.items()}
+
+    parts = await asyncio.gather(*(one(p, s) for p, s in by_provider.items()))
+    frame = pd.concat({c: s for part in parts for c, s in part.items()}, axis=1, sort=True)
+    frame = frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+    # FRED/Yahoo calendars differ (holidays, monthly CPI); only gaps between observations are filled, so a series
+    # that stopped early stays missing at the window end rather than repeating a stale value into it
+    return frame.ffill(limit_area="inside")
+
+def fetch_frame(columns: Dict[str, str], start: date, end: date) -> pd.DataFrame:
+    return POOL.run(afetch_frame(columns, start, end), timeout=TIMEOUT_S * 4)
+
+def fetch_kpis(as_of: date, benchmark_id: str, window: str = "M") -> Dict:
+
+    from .data_fetchers import SECTOR_ETF_MAP
+    from .kpi_compute import KPIEngine
+
+    columns = {c: s for c, s in SOURCES.items() if c in (benchmark_id, "VIX", "US10Y", "CPI")}
+    columns.update({etf: f"yahoo:{etf}" for etf in SECTOR_ETF_MAP.values()})
+    if benchmark_id not in columns:
+        raise ProviderError(f"No source configured for {benchmark_id}")
+
+    end = (pd.Timestamp(as_of) + pd.offsets.MonthEnd(0)).date()
+    start = (pd.Timestamp(end) - pd.DateOffset(months=15)).date()   # CPI YoY + the Q window
+    return KPIEngine(fetch_frame(columns, start, end)).lookup(as_of, benchmark_id, window)
+
+def stats() -> Dict[str, Dict]:
+    return {n: {**p.counters, "breaker": p.breaker.state} for n, p in PROVIDERS.items()}
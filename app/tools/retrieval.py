@@ -1,7 +1,9 @@
 # app/tools/retrieval.py
-from typing import List
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
 from pathlib import Path
-import re
+import json, os, re, threading, zlib
+import numpy as np
 
 # retrieval.py -> tools -> app -> <repo_root> (parents[3])
 _REPO_ROOT = Path(__file__).resolve().parents[3]
@@ -20,6 +22,17 @@ _FALLBACK_SEEDS = [
 _NUM = re.compile(r"\b\d{1,4}(\.\d+)?%?\b")
 _YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
 _QUARTER = re.compile(r"\bQ[1-4]\b")
+_TOKEN = re.compile(r"[a-z][a-z'\-]+")
+_STOP = frozenset("the a an and or of to in on for as at by with from was were is are be been its it that this which while over into than".split())
+
+# hashed TF-IDF keeps the matrix width fixed, so seeds can be added file by file without a global vocabulary
+DIM = int(os.getenv("STYLE_INDEX_DIM", "1024"))
+PERSIST = os.getenv("STYLE_INDEX_PERSIST", "false").lower() == "true"
+
+SECTOR_TERMS = {"InfoTech": "technology tech", "Financials": "financials banks", "Energy": "energy oil",
+                "HealthCare": "health care", "Industrials": "industrials cyclicals", "CommServices": "communication services",
+                "ConsumerDisc": "consumer discretionary", "ConsumerStaples": "consumer staples defensive",
+                "Materials": "materials commodities", "Utilities": "utilities defensive", "RealEstate": "real estate"}
 
 def _strip_numbers(text: str) -> str:
     text = _NUM.sub(" ", text)
@@ -34,21 +47,196 @@ def _seed_dir() -> Path | None:
             return p
     return None
 
+def _hash_rows(snippets: List[str]) -> np.ndarray:
+    # raw term counts in hashed feature space, one row per snippet
+    rows = np.zeros((len(snippets), DIM), dtype=np.float32)
+    for i, s in enumerate(snippets):
+        cols = [zlib.crc32(t.encode("utf-8")) % DIM for t in _TOKEN.findall(s.lower()) if t not in _STOP]
+        if cols:
+            np.add.at(rows[i], cols, 1.0)
+    return rows
+
+def _read_snippets(f: Path) -> List[str]:
+    txt = f.read_text(encoding="utf-8").strip()
+    # split on newlines so multiple snippets per file are respected
+    return [s for s in (_strip_numbers(line.strip()) for line in txt.splitlines()) if s]
+
+@dataclass(frozen=True)
+class _Snapshot:
+    # everything a reader needs, published as one object: a query never mixes snippets of one build with
+    # the matrix or idf of another
+
+    files: Dict[str, Tuple[Tuple[int, int], List[str], np.ndarray]]
+    snippets: List[str]
+    matrix: np.ndarray
+    idf: np.ndarray
+
+_EMPTY = _Snapshot({}, [], np.zeros((0, DIM), dtype=np.float32), np.ones(DIM, dtype=np.float32))
+
+class SeedIndex:
+    # Sanitized seed snippets + one L2-normalised TF-IDF matrix. refresh() only re-reads files whose
+    # (mtime, size) changed; everything else is reused from memory or the memory-mapped .npy on disk.
+    # A rebuild works on copies and swaps in a new _Snapshot with one assignment; readers take one reference.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snap = _EMPTY
+        self.seed_dir: Path | None = None
+
+    @property
+    def _files(self) -> Dict[str, Tuple[Tuple[int, int], List[str], np.ndarray]]:
+        return self._snap.files
+
+    @property
+    def snippets(self) -> List[str]:
+        return self._snap.snippets
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snap.matrix
+
+    @property
+    def idf(self) -> np.ndarray:
+        return self._snap.idf
+
+    def _scan(self) -> Tuple[Path | None, Dict[str, Tuple[int, int]]]:
+        p = _seed_dir()
+        if not p:
+            return None, {}
+        out = {}
+        for f in sorted(p.glob("*.txt")):
+            st = f.stat()
+            out[f.name] = (st.st_mtime_ns, st.st_size)
+        return p, out
+
+    @staticmethod
+    def _load_persisted(seed_dir: Path) -> Dict[str, Tuple[Tuple[int, int], List[str], np.ndarray]]:
+        # the manifest names the matrix file it was written with; a row count that disagrees means a torn pair
+        if not PERSIST:
+            return {}
+        d = seed_dir / ".index"
+        try:
+            manifest = json.loads((d / "manifest.json").read_text(encoding="utf-8"))
+            tf = np.load(d / manifest["tf"], mmap_mode="r")
+        except (OSError, ValueError, KeyError):
+            return {}
+        if manifest.get("dim") != DIM or tf.shape != (manifest.get("rows"), DIM):
+            return {}
+        files = {}
+        for name, entry in manifest["files"].items():
+            lo, hi = entry["rows"]
+            files[name] = (tuple(entry["stamp"]), entry["snippets"], tf[lo:hi])
+        return files
+
+    @staticmethod
+    def _persist(seed_dir: Path, files: Dict, tf: np.ndarray) -> None:
+        # each build gets its own tf-<crc>.npy and the manifest pointing at it is swapped in last, both via
+        # os.replace, so a concurrent reader sees the old pair or the new pair, never one of each
+        d = seed_dir / ".index"
+        d.mkdir(exist_ok=True)
+        manifest, lo = {}, 0
+        for name, (stamp, snippets, _) in files.items():
+            manifest[name] = {"stamp": list(stamp), "snippets": snippets, "rows": [lo, lo + len(snippets)]}
+            lo += len(snippets)
+        tf = np.ascontiguousarray(tf)
+        tf_name = f"tf-{zlib.crc32(tf.tobytes()):08x}.npy"
+        if not (d / tf_name).exists():
+            tmp = d / f"{tf_name}.{os.getpid()}.tmp"
+            with tmp.open("wb") as f:
+                np.save(f, tf)
+            os.replace(tmp, d / tf_name)
+        tmp = d / f"manifest.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps({"dim": DIM, "tf": tf_name, "rows": len(tf), "files": manifest}), encoding="utf-8")
+        os.replace(tmp, d / "manifest.json")
+        for old in d.glob("tf*.npy"):   # readers that already mapped an old file keep it open; POSIX unlink is safe
+            if old.name != tf_name:
+                old.unlink(missing_ok=True)
+
+    def refresh(self) -> "SeedIndex":
+        seed_dir, stamps = self._scan()
+        snap = self._snap
+        if snap.files and {n: e[0] for n, e in snap.files.items()} == stamps:
+            return self
+        with self._lock:
+            snap = self._snap   # another thread may have rebuilt while we waited
+            if snap.snippets and {n: e[0] for n, e in snap.files.items()} == stamps:
+                return self
+            files = dict(snap.files) if snap.files or seed_dir is None else self._load_persisted(seed_dir)
+            for name in list(files):
+                if name not in stamps:
+                    del files[name]
+            for name, stamp in stamps.items():
+                if name not in files or files[name][0] != stamp:
+                    snippets = _read_snippets(seed_dir / name)
+                    files[name] = (stamp, snippets, _hash_rows(snippets))
+            self.seed_dir = seed_dir
+            self._snap = self._build(seed_dir, files)
+        return self
+
+    def _build(self, seed_dir: Path | None, files: Dict) -> _Snapshot:
+        snippets = [s for _, sn, _ in files.values() for s in sn]
+        if not snippets:
+            snippets = list(_FALLBACK_SEEDS)
+            tf = _hash_rows(snippets)
+        else:
+            tf = np.vstack([np.asarray(rows) for _, sn, rows in files.values() if sn])
+            if PERSIST:
+                self._persist(seed_dir, files, tf)
+        df = np.count_nonzero(tf, axis=0).astype(np.float32)
+        idf = (np.log((1.0 + len(snippets)) / (1.0 + df)) + 1.0).astype(np.float32)
+        m = tf * idf
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        return _Snapshot(files, snippets, m / np.where(norms == 0, 1.0, norms), idf)
+
+    def fingerprint(self) -> str:
+        stamps = sorted((n, e[0]) for n, e in self._snap.files.items())
+        return f"{zlib.crc32(repr(stamps).encode('utf-8')):08x}"
+
+    @staticmethod
+    def _vector(snap: _Snapshot, query: str) -> np.ndarray:
+        q = _hash_rows([query])[0] * snap.idf
+        n = np.linalg.norm(q)
+        return q / n if n else q
+
+    def query_vector(self, query: str) -> np.ndarray:
+        return self._vector(self._snap, query)
+
+    def top_k(self, query: str | None, k: int) -> List[str]:
+        snap = self._snap
+        if not query or k <= 0 or len(snap.snippets) <= k:
+            return snap.snippets[:k]
+        q = self._vector(snap, query)
+        if not q.any():
+            return snap.snippets[:k]
+        scores = snap.matrix @ q
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.lexsort((idx, -scores[idx]))]   # best first, ties keep file order
+        return [snap.snippets[i] for i in idx]
+
+INDEX = SeedIndex()
+
+def build_query(kpis: Dict | None, asset_class: str | None = None) -> str:
+    if not kpis:
+        return asset_class or ""
+    words = [kpis.get("benchmark_name") or "", (asset_class or "").replace("_", " "), "market returns"]
+    r = kpis.get("benchmark_return_pct")
+    if r is not None:
+        words.append("rally gains advanced" if r > 0 else "decline losses sell-off")
+    if abs(kpis.get("vix_change") or 0) >= 2:
+        words.append("volatility")
+    bps = kpis.get("ten_year_change_bps")
+    if bps:
+        words.append("treasury yields rose" if bps > 0 else "treasury yields fell")
+    if kpis.get("inflation_series"):
+        words.append("inflation")
+    for s in (kpis.get("sector_leaders") or []) + (kpis.get("sector_laggards") or []):
+        words.append(SECTOR_TERMS.get(s, s))
+    if kpis.get("eps_growth_pct") is not None:
+        words.append("earnings")
+    return " ".join(w for w in words if w)
+
 def _load_seed_texts() -> List[str]:
-    p = _seed_dir()
-    if not p:
-        return _FALLBACK_SEEDS
-    seeds: List[str] = []
-    for f in sorted(p.glob("*.txt")):
-        txt = f.read_text(encoding="utf-8").strip()
-        if txt:
-            # split on newlines so multiple snippets per file are respected
-            for line in txt.splitlines():
-                s = _strip_numbers(line.strip())
-                if s:
-                    seeds.append(s)
-    return seeds or _FALLBACK_SEEDS
-
-def get_style_exemplars(k: int = 2) -> List[str]:
-    seeds = _load_seed_texts()
-    return seeds[:k]
+    return INDEX.refresh().snippets
+
+def get_style_exemplars(k: int = 2, query: str | None = None) -> List[str]:
+    return INDEX.refresh().top_k(query, k)
@@ -0,0 +1,101 @@
+import argparse, asyncio, json, os, random, time
+from dataclasses import dataclass, asdict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# OpenAI-compatible /v1/chat/completions stand-in for offline benchmarks. Latency is modelled as
+# time-to-first-token + completion_tokens / tokens_per_s; error_rate injects 429/500s the client has to retry.
+
+_WORDS = ("The S&P 500 Total Return returned 3.2% over the period as equities advanced alongside easing volatility "
+          "while Treasury yields moved modestly and inflation continued to cool across the month ").split()
+
+@dataclass
+class FakeConfig:
+
+    ttft_ms: float = float(os.getenv("FAKE_LLM_TTFT_MS", "300"))
+    tokens_per_s: float = float(os.getenv("FAKE_LLM_TOKENS_PER_S", "80"))
+    completion_tokens: int = int(os.getenv("FAKE_LLM_COMPLETION_TOKENS", "240"))
+    error_rate: float = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+    seed: int | None = None
+
+def _text(n: int) -> str:
+    return " ".join(_WORDS[i % len(_WORDS)] for i in range(n))
+
+def _prompt_tokens(body: dict) -> int:
+    # ~4 chars per token is close enough for cost accounting in benchmarks
+    return max(1, sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4)
+
+def _chunk(model: str, delta: dict, finish: str | None = None, usage: dict | None = None) -> str:
+    choices = [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish}]
+    return "data: " + json.dumps({"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                                  "model": model, "choices": choices, "usage": usage}) + "\n\n"
+
+def create_app(config: FakeConfig | None = None) -> FastAPI:
+
+    cfg = config or FakeConfig()
+    rng = random.Random(cfg.seed)
+    app = FastAPI()
+    app.state.config, app.state.calls = cfg, 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+
+        body = await request.json()
+        app.state.calls += 1
+        if cfg.error_rate and rng.random() < cfg.error_rate:
+            status = rng.choice([429, 500])
+            return JSONResponse({"error": {"message": "injected failure", "type": "fake_llm"}}, status_code=status,
+                                headers={"retry-after-ms": "50"})
+
+        model = body.get("model", "fake")
+        words = _text(cfg.completion_tokens).split(" ")
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": len(words),
+                 "total_tokens": _prompt_tokens(body) + len(words)}
+        per_token = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0.0
+
+        await asyncio.sleep(cfg.ttft_ms / 1000.0)
+        if body.get("stream"):
+            async def events():
+                yield _chunk(model, {"role": "assistant", "content": ""})
+                for i, w in enumerate(words):
+                    yield _chunk(model, {"content": w if i == 0 else " " + w})
+                    await asyncio.sleep(per_token)
+                yield _chunk(model, {}, finish="stop")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield _chunk(model, {}, usage=usage)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(per_token * len(words))
+        return {"id": "fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                "usage": usage}
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model"}]}
+
+    @app.get("/stats")
+    def stats():
+        return {"calls": app.state.calls, "config": asdict(cfg)}
+
+    return app
+
+def main():
+
+    ap = argparse.ArgumentParser(description="OpenAI-compatible fake LLM server for benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--ttft-ms", type=float, default=FakeConfig.ttft_ms)
+    ap.add_argument("--tokens-per-s", type=float, default=FakeConfig.tokens_per_s)
+    ap.add_argument("--completion-tokens", type=int, default=FakeConfig.completion_tokens)
+    ap.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    ap.add_argument("--seed", type=int, default=None)
+    a = ap.parse_args()
+
+    import uvicorn
+    cfg = FakeConfig(a.ttft_ms, a.tokens_per_s, a.completion_tokens, a.error_rate, a.seed)
+    uvicorn.run(create_app(cfg), host=a.host, port=a.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
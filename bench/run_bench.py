@@ -0,0 +1,188 @@
+import argparse, asyncio, json, os, platform, socket, subprocess, sys, threading, time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+import numpy as np
+
+# Offline load/latency benchmark: every backend, in-process through agent_router.agenerate ("router")
+# or through the FastAPI app over an ASGI transport ("http"), against bench/fake_llm.py.
+#   python -m bench.run_bench --levels 1,4,16 --requests 32
+#   python -m bench.run_bench --compare bench/results/OLD.json bench/results/NEW.json
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench" / "results"
+BACKENDS = ["none", "crewai", "langchain", "langgraph"]
+BODY = {"as_of_period_end": "2025-06-30", "strategy_name": "NB US Equity Fund"}
+
+def summarize(latencies: List[float], errors: int, wall_s: float, concurrency: int) -> Dict:
+
+    lat = np.asarray(latencies, dtype=np.float64)
+    out = {"concurrency": concurrency, "requests": len(latencies) + errors, "errors": errors, "wall_s": round(wall_s, 4),
+           "throughput_rps": round(len(latencies) / wall_s, 3) if wall_s > 0 else 0.0}
+    if len(lat):
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        out.update({"mean_s": round(float(lat.mean()), 4), "p50_s": round(float(p50), 4), "p95_s": round(float(p95), 4),
+                    "p99_s": round(float(p99), 4), "max_s": round(float(lat.max()), 4)})
+    return out
+
+async def sweep_level(call: Callable[[], Awaitable[None]], requests: int, concurrency: int) -> Dict:
+
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await call()
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - t0, concurrency)
+
+def _start_fake(cfg) -> str:
+
+    import uvicorn
+    from bench.fake_llm import create_app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(cfg), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+def _caller(mode: str, backend: str, client) -> Callable[[], Awaitable[None]]:
+
+    from app.schemas import GenerateRequest
+    from app.agent_router import agenerate
+
+    if mode == "http":
+        async def call():
+            r = await client.post("/generate/market-context", json=BODY, params={"backend": backend})
+            r.raise_for_status()
+        return call
+
+    req = GenerateRequest(**BODY)
+    async def call():
+        await agenerate(req, override_backend=backend)
+    return call
+
+async def bench(backends: List[str], mode: str, levels: List[int], requests: int) -> Dict:
+
+    import httpx
+    from app import agent_router
+    from app.main import app
+
+    out: Dict[str, Dict] = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        for backend in backends:
+            report = agent_router.warm_up([backend]).get(backend, {})
+            if backend != "none" and backend not in agent_router._LOADED:
+                out[backend] = {"status": "skipped", "error": report.get("warm_error", "backend not enabled or not importable")}
+                continue
+            if "warm_error" in report:
+                out[backend] = {"status": "skipped", "error": report["warm_error"]}
+                continue
+
+            call = _caller(mode, backend, client)
+            t0 = time.perf_counter()
+            try:
+                await call()
+            except Exception as e:
+                out[backend] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                continue
+            entry = {"status": "ok", "import_s": report.get("import_s"), "warm_s": report.get("warm_s"),
+                     "first_call_s": round(time.perf_counter() - t0, 4), "levels": []}
+            for c in levels:
+                entry["levels"].append(await sweep_level(call, requests, c))
+                print(f"{backend:10s} c={c:<3d} {_fmt(entry['levels'][-1])}", file=sys.stderr)
+            out[backend] = entry
+    return out
+
+def _fmt(level: Dict) -> str:
+    if "p50_s" not in level:
+        return f"errors={level['errors']}"
+    return (f"p50={level['p50_s']:.3f}s p95={level['p95_s']:.3f}s p99={level['p99_s']:.3f}s "
+            f"rps={level['throughput_rps']:.2f} errors={level['errors']}")
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path: str, new_path: str) -> List[str]:
+
+    old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (old_path, new_path))
+    rows = [f"{'backend':10s} {'c':>3s} {'p50 old':>9s} {'p50 new':>9s} {'Δp50':>8s} {'p95 old':>9s} {'p95 new':>9s} {'Δp95':>8s}"]
+    for backend, n in new["results"].items():
+        o = old["results"].get(backend, {})
+        old_levels = {lv["concurrency"]: lv for lv in o.get("levels", [])}
+        for lv in n.get("levels", []):
+            ol = old_levels.get(lv["concurrency"])
+            if not ol or "p50_s" not in ol or "p50_s" not in lv:
+                continue
+            d50 = (lv["p50_s"] / ol["p50_s"] - 1) * 100 if ol["p50_s"] else 0.0
+            d95 = (lv["p95_s"] / ol["p95_s"] - 1) * 100 if ol["p95_s"] else 0.0
+            rows.append(f"{backend:10s} {lv['concurrency']:>3d} {ol['p50_s']:>9.4f} {lv['p50_s']:>9.4f} {d50:>+7.1f}% "
+                        f"{ol['p95_s']:>9.4f} {lv['p95_s']:>9.4f} {d95:>+7.1f}%")
+    return rows
+
+def main(argv: List[str] | None = None) -> int:
+
+    from bench.fake_llm import FakeConfig
+
+    ap = argparse.ArgumentParser(description="Offline latency/throughput benchmark for every backend")
+    ap.add_argument("--backends", default=",".join(BACKENDS))
+    ap.add_argument("--mode", choices=["router", "http"], default="router")
+    ap.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    ap.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    ap.add_argument("--ttft-ms", type=float, default=FakeConfig.ttft_ms)
+    ap.add_argument("--tokens-per-s", type=float, default=FakeConfig.tokens_per_s)
+    ap.add_argument("--completion-tokens", type=int, default=FakeConfig.completion_tokens)
+    ap.add_argument("--error-rate", type=float, default=FakeConfig.error_rate)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="result file (default bench/results/<commit>-<timestamp>.json)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="print p50/p95 deltas between two result files")
+    a = ap.parse_args(argv)
+
+    if a.compare:
+        print("\n".join(compare(*a.compare)))
+        return 0
+
+    cfg = FakeConfig(a.ttft_ms, a.tokens_per_s, a.completion_tokens, a.error_rate, a.seed)
+    # the app reads these on first use, so they must be set before anything under app/ is imported
+    os.environ.update({"OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": _start_fake(cfg), "MOCK": "true"})
+    os.environ.setdefault("GEN_CACHE", "false")
+    os.environ.setdefault("ENABLED_BACKENDS", ",".join(BACKENDS))
+
+    backends = [b.strip() for b in a.backends.split(",") if b.strip()]
+    levels = [int(x) for x in a.levels.split(",")]
+    results = asyncio.run(bench(backends, a.mode, levels, a.requests))
+
+    commit = _commit()
+    doc = {"meta": {"commit": commit, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "python": platform.python_version(), "platform": platform.platform(), "mode": a.mode,
+                    "levels": levels, "requests_per_level": a.requests, "fake_llm": cfg.__dict__,
+                    "gen_cache": os.environ["GEN_CACHE"]},
+           "results": results}
+
+    out = Path(a.out) if a.out else RESULTS_DIR / f"{commit or 'nogit'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2), encoding="utf-8")
+    print(out)
+    return 0
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(ROOT))
+    sys.exit(main())
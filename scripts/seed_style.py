@@ -1,6 +1,8 @@
 # scripts/seed_style.py
-import re, sys
+import argparse, hashlib, json, os, re, sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
 
 try:
     import pdfplumber
@@ -10,7 +12,7 @@ except ImportError:
 
 RAW_DIR  = Path("data/raw")      # put PDFs here
 SEED_DIR = Path("data/seeds")    # tone-only snippets will be written here
-SEED_DIR.mkdir(parents=True, exist_ok=True)
+MANIFEST = ".manifest.json"      # per-PDF content hash -> seed file; only new/changed PDFs are re-extracted
 
 SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z(])", re.MULTILINE)
 
@@ -20,6 +22,12 @@ BAN = re.compile(
     re.IGNORECASE,
 )
 
+# headings that open the section after "Market Context"; reading stops there
+SECTION_END = re.compile(
+    r"^\s*(portfolio (review|highlights|commentary|positioning)|performance (review|attribution|summary)|attribution|outlook)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
 def strip_numbers(s: str) -> str:
     s = re.sub(r"\b\d{1,4}(\.\d+)?%?\b", " ", s)          # raw numbers / percents
     s = re.sub(r"\b(?:19|20)\d{2}\b", " ", s)             # years
@@ -41,35 +49,142 @@ def extract_candidates(text: str):
     sentences = [clean_sentence(x) for x in SENTENCE_SPLIT.split(text) if len(x.split()) >= 8]
     return [s for s in sentences if not BAN.search(s)]
 
-def from_pdf(pdf_path: Path, max_snippets=5):
-    with pdfplumber.open(pdf_path) as pdf:
-        text = " ".join(page.extract_text() or "" for page in pdf.pages)
-    cands = extract_candidates(text)
+def _keep(sentences: Iterable[str], out: List[str], max_snippets: int) -> None:
     # de-number & keep compact sentences to capture cadence
-    out = []
-    for s in cands:
+    for x in sentences:
+        if len(out) >= max_snippets:
+            return
+        if len(x.split()) < 8:
+            continue
+        s = clean_sentence(x)
+        if BAN.search(s):
+            continue
         s2 = strip_numbers(s)
         if 8 <= len(s2.split()) <= 35:
             out.append(s2)
-        if len(out) >= max_snippets:
-            break
-    return out
+
+def snippets_from_pages(pages: Iterable[str], max_snippets: int = 5) -> List[str]:
+    # Streams page texts. The trailing partial sentence of each page carries over to the next, so page breaks
+    # split sentences exactly as the old join-everything version did. Before "Market Context" is seen, snippets
+    # are only a fallback; after it, reading stops at max_snippets or at the next section heading.
+
+    carry, fallback, section = "", [], None
+    for page in pages:
+        buf = f"{carry} {page}" if carry else page
+        if section is None:
+            i = buf.lower().find("market context")
+            if i >= 0:
+                section, buf = [], buf[i:]
+        if section is not None:
+            end = SECTION_END.search(buf, len("market context") if buf.lower().startswith("market context") else 0)
+            if end:
+                _keep(SENTENCE_SPLIT.split(buf[:end.start()]), section, max_snippets)
+                return section
+        parts = SENTENCE_SPLIT.split(buf)
+        carry = parts.pop()
+        _keep(parts, section if section is not None else fallback, max_snippets)
+        if section is not None and len(section) >= max_snippets:
+            return section
+    target = section if section is not None else fallback
+    _keep([carry], target, max_snippets)
+    return target
+
+def _pages(pdf_path: Path) -> Iterable[str]:
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            yield page.extract_text() or ""
+            page.close()   # drop the page's parsed objects before the next one
+
+def from_pdf(pdf_path: Path, max_snippets=5):
+    return snippets_from_pages(_pages(pdf_path), max_snippets)
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def atomic_write(path: Path, text: str) -> None:
+    # temp name doesn't end in .txt, so the API's seed index never picks up a partial file
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+def _extract(pdf_path: str) -> Tuple[str, List[str]]:
+    return pdf_path, from_pdf(Path(pdf_path))
+
+def _load_manifest(seed_dir: Path) -> Dict[str, Dict]:
+    try:
+        return json.loads((seed_dir / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def run(raw_dir: Path = RAW_DIR, seed_dir: Path = SEED_DIR, workers: int | None = None, force: bool = False) -> Dict[str, List[str]]:
+
+    seed_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(seed_dir)
+    report = {"written": [], "unchanged": [], "empty": [], "removed": []}
+
+    todo, current = [], {}
+    for pdf in sorted(raw_dir.glob("*.pdf")):
+        st = pdf.stat()
+        entry = manifest.get(pdf.name, {})
+        stamp = [st.st_mtime_ns, st.st_size]
+        # (mtime, size) match skips hashing; a touched-but-identical file is caught by the hash
+        digest = entry.get("sha256") if entry.get("stamp") == stamp else file_hash(pdf)
+        current[pdf.name] = {"sha256": digest, "stamp": stamp}
+        seed = seed_dir / (pdf.stem + ".txt")
+        if not force and entry.get("sha256") == digest and (seed.exists() or entry.get("snippets") == 0):
+            current[pdf.name].update({k: entry[k] for k in ("seed", "snippets") if k in entry})
+            report["unchanged"].append(pdf.name)
+        else:
+            todo.append(pdf)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=min(len(todo), workers or os.cpu_count() or 1)) as pool:
+            for fut in as_completed([pool.submit(_extract, str(p)) for p in todo]):
+                path, seeds = fut.result()
+                pdf = Path(path)
+                current[pdf.name]["snippets"] = len(seeds)
+                out = seed_dir / (pdf.stem + ".txt")
+                if not seeds:
+                    # a revised PDF that no longer yields snippets must not leave its old seeds in the index
+                    out.unlink(missing_ok=True)
+                    print(f"[warn] no suitable sentences found in {pdf.name}", file=sys.stderr)
+                    report["empty"].append(pdf.name)
+                    continue
+                text = "\n".join(seeds)
+                if not (out.exists() and out.read_text(encoding="utf-8") == text):
+                    atomic_write(out, text)
+                current[pdf.name]["seed"] = out.name
+                report["written"].append(pdf.name)
+                print(f"wrote {out} ({len(seeds)} snippets)")
+
+    # seeds generated from PDFs that have since been deleted; hand-written seeds are not in the manifest
+    for name, entry in manifest.items():
+        if name not in current and entry.get("seed"):
+            (seed_dir / entry["seed"]).unlink(missing_ok=True)
+            report["removed"].append(name)
+
+    atomic_write(seed_dir / MANIFEST, json.dumps(current, indent=2, sort_keys=True))
+    return report
 
 def main():
-    if not RAW_DIR.exists():
+    ap = argparse.ArgumentParser(description="Extract tone-only style seeds from commentary PDFs")
+    ap.add_argument("--raw", type=Path, default=RAW_DIR)
+    ap.add_argument("--seeds", type=Path, default=SEED_DIR)
+    ap.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    ap.add_argument("--force", action="store_true", help="re-extract every PDF, ignoring the manifest")
+    a = ap.parse_args()
+
+    if not a.raw.exists():
         print("Create data/raw and place your PDFs there.", file=sys.stderr)
         sys.exit(1)
-    any_written = False
-    for pdf in RAW_DIR.glob("*.pdf"):
-        seeds = from_pdf(pdf)
-        if not seeds:
-            print(f"[warn] no suitable sentences found in {pdf.name}", file=sys.stderr)
-            continue
-        out = SEED_DIR / (pdf.stem + ".txt")
-        out.write_text("\n".join(seeds), encoding="utf-8")
-        print(f"wrote {out} ({len(seeds)} snippets)")
-        any_written = True
-    if not any_written:
+    report = run(a.raw, a.seeds, a.workers, a.force)
+    print(f"{len(report['written'])} written, {len(report['unchanged'])} unchanged, "
+          f"{len(report['empty'])} empty, {len(report['removed'])} removed")
+    if not (report["written"] or report["unchanged"]):
         sys.exit(2)
 
 if __name__ == "__main__":
@@ -0,0 +1,19 @@
+import tempfile
+from pathlib import Path
+import pytest
+from app import gen_cache, jobs
+from app.gen_cache import GenerationCache
+from app.jobs import JobQueue
+from app.tools import kpi_cache
+from app.tools.kpi_cache import KPICache
+
+def pytest_sessionstart(session):
+    # some test modules load KPIs at import time, before any fixture runs
+    kpi_cache.CACHE = KPICache(Path(tempfile.mkdtemp(prefix="mc-tests-")) / "kpi_cache.sqlite")
+
+@pytest.fixture(autouse=True)
+def tmp_caches(tmp_path, monkeypatch):
+    # every test gets its own generation/KPI caches and job queue instead of the repo's .cache/*.sqlite
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen_cache.sqlite"))
+    monkeypatch.setattr(kpi_cache, "CACHE", KPICache(tmp_path / "kpi_cache.sqlite"))
+    monkeypatch.setattr(jobs, "QUEUE", JobQueue(tmp_path / "jobs.sqlite"))
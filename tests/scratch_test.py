@@ -1,5 +1,5 @@
 from app.schemas import GenerateRequest
-from app.agent_router import generate
+from app.agent_router import compare
 
 req = GenerateRequest(
     as_of_period_end="2025-06-30",
@@ -8,7 +8,8 @@ req = GenerateRequest(
     asset_class="equities",
 )
 
-for backend in ["none", "crewai", "langchain", "langgraph"]:
-    print(f"\n=== Backend: {backend} ===")
-    resp = generate(req, override_backend=backend)
-    print(resp.text, "\n")
+# KPIs and prompts are prepared once; the four backends run concurrently
+out = compare(req, ["none", "crewai", "langchain", "langgraph"])
+for r in out.results:
+    print(f"\n=== Backend: {r.backend} ({r.seconds}s, {r.prompt_tokens}+{r.completion_tokens} tokens) ===")
+    print(r.response.text if r.ok else r.error, "\n")
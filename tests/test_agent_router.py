@@ -0,0 +1,44 @@
+import sys
+from app import agent_router
+from app.schemas import GenerateRequest
+
+def test_disabled_backend_is_not_imported(monkeypatch):
+    monkeypatch.setenv("ENABLED_BACKENDS", "none")
+    assert agent_router.load_backend("crewai") is None
+    assert "app.agents.graph_crewai" not in sys.modules or "crewai" in agent_router._LOADED
+
+def test_unknown_backend_falls_back_to_baseline():
+    req = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB US Equity Fund")
+    resp = agent_router.generate(req, override_backend="does-not-exist")
+    assert "3.2%" in resp.text
+
+def test_warm_up_reports_failures_without_raising(monkeypatch):
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "broken": ".agents.does_not_exist"})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,broken")
+    report = agent_router.warm_up(["none", "broken"])
+    assert "warm_s" in report["none"] and "warm_error" in report["broken"]
+
+def test_async_baseline_matches_sync():
+    import asyncio
+    req = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB Genesis Fund")
+    sync_resp = agent_router.generate(req, override_backend="none")
+    async_resp = asyncio.run(agent_router.agenerate(req, override_backend="none"))
+    assert async_resp == sync_resp and async_resp.assumptions["benchmark_id"] == "R2000_TR"
+
+def test_router_lets_the_dag_fetch_kpis_alongside_the_seed_index(monkeypatch):
+    import asyncio, threading, time
+    from app import pipeline
+    from app.tools import retrieval
+    threads_seen, real, refresh = [], pipeline.load_kpis, retrieval.INDEX.refresh
+    def slow_kpis(*a):
+        threads_seen.append(threading.current_thread())
+        time.sleep(0.2)
+        return real(*a)
+    monkeypatch.setattr(pipeline, "load_kpis", slow_kpis)
+    monkeypatch.setattr(retrieval.INDEX, "refresh", lambda: time.sleep(0.2) or refresh())
+    req = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB Genesis Fund")
+
+    t0 = time.perf_counter()
+    asyncio.run(agent_router.agenerate(req, override_backend="none", use_cache=False))
+    assert time.perf_counter() - t0 < 0.35                       # serial would be 0.4s
+    assert len(threads_seen) == 1 and threads_seen[0] is not threading.main_thread()   # off the loop, fetched once
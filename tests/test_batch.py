@@ -0,0 +1,30 @@
+import json
+from fastapi.testclient import TestClient
+from app import agent_router
+from app.main import app
+
+def test_batch_dedupes_kpis_and_reports_failures(monkeypatch):
+    calls = []
+    real = agent_router.load_kpis
+
+    def counting(as_of, benchmark_id):
+        calls.append((as_of, benchmark_id))
+        if benchmark_id == "BAD":
+            raise RuntimeError("provider down")
+        return real(as_of, benchmark_id)
+
+    monkeypatch.setattr(agent_router, "load_kpis", counting)
+    items = [{"as_of_period_end": "2025-06-30", "strategy_name": "NB US Equity Fund"},
+             {"as_of_period_end": "2025-06-30", "strategy_name": "NB US Equity Fund - Class I"},
+             {"as_of_period_end": "2025-06-30", "strategy_name": "NB Genesis Fund"},
+             {"as_of_period_end": "2025-06-30", "strategy_name": "Broken", "benchmark_id": "BAD"}]
+
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context/batch", json={"items": items, "concurrency": 2})
+    lines = [json.loads(l) for l in r.text.splitlines()]
+
+    assert sorted(calls) == sorted({(c[0], c[1]) for c in calls}) and len(calls) == 3
+    results = {l["index"]: l for l in lines[:-1]}
+    assert results[0]["ok"] and results[2]["response"]["kpis"]["benchmark_name"] == "Russell 2000 Total Return"
+    assert not results[3]["ok"] and "provider down" in results[3]["error"]
+    assert lines[-1] == {"done": True, "total": 4, "succeeded": 3, "failed": 1}
@@ -0,0 +1,45 @@
+import asyncio, json
+from fastapi.testclient import TestClient
+from bench.fake_llm import FakeConfig, create_app
+from bench.run_bench import compare, summarize, sweep_level
+
+BODY = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "x" * 400}]}
+
+def test_fake_llm_usage_and_streaming():
+
+    c = TestClient(create_app(FakeConfig(ttft_ms=0, tokens_per_s=0, completion_tokens=10)))
+    r = c.post("/v1/chat/completions", json=BODY).json()
+    assert r["usage"] == {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+    assert len(r["choices"][0]["message"]["content"].split()) == 10
+
+    body = c.post("/v1/chat/completions", json={**BODY, "stream": True, "stream_options": {"include_usage": True}}).text
+    chunks = [json.loads(l[6:]) for l in body.splitlines() if l.startswith("data: {")]
+    text = "".join(ch["choices"][0]["delta"].get("content", "") for ch in chunks if ch["choices"])
+    assert text == r["choices"][0]["message"]["content"] and chunks[-1]["usage"]["completion_tokens"] == 10
+
+def test_fake_llm_error_injection():
+
+    c = TestClient(create_app(FakeConfig(ttft_ms=0, tokens_per_s=0, error_rate=1.0, seed=1)))
+    assert c.post("/v1/chat/completions", json=BODY).status_code in (429, 500)
+
+def test_sweep_reports_percentiles_and_errors():
+
+    calls = {"n": 0}
+    async def call():
+        calls["n"] += 1
+        if calls["n"] % 5 == 0:
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.001)
+
+    level = asyncio.run(sweep_level(call, requests=20, concurrency=4))
+    assert level["requests"] == 20 and level["errors"] == 4
+    assert level["p50_s"] <= level["p95_s"] <= level["p99_s"] <= level["max_s"]
+    assert summarize([], 3, 1.0, 1)["errors"] == 3
+
+def test_compare_reports_deltas(tmp_path):
+
+    def doc(p50):
+        return {"results": {"none": {"levels": [{"concurrency": 4, "p50_s": p50, "p95_s": p50 * 2}]}}}
+    old, new = tmp_path / "old.json", tmp_path / "new.json"
+    old.write_text(json.dumps(doc(0.2))); new.write_text(json.dumps(doc(0.3)))
+    assert "+50.0%" in compare(str(old), str(new))[1]
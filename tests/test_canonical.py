@@ -0,0 +1,95 @@
+import asyncio, threading
+from types import SimpleNamespace
+from app import agent_router, gen_cache, pipeline
+from app.gen_cache import GenerationCache
+from app.schemas import GenerateRequest
+from app.tools.kpi_compute import load_kpis
+
+KPIS = load_kpis("2025-06-30", "SPX_TR")
+DRAFT = ("The S&P 500 Total Return returned 3.2% in June. Equities advanced steadily through the month.\n\n"
+         "VIX ended at 14.1 and the 10-year yield rose 5 bps to 4.22%. Rates drifted without drama.\n\n"
+         "EPS grew 12.8% with 78.0% of companies beating.")
+
+def _req(name, **style):
+    return GenerateRequest(as_of_period_end="2025-06-30", strategy_name=name, benchmark_id="SPX_TR",
+                           asset_class="equities", style={"word_count_target": 240, **style})
+
+def test_specialization_renames_the_benchmark_and_trims_lowest_priority_sentences_first():
+
+    text, applied = pipeline.specialize(DRAFT, _req("SMA", benchmark_label="S&P 500 Index"), KPIS)
+    assert applied == ["benchmark_label"] and text == DRAFT.replace("S&P 500 Total Return", "S&P 500 Index")
+
+    text, applied = pipeline.specialize(DRAFT, _req("Fund", word_count_target=30), KPIS)
+    assert applied == ["word_count"] and "without drama" not in text and "through the month" not in text
+    assert "EPS" in text and text.count("\n\n") == 2           # fact-free sentences go before any fact
+
+    loose = DRAFT.replace(". ", ".  ") + "\n"                # within the default target: returned as written
+    assert pipeline.specialize(loose, _req("Fund"), KPIS) == (loose, [])
+    assert pipeline.specialize(DRAFT, _req("Fund", word_count_target=50), KPIS) == (DRAFT, [])
+
+    text, _ = pipeline.specialize(DRAFT, _req("Fund", word_count_target=5), KPIS)
+    assert text == "The S&P 500 Total Return returned 3.2% in June."   # the benchmark return always stays
+
+def _counting_backend(calls):
+    def run_graph(req, rs, kpis=None):
+        calls.append(rs)
+        threading.Event().wait(0.2)
+        return {"draft": DRAFT, "final_text": DRAFT, "kpis": KPIS}
+    async def arun_graph(req, rs, kpis=None):
+        return await asyncio.to_thread(run_graph, req, rs, kpis)
+    return SimpleNamespace(run_graph=run_graph, arun_graph=arun_graph)
+
+def test_strategies_on_one_benchmark_share_a_single_canonical_draft(tmp_path, monkeypatch):
+
+    calls = []
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen.sqlite"))
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "slow": ""})
+    monkeypatch.setattr(agent_router, "_LOADED", {"slow": _counting_backend(calls)})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,slow")
+
+    reqs = [_req("NB US Equity Fund"), _req("NB US Equity Fund - Class I"), _req("NB US Equity SMA", word_count_target=30),
+            _req("NB US Equity NBIF", benchmark_label="S&P 500 Index"), _req("NB US Equity Europe").model_copy(update={"region": "EU"})]
+    out = asyncio.run(_collect(agent_router.agenerate_batch(reqs, "slow")))
+    assert all(x.ok for x in out) and len(calls) == 2          # one draft for US, one for EU
+    texts = {x.strategy_name: x.response for x in out}
+    assert texts["NB US Equity Fund"].text == texts["NB US Equity Fund - Class I"].text == DRAFT
+    assert texts["NB US Equity SMA"].assumptions["specialized"] == "word_count"
+    assert "S&P 500 Index returned 3.2%" in texts["NB US Equity NBIF"].text
+
+    calls.clear()   # sync callers (job workers) coalesce too, and a finished draft is a cache hit
+    req = _req("NB US Equity Fund").model_copy(update={"region": "APAC"})
+    threads = [threading.Thread(target=agent_router.generate, args=(req, "slow")) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    agent_router.generate(_req("NB US Equity Fund - Class A"), "slow")
+    assert len(calls) == 1 and not agent_router.canonical_stats()["in_flight"]
+
+async def _collect(gen):
+    return [x async for x in gen]
+
+def test_a_cancelled_owner_or_closed_stream_hands_the_draft_to_the_next_caller(tmp_path, monkeypatch):
+
+    calls = []
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen.sqlite"))
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "slow": ""})
+    monkeypatch.setattr(agent_router, "_LOADED", {"slow": _counting_backend(calls)})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,slow")
+
+    async def go():
+        owner = asyncio.create_task(agent_router.agenerate(_req("Disconnects"), "slow"))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(agent_router.agenerate(_req("Waits"), "slow"))
+        await asyncio.sleep(0.05)
+        owner.cancel()
+        return await waiter
+    assert asyncio.run(go()).text == DRAFT and len(calls) == 2   # the waiter re-claimed and wrote it
+    assert not agent_router.canonical_stats()["in_flight"]
+
+    async def closed_early():
+        stream = agent_router.astream_generate(_req("Streams").model_copy(update={"region": "EU"}), "none")
+        await stream.asend(None)   # first token, then the client goes away
+        await stream.aclose()
+    asyncio.run(closed_early())
+    assert not agent_router.canonical_stats()["in_flight"]
@@ -0,0 +1,60 @@
+import asyncio, json, time
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app import agent_router, pipeline
+from app.main import app
+from app.schemas import GenerateRequest
+
+REQ = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB US Equity Fund")
+
+def _slow_backend(seen):
+    async def arun_graph(req, rs, kpis=None):
+        pre = await pipeline.aprepare(req, rs, kpis)
+        seen.append(pre["writer_render"])
+        await asyncio.sleep(0.3)   # the backend-specific LLM stages
+        return {"draft": "d", "final_text": f"{len(seen)}", "kpis": pre["kpis"]}
+    return SimpleNamespace(arun_graph=arun_graph)
+
+def test_backends_share_one_preparation_and_run_concurrently(monkeypatch):
+
+    seen, calls = [], []
+    real = pipeline.load_kpis
+    monkeypatch.setattr(pipeline, "load_kpis", lambda *a: calls.append(a) or real(*a))
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "a": "", "b": "", "c": ""})
+    monkeypatch.setattr(agent_router, "_LOADED", {n: _slow_backend(seen) for n in "abc"})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,a,b,c")
+
+    t0 = time.perf_counter()
+    out = agent_router.compare(REQ, ["a", "b", "c", "none", "disabled"], use_cache=False)
+    assert time.perf_counter() - t0 < 0.6                       # serial would be 0.9s
+    assert [r.backend for r in out.results] == ["a", "b", "c", "none"] and all(r.ok for r in out.results)
+    assert len(calls) == 1 and len(seen) == 3 and seen[0] is seen[1] is seen[2]   # prompts rendered once
+    assert all(r.response.kpis == out.kpis for r in out.results)
+
+def test_failures_are_reported_per_backend_and_the_api_returns_all_texts(monkeypatch):
+
+    async def broken(req, rs, kpis=None):
+        raise RuntimeError("provider down")
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "broken": ""})
+    monkeypatch.setattr(agent_router, "_LOADED", {"broken": SimpleNamespace(arun_graph=broken)})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,broken")
+
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context?backends=none,broken&cache=false&trace=true", json=REQ.model_dump(mode="json"))
+    results = {x["backend"]: x for x in r.json()["results"]}
+    assert r.status_code == 200 and results["none"]["ok"] and "S&P 500" in results["none"]["response"]["text"]
+    assert not results["broken"]["ok"] and results["broken"]["error"] == "RuntimeError: provider down"
+    assert r.json()["kpis"]["benchmark_name"] == results["none"]["response"]["kpis"]["benchmark_name"]
+    timings = json.loads(results["none"]["response"]["assumptions"]["timings"])   # trace applies per result
+    assert timings["backend"] == "none" and "specialize" in {s["stage"] for s in timings["stages"]}
+
+def test_an_unimportable_backend_is_reported_in_its_own_result(monkeypatch):
+
+    monkeypatch.setattr(agent_router, "BACKENDS", {**agent_router.BACKENDS, "missing": ".agents.not_installed"})
+    monkeypatch.setattr(agent_router, "_LOADED", {})
+    monkeypatch.setenv("ENABLED_BACKENDS", "none,missing")
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context?backends=none,missing&cache=false", json=REQ.model_dump(mode="json"))
+    results = {x["backend"]: x for x in r.json()["results"]}
+    assert r.status_code == 200 and results["none"]["ok"]
+    assert not results["missing"]["ok"] and results["missing"]["error"].startswith("ModuleNotFoundError")
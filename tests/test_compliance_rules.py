@@ -0,0 +1,25 @@
+from app.tools.compliance_rules import verify, unmatched_numbers
+
+KPIS = {"benchmark_name": "S&P 500 Total Return", "benchmark_return_pct": 3.2, "vix_end": 14.1, "vix_change": 0.6,
+        "ten_year_yield": 4.22, "ten_year_change_bps": 5, "inflation_series": "CPI YoY", "inflation_yoy_pct": 3.0,
+        "eps_growth_pct": 12.8, "eps_beat_rate_pct": 78.0}
+
+def test_numbers_match_within_formatting_tolerance():
+    text = ("In June 2025 the S&P 500 Total Return returned 3.20%. The 10-year yield rose 5 bps, or 0.05%, to 4.22%; "
+            "the VIX ended at 14.1. CPI YoY was 3% and EPS growth 12.8% on a 78% beat rate (as of 2025-06-30).")
+    assert unmatched_numbers(text, KPIS, "2025-06-30") == []
+    assert unmatched_numbers("The index returned 3.5% while yields rose 7 bps.", KPIS) == ["3.5%", "7 bps"]
+
+def test_labels_are_skipped_but_magnitudes_and_multiples_are_checked():
+    labels = "The 10-year and 2Y yields rose for the 3rd month; the 30-years bond lagged."
+    assert unmatched_numbers(labels, KPIS) == []
+    text = "Funds took in $45bn as stocks traded at 21x earnings, above the 200-day average, with $1.2tn in buybacks."
+    assert unmatched_numbers(text, KPIS) == ["45bn", "21x", "200-day", "1.2tn"]
+
+def test_scope_length_and_coverage():
+    found = {v.kind for v in verify("We believe the portfolio is positioned to outperform.", KPIS)}
+    assert found == {"scope", "length", "coverage"}
+
+def test_clean_draft_has_no_violations():
+    body = "The S&P 500 Total Return returned 3.2% over the month as markets advanced steadily. " * 14
+    assert verify(body, KPIS, "2025-06-30") == []
@@ -0,0 +1,63 @@
+import asyncio, time
+import pytest
+from app.dag import DAG, Stage
+from app import pipeline, telemetry
+from app.schemas import GenerateRequest
+
+def _sleep(value, s=0.2):
+    def fn(r):
+        time.sleep(s)
+        return value
+    return fn
+
+GRAPH = DAG([
+    Stage("a", _sleep(1)),
+    Stage("b", _sleep(2)),
+    Stage("c", _sleep(3)),
+    Stage("sum", lambda r: r["a"] + r["b"] + r["c"] + r["x"], deps=("a", "b", "c", "x"), inline=True),
+])
+
+def test_independent_stages_overlap_sync_and_async():
+
+    t0 = time.perf_counter()
+    assert GRAPH.run({"x": 10})["sum"] == 16
+    assert time.perf_counter() - t0 < 0.45   # sequential would be 0.6s
+
+    t0 = time.perf_counter()
+    assert asyncio.run(GRAPH.arun({"x": 10}))["sum"] == 16
+    assert time.perf_counter() - t0 < 0.45
+
+def test_inputs_skip_stages_and_missing_inputs_fail():
+
+    t0 = time.perf_counter()
+    assert GRAPH.run({"x": 0, "a": 0, "b": 0, "c": 5})["sum"] == 5
+    assert time.perf_counter() - t0 < 0.1
+    with pytest.raises(KeyError):
+        GRAPH.run({})
+
+def test_timeouts_fall_back_or_raise():
+
+    soft = DAG([Stage("slow", _sleep("late", 0.5), timeout_s=0.05, fallback=lambda r: "fallback"),
+                Stage("out", lambda r: r["slow"], deps=("slow",), inline=True)])
+    assert soft.run({})["out"] == "fallback"
+    assert asyncio.run(soft.arun({}))["out"] == "fallback"
+
+    hard = DAG([Stage("slow", _sleep("late", 0.5), timeout_s=0.05)])
+    with pytest.raises(TimeoutError):
+        hard.run({})
+    with pytest.raises(TimeoutError):
+        asyncio.run(hard.arun({}))
+
+def test_cycles_are_rejected():
+
+    with pytest.raises(ValueError):
+        DAG([Stage("a", lambda r: 1, deps=("b",)), Stage("b", lambda r: 1, deps=("a",))])
+
+def test_pre_llm_stages_record_into_the_request_trace():
+
+    req = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB US Equity Fund")
+    rs = pipeline.resolve_strategy(req)
+    with telemetry.request("none") as t:
+        pre = pipeline.prepare(req, rs)
+    assert pre["kpis"]["benchmark_return_pct"] == 3.2 and "3.2" in pre["writer_render"].user
+    assert {"kpis", "seed_index", "templates", "exemplars", "planner_render", "writer_render"} == {s["stage"] for s in t.stages}
@@ -0,0 +1,50 @@
+from app import gen_cache
+from app.gen_cache import GenerationCache, cache_key
+
+RS = {"benchmark_id": "SPX_TR", "asset_class": "equities"}
+KPIS = {"benchmark_name": "S&P 500 Total Return", "benchmark_return_pct": 3.2}
+
+def test_key_tracks_inputs_that_shape_the_output(monkeypatch):
+    base = cache_key("langgraph", "2025-06-30", RS, KPIS)
+    assert base == cache_key("langgraph", "2025-06-30", RS, dict(reversed(list(KPIS.items()))))
+    assert base != cache_key("langchain", "2025-06-30", RS, KPIS)
+    assert base != cache_key("langgraph", "2025-06-30", RS, {**KPIS, "benchmark_return_pct": 3.3})
+
+    monkeypatch.setenv("OPENAI_MODEL", "another-model")
+    assert base != cache_key("langgraph", "2025-06-30", RS, KPIS)
+    monkeypatch.delenv("OPENAI_MODEL")
+    monkeypatch.setenv("OPENAI_API_KEY", "x")   # a configured model must not be answered by the template stub
+    keyed = cache_key("langgraph", "2025-06-30", RS, KPIS)
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:8765/v1")
+    assert len({base, keyed, cache_key("langgraph", "2025-06-30", RS, KPIS)}) == 3
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.delenv("OPENAI_BASE_URL")
+    monkeypatch.setattr(gen_cache, "_prompt_hash", lambda name: "edited" if name == "writer" else "")
+    assert base != cache_key("langgraph", "2025-06-30", RS, KPIS)
+
+def test_store_round_trips_and_evicts_lru(tmp_path):
+    cache = GenerationCache(tmp_path / "gen.sqlite", max_bytes=400)
+    art = {"draft": "d" * 40, "final_text": "f" * 40, "kpis": KPIS}
+    cache.put("a", art); cache.put("b", art)
+    assert cache.get("a") == art          # touches "a", so "b" is now least recently used
+    cache.put("c", art)
+    assert cache.has("a") and cache.has("c") and not cache.has("b")
+    assert cache.stats()["evictions"] == 1
+
+def test_async_router_reads_and_writes_the_cache_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio, threading
+    from app import agent_router
+    from app.schemas import GenerateRequest
+    threads, store = [], GenerationCache(tmp_path / "gen.sqlite")
+    class Recording:
+        def get(self, key):
+            threads.append(threading.current_thread())
+            return store.get(key)
+        def put(self, key, value):
+            threads.append(threading.current_thread())
+            store.put(key, value)
+    monkeypatch.setattr(gen_cache, "CACHE", Recording())
+    req = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB US Equity Fund")
+    for _ in range(2):   # a miss that writes, then a hit
+        asyncio.run(agent_router.agenerate(req, override_backend="none"))
+    assert len(threads) == 3 and threading.main_thread() not in threads
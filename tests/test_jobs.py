@@ -0,0 +1,68 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import jobs
+from app.jobs import IdempotencyConflict, JobQueue, QueueFull
+from app.main import app
+from app.schemas import GenerateRequest
+
+def _req(name="NB Genesis Fund"):
+    return GenerateRequest(as_of_period_end="2025-06-30", strategy_name=name)
+
+def test_priorities_idempotency_and_admission_control(tmp_path):
+
+    q = JobQueue(tmp_path / "jobs.sqlite", max_queued=3)
+    low, _ = q.submit(_req(), "none", "low")
+    normal, _ = q.submit(_req("NB US Equity Fund"), "none", idempotency_key="k1")
+    high, _ = q.submit(_req(), "none", "high")
+    assert q.get(low["id"])["position"] == 2 and q.get(high["id"])["position"] == 0
+
+    again, created = q.submit(_req("NB US Equity Fund"), "none", idempotency_key="k1")
+    assert not created and again["id"] == normal["id"]
+    with pytest.raises(IdempotencyConflict):
+        q.submit(_req(), "none", idempotency_key="k1")
+    with pytest.raises(QueueFull) as full:
+        q.submit(_req(), "none")
+    assert full.value.retry_after_s >= 1
+
+    assert [q.claim("w")["id"] for _ in range(3)] == [high["id"], normal["id"], low["id"]]
+    assert q.claim("w") is None
+    assert q.stats()["running"] == 3 and q.stats()["rejected"] == 1 and q.stats()["deduplicated"] == 1
+
+def test_jobs_of_a_dead_worker_are_claimed_again_until_attempts_run_out(tmp_path):
+
+    q = JobQueue(tmp_path / "jobs.sqlite", lease_s=0.05, max_attempts=2)
+    job, _ = q.submit(_req(), "none")
+    assert q.claim("a")["attempts"] == 1 and q.claim("b") is None   # lease still held
+
+    time.sleep(0.1)                                                    # "a" died without renewing
+    assert q.claim("b")["attempts"] == 2
+    assert not q.finish(job["id"], "a", response={"late": True})       # the stale worker can't overwrite
+    time.sleep(0.1)
+    assert q.claim("c") is None and q.get(job["id"])["status"] == "failed"
+
+    job, _ = q.submit(_req(), "none")
+    q.claim("a")
+    assert q.renew(job["id"], "a") and q.finish(job["id"], "a", error="ValueError: bad")
+    assert q.get(job["id"])["status"] == "failed" and q.get(job["id"])["error"] == "ValueError: bad"
+
+def test_submit_returns_immediately_and_workers_fill_in_the_result(tmp_path, monkeypatch):
+
+    q = JobQueue(tmp_path / "jobs.sqlite")
+    monkeypatch.setattr(jobs, "QUEUE", q)
+    with TestClient(app) as c:
+        r = c.post("/jobs/market-context?backend=none", json=_req().model_dump(mode="json"), headers={"Idempotency-Key": "abc"})
+        assert r.status_code == 202 and r.json()["status"] == "queued" and r.json()["position"] == 0
+        job_id = r.json()["id"]
+        assert c.post("/jobs/market-context?backend=none", json=_req().model_dump(mode="json"),
+                      headers={"Idempotency-Key": "abc"}).json()["id"] == job_id
+
+        stop, _ = jobs.start_threads(2, q)
+        deadline = time.time() + 10
+        while c.get(f"/jobs/{job_id}").json()["status"] in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.05)
+        stop.set()
+        done = c.get(f"/jobs/{job_id}").json()
+        assert c.get("/jobs/nope").status_code == 404 and c.get("/jobs").json()["done"] == 1
+
+    assert done["status"] == "done" and done["attempts"] == 1 and "Russell 2000" in done["response"]["text"]
@@ -0,0 +1,63 @@
+import time
+from datetime import date
+from app.tools.kpi_cache import KPICache
+
+AS_OF = date(2025, 6, 30)
+
+def _loader(calls, fail=False, delay=0.0):
+    def load(as_of, benchmark_id):
+        calls.append(benchmark_id)
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("provider down")
+        return {"benchmark_name": benchmark_id, "benchmark_return_pct": 3.2}
+    return load
+
+def test_memory_then_disk_hits(tmp_path):
+    calls = []
+    cache = KPICache(tmp_path / "kpis.sqlite", ttl_s=60)
+    assert cache.get(AS_OF, "SPX_TR", _loader(calls))["benchmark_return_pct"] == 3.2
+    cache.get(AS_OF, "SPX_TR", _loader(calls))
+
+    other_worker = KPICache(tmp_path / "kpis.sqlite", ttl_s=60)
+    other_worker.get(AS_OF, "SPX_TR", _loader(calls))
+    assert calls == ["SPX_TR"]
+    assert cache.stats()["memory_hits"] == 1 and other_worker.stats()["disk_hits"] == 1
+
+def test_invalidate_reaches_other_workers(tmp_path):
+    calls = []
+    a, b = KPICache(tmp_path / "kpis.sqlite"), KPICache(tmp_path / "kpis.sqlite")
+    a.get(AS_OF, "SPX_TR", _loader(calls)); b.get(AS_OF, "SPX_TR", _loader(calls))
+    assert a.invalidate(benchmark_id="SPX_TR") == 1
+    b.get(AS_OF, "SPX_TR", _loader(calls))
+    assert calls == ["SPX_TR", "SPX_TR"]
+
+def test_stale_value_served_when_provider_fails_or_is_slow(tmp_path):
+    calls = []
+    cache = KPICache(tmp_path / "kpis.sqlite", ttl_s=0, disk_ttl_s=1e-9, fetch_timeout_s=0.05)
+    cache.get(AS_OF, "SPX_TR", _loader(calls))
+    assert cache.get(AS_OF, "SPX_TR", _loader(calls, fail=True))["benchmark_name"] == "SPX_TR"
+    assert cache.get(AS_OF, "SPX_TR", _loader(calls, delay=0.5))["benchmark_name"] == "SPX_TR"
+    assert cache.stats()["stale_served"] == 2
+    try:
+        cache.get(AS_OF, "R2000_TR", _loader(calls, fail=True))
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected the provider error without a cached copy")
+
+def test_entries_are_kept_apart_by_source_and_expire_on_disk(tmp_path):
+    calls = []
+    cache = KPICache(tmp_path / "kpis.sqlite", ttl_s=0)
+    cache.get(AS_OF, "SPX_TR", _loader(calls), "mock")
+    try:
+        cache.get(AS_OF, "SPX_TR", _loader(calls, fail=True), "providers")
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("mock KPIs must not answer for a live provider")
+    assert KPICache(tmp_path / "kpis.sqlite").disk_ttl_s > 0
+
+    expiring = KPICache(tmp_path / "kpis.sqlite", ttl_s=0, disk_ttl_s=1e-9)
+    expiring.get(AS_OF, "SPX_TR", _loader(calls), "mock")
+    assert calls == ["SPX_TR", "SPX_TR", "SPX_TR"]
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import date
+from app.tools import data_fetchers, kpi_compute
+from app.tools.kpi_compute import KPIEngine, normalize_kpis
+
+def _prices():
+    idx = pd.date_range("2024-01-01", "2025-06-30", freq="B")
+    t = np.arange(len(idx), dtype=float)
+    return pd.DataFrame({
+        "SPX_TR": 100 * np.exp(0.0004 * t), "R2000_TR": 100 * np.exp(-0.0002 * t),
+        "XLK": 50 * np.exp(0.0010 * t), "XLE": 50 * np.exp(0.0005 * t), "XLU": 50 * np.exp(-0.0005 * t), "XLRE": 50 * np.exp(-0.0010 * t),
+        "VIX": 15 + 0.01 * t, "US10Y": 4.0 + 0.001 * t, "CPI": 300 * np.exp(0.0001 * t),
+    }, index=idx)
+
+def test_engine_period_returns_match_direct_computation():
+    px = _prices()
+    engine = KPIEngine(px)
+    k = engine.lookup(date(2025, 6, 30), "SPX_TR")
+    month_end = px.resample("ME").last()
+    expected = (month_end["SPX_TR"].iloc[-1] / month_end["SPX_TR"].iloc[-2] - 1) * 100
+    assert np.isclose(k["benchmark_return_pct"], expected)
+    assert k["sector_leaders"] == ["InfoTech", "Energy"] and k["sector_laggards"] == ["RealEstate", "Utilities"]
+    assert np.isclose(k["ten_year_change_bps"], (month_end["US10Y"].iloc[-1] - month_end["US10Y"].iloc[-2]) * 100)
+    assert k["inflation_series"] == "CPI YoY" and k["eps_growth_pct"] is None
+
+    q = engine.lookup(date(2025, 6, 30), "SPX_TR", "Q")
+    assert q["benchmark_return_pct"] > k["benchmark_return_pct"] > 0
+
+def test_engine_rejects_periods_without_history():
+    engine = KPIEngine(_prices())
+    for as_of in (date(2024, 1, 31), date(2030, 1, 31)):
+        try:
+            engine.lookup(as_of, "SPX_TR")
+        except KeyError:
+            continue
+        raise AssertionError(f"expected KeyError for {as_of}")
+
+def test_normalize_rounds_and_coerces():
+    out = normalize_kpis({"benchmark_return_pct": 3.21456, "ten_year_change_bps": 4.6, "vix_end": None})
+    assert out == {"benchmark_return_pct": 3.21, "ten_year_change_bps": 5, "vix_end": None}
+
+def test_no_enabled_source_is_a_configuration_error(tmp_path, monkeypatch):
+    monkeypatch.setenv("MOCK", "false")
+    monkeypatch.setenv("KPI_PROVIDERS", "false")
+    monkeypatch.setattr(kpi_compute, "HISTORY_DIR", tmp_path)
+    with pytest.raises(data_fetchers.NoKPISource, match="KPI_PROVIDERS=true"):
+        data_fetchers.fetch_kpis(date(2025, 6, 30), "SPX_TR")
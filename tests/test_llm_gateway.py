@@ -0,0 +1,91 @@
+import asyncio, json
+import httpx
+import pytest
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from app import llm_gateway
+from app.llm_gateway import AsyncGatewayTransport, Gateway, GatewayTransport, RateLimiter
+from bench.fake_llm import FakeConfig, create_app
+
+BODY = {"model": "fake", "messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+
+def _completion(content: str = "ok") -> dict:
+    return {"id": "x", "object": "chat.completion", "created": 0, "model": "fake",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+
+def test_buckets_limit_requests_and_tokens_and_keep_a_reserve_for_interactive():
+
+    limiter = RateLimiter(rpm=10, tpm=10 ** 6, batch_reserve=0.5)
+    assert [limiter.try_acquire("batch", 10) for _ in range(5)] == [0.0] * 5
+    assert limiter.try_acquire("batch", 10) > 0           # batch stops at the reserve
+    assert [limiter.try_acquire("interactive", 10) for _ in range(5)] == [0.0] * 5
+    assert limiter.try_acquire("interactive", 10) == pytest.approx(6.0, abs=0.1)   # 1 request / 6s refill
+
+    tokens = RateLimiter(rpm=1000, tpm=600)
+    assert tokens.try_acquire("interactive", 500) == 0.0
+    assert tokens.try_acquire("interactive", 500) == pytest.approx(40.0, abs=0.5)
+    tokens.settle(500, 50)                                 # the call used far fewer tokens than estimated
+    assert tokens.try_acquire("interactive", 500) == 0.0
+
+    tokens.waiting["interactive"] = 1
+    assert tokens.try_acquire("batch", 1) > 0   # batch yields while interactive calls queue
+
+def test_retries_honour_retry_after_and_sync_to_provider_headers():
+
+    calls = []
+    def handler(request):
+        calls.append(json.loads(request.content))
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"retry-after-ms": "1"}, json={"error": {"message": "slow down"}})
+        return httpx.Response(200, headers={"x-ratelimit-remaining-requests": "7"}, json=_completion())
+
+    gw = Gateway(RateLimiter(rpm=100, tpm=10 ** 6), max_retries=3)
+    client = OpenAI(api_key="x", base_url="http://llm/v1", max_retries=0,
+                    http_client=httpx.Client(transport=GatewayTransport(gw, inner=httpx.MockTransport(handler))))
+    out = client.chat.completions.create(**BODY)
+
+    assert out.choices[0].message.content == "ok" and len(calls) == 3
+    assert gw.counters["retries"] == 2 and gw.limiter.requests.level <= 7
+
+    gw.max_retries = 0
+    calls.clear()
+    with pytest.raises(RateLimitError):       # out of retries: the SDK sees the provider's 429
+        client.chat.completions.create(**BODY)
+
+def test_hedge_fires_after_delay_and_first_response_wins():
+
+    seen = []
+    async def handler(request):
+        seen.append(len(seen))
+        await asyncio.sleep(1.0 if len(seen) == 1 else 0.0)   # the first attempt is the straggler
+        return httpx.Response(200, json=_completion(f"attempt {len(seen)}"))
+
+    gw = Gateway(RateLimiter(rpm=100, tpm=10 ** 6), hedge=True, hedge_after_s=0.05)
+
+    async def go():
+        async with httpx.AsyncClient(transport=AsyncGatewayTransport(gw, inner=httpx.MockTransport(handler))) as c:
+            return await c.post("http://llm/v1/chat/completions", json=BODY)
+
+    r = asyncio.run(go())
+    assert r.json()["choices"][0]["message"]["content"] == "attempt 2"
+    assert gw.counters["hedges"] == 1 and gw.counters["hedge_wins"] == 1 and len(seen) == 2
+
+    # streams are never hedged; non-completion calls bypass the scheduler
+    assert llm_gateway._inspect(httpx.Request("POST", "http://llm/v1/chat/completions", json={**BODY, "stream": True}))[1]
+    assert not llm_gateway._inspect(httpx.Request("GET", "http://llm/v1/models"))[0]
+
+def test_fake_server_with_injected_failures_completes_every_call():
+
+    app = create_app(FakeConfig(ttft_ms=1, tokens_per_s=0, completion_tokens=8, error_rate=0.3, seed=7))
+    gw = Gateway(RateLimiter(rpm=1000, tpm=10 ** 6), max_retries=6, backoff_s=0.001)
+
+    async def go():
+        client = AsyncOpenAI(api_key="x", base_url="http://fake/v1", max_retries=0,
+                             http_client=httpx.AsyncClient(transport=AsyncGatewayTransport(gw, inner=httpx.ASGITransport(app=app))))
+        with llm_gateway.lane("batch"):
+            return await asyncio.gather(*(client.chat.completions.create(**BODY) for _ in range(20)))
+
+    results = asyncio.run(go())
+    assert len(results) == 20 and all(r.choices[0].message.content for r in results)
+    assert gw.counters["retries"] > 0 and app.state.calls == 20 + gw.counters["retries"]
+    assert len(gw.latencies["batch"]) == 20 and not gw.latencies["interactive"]
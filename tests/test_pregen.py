@@ -0,0 +1,58 @@
+import asyncio
+from datetime import date
+from fastapi.testclient import TestClient
+from app import gen_cache, pregen
+from app.gen_cache import GenerationCache
+from app.main import app
+from app.strategy_defaults import STRATEGY_DEFAULTS
+
+PERIOD = date(2025, 6, 30)
+
+def test_latest_period_is_the_last_closed_month_or_quarter():
+
+    assert pregen.latest_period(date(2025, 7, 15)) == PERIOD
+    assert pregen.latest_period(date(2025, 6, 30)) == date(2025, 5, 31)   # the period end itself hasn't closed
+    assert pregen.latest_period(date(2025, 8, 2), "Q") == PERIOD
+
+def test_run_warms_every_strategy_and_generate_becomes_a_lookup(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen.sqlite"))
+    assert pregen.status(PERIOD, ["none"])["cold"] == len(STRATEGY_DEFAULTS)
+
+    report = asyncio.run(pregen.arun(PERIOD, ["none"]))
+    assert report["generated"] == len(STRATEGY_DEFAULTS) and not report["failed"]
+    st = pregen.status(PERIOD, ["none"])
+    assert st["coverage_pct"] == 100.0 and st["kpis_ready"] and st["last_run"] == report
+    assert asyncio.run(pregen.arun(PERIOD, ["none"]))["skipped"] == len(STRATEGY_DEFAULTS)
+
+    hits = gen_cache.CACHE.counters["hits"]
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context?backend=none",
+                   json={"as_of_period_end": str(PERIOD), "strategy_name": "NB Genesis Fund"})
+        coverage = c.get("/pregen/status", params={"as_of_period_end": str(PERIOD), "backends": "none"}).json()
+    assert r.status_code == 200 and gen_cache.CACHE.counters["hits"] == hits + 1
+    assert coverage["strategies"]["NB Genesis Fund"] == {"none": "warm"}
+
+def test_strategies_without_kpis_stay_pending(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen.sqlite"))
+    real = pregen.load_kpis
+    def landed(as_of, benchmark_id):
+        if benchmark_id == "R2000_TR":
+            raise KeyError("No history for R2000_TR")
+        return real(as_of, benchmark_id)
+    monkeypatch.setattr(pregen, "load_kpis", landed)
+
+    report = asyncio.run(pregen.arun(PERIOD, ["none"]))
+    st = pregen.status(PERIOD, ["none"])
+    assert report["pending"] == 1 and report["generated"] == len(STRATEGY_DEFAULTS) - 1
+    assert not st["kpis_ready"] and st["strategies"]["NB Genesis Fund"] == {"none": "pending"}
+
+def test_a_run_is_claimed_before_it_is_scheduled(monkeypatch):
+
+    monkeypatch.setattr(pregen, "STATE", {"running": False, "last_run": None})
+    assert pregen.claim() and not pregen.claim()   # e.g. the first POST's task hasn't started yet
+    with TestClient(app) as c:
+        r = c.post("/pregen/run", params={"as_of_period_end": str(PERIOD), "backends": "none"})
+    assert r.json()["scheduled"] is False
+    assert "in progress" in asyncio.run(pregen.arun(PERIOD, ["none"]))["reason"] and pregen.STATE["running"]
@@ -0,0 +1,51 @@
+import json
+import pytest
+from app import prompt_layout
+from app.schemas import GenerateRequest
+from app.tools.kpi_compute import load_kpis
+
+KPIS = {"benchmark_return_pct": 3.2, "ten_year_yield": 4.25, "fx_dxy_change_pct": None, "sector_leaders": ["Energy"]}
+RS = {"benchmark_id": "SPX_TR"}
+
+def _req(as_of="2025-06-30"):
+    return GenerateRequest(as_of_period_end=as_of, strategy_name="NB US Equity Fund")
+
+def test_static_prefix_is_identical_across_requests(monkeypatch):
+
+    monkeypatch.setenv("PROMPT_LAYOUT", "prefix")
+    a = prompt_layout.writer(_req(), RS, KPIS, ["Equities rallied."])
+    b = prompt_layout.writer(_req("2025-03-31"), {"benchmark_id": "AGG"}, {**KPIS, "ten_year_yield": 4.5}, ["Bonds eased."])
+    assert a.system == b.system and a.user != b.user
+    assert "2025" not in a.system and "4.25" not in a.system
+
+    # facts are compact JSON at the very end, nulls dropped
+    facts = json.loads(a.user.rsplit("\n", 1)[-1])
+    assert facts == {"benchmark_return_pct": 3.2, "ten_year_yield": 4.25, "sector_leaders": ["Energy"]}
+
+    c1 = prompt_layout.compliance("Draft one.", KPIS)
+    c2 = prompt_layout.compliance("Draft two.", {"benchmark_return_pct": 1.0})
+    assert c1.system == c2.system and c1.user.endswith("Draft one.")
+
+def test_budget_drops_exemplars_then_raises(monkeypatch):
+
+    monkeypatch.setenv("PROMPT_LAYOUT", "prefix")
+    exemplars = [f"Exemplar sentence {i} " + "word " * 60 for i in range(5)]
+    full = prompt_layout.writer(_req(), RS, KPIS, exemplars, budget=10 ** 6)
+    assert full.exemplars_used == 5
+
+    trimmed = prompt_layout.writer(_req(), RS, KPIS, exemplars, budget=full.tokens - 100)
+    assert 0 < trimmed.exemplars_used < 5 and trimmed.tokens <= full.tokens - 100
+    assert prompt_layout.count_tokens(trimmed.system) + prompt_layout.count_tokens(trimmed.user) == trimmed.tokens
+
+    with pytest.raises(prompt_layout.PromptBudgetExceeded):
+        prompt_layout.writer(_req(), RS, KPIS, exemplars, budget=50)
+
+def test_legacy_layout_renders_the_original_templates(monkeypatch):
+
+    monkeypatch.setenv("PROMPT_LAYOUT", "legacy")
+    kpis = load_kpis(_req().as_of_period_end, "SPX_TR")
+    w = prompt_layout.writer(_req(), RS, kpis, ["Equities rallied."], plan_text="PLAN")
+    assert not w.prefix and "PLAN" in w.user and w.combined() == w.user
+
+    c = prompt_layout.compliance("Draft.", kpis, system="Be strict.")
+    assert c.system == "Be strict." and "Draft." in c.user
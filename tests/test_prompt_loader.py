@@ -0,0 +1,31 @@
+import os
+from app.prompt_loader import PromptRegistry, Prompt
+
+def _write(d, name, text, required):
+    (d / f"{name}.txt").write_text(text, encoding="utf-8")
+    (d / f"{name}.json").write_text('{"required_vars": %s}' % str(required).replace("'", '"'), encoding="utf-8")
+
+def test_registry_compiles_once_and_reloads_on_change(tmp_path):
+    _write(tmp_path, "p", "Hello {{ who }}", ["who"])
+    reg = PromptRegistry(tmp_path)
+    first = reg.get("p")
+    assert reg.get("p") is first
+    assert first.template.render(who="NB") == "Hello NB"
+
+    # same content, new mtime: template is kept
+    os.utime(tmp_path / "p.txt", ns=(first.stamp[0] + 10**9, first.stamp[0] + 10**9))
+    touched = reg.get("p")
+    assert touched.template is first.template and touched.stamp != first.stamp
+
+    _write(tmp_path, "p", "Bye {{ who }}!", ["who"])
+    changed = reg.get("p")
+    assert changed.content_hash != first.content_hash
+    assert changed.template.render(who="NB") == "Bye NB!"
+
+def test_prompt_reports_missing_vars():
+    try:
+        Prompt("planner").render({"kpis_json": {}})
+    except ValueError as e:
+        assert "banned_phrases" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
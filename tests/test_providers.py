@@ -0,0 +1,146 @@
+import asyncio
+from datetime import date
+import httpx
+import pandas as pd
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.tools import providers
+from app.tools.data_fetchers import SECTOR_ETF_MAP
+
+DAYS = pd.bdate_range("2024-03-01", "2025-07-03")
+
+def stand_in(fail_first: int = 0):
+    # local Yahoo/FRED/internal look-alike; records every upstream call
+
+    app = FastAPI()
+    app.state.calls, app.state.failures = [], fail_first
+
+    def failing():
+        if app.state.failures > 0:
+            app.state.failures -= 1
+            return True
+        return False
+
+    @app.get("/v8/finance/chart/{symbol}")
+    async def chart(symbol: str):
+        app.state.calls.append(symbol)
+        await asyncio.sleep(0.05)
+        if failing():
+            return _error()
+        if symbol == "BROKEN":
+            return {"chart": {"result": [{"timestamp": [1]}]}}   # no "indicators"
+        px = [100 + i * (0.1 if symbol != "XLU" else -0.05) for i in range(len(DAYS))]
+        return {"chart": {"result": [{"timestamp": [int(d.timestamp()) for d in DAYS],
+                                      "indicators": {"quote": [{"close": px}], "adjclose": [{"adjclose": px}]}}]}}
+
+    @app.get("/fred/series/observations")
+    async def fred(series_id: str):
+        app.state.calls.append(series_id)
+        if failing():
+            return _error()
+        if series_id == "CPIAUCSL":
+            months = pd.date_range("2024-01-01", "2025-07-01", freq="MS")
+            return {"observations": [{"date": str(d.date()), "value": str(300 + i)} for i, d in enumerate(months)]}
+        return {"observations": [{"date": str(d.date()), "value": "." if i == 3 else "4.2"} for i, d in enumerate(DAYS)]}
+
+    @app.get("/series")
+    async def series(request: Request):
+        ids = request.query_params["ids"].split(",")
+        app.state.calls.append(ids)
+        return {"series": {i: {"dates": ["2025-06-30"], "values": [1.0]} for i in ids}}
+
+    return app
+
+def _error():
+    return JSONResponse({"error": "down"}, status_code=503)
+
+@pytest.fixture
+def pool_for():
+    pools = []
+    def make(app):
+        pools.append(providers.Pool(transport=httpx.ASGITransport(app=app)))
+        return pools[-1]
+    yield make
+    for p in pools:
+        p.loop().call_soon_threadsafe(p.loop().stop)
+
+def test_identical_concurrent_requests_coalesce(pool_for, monkeypatch):
+
+    monkeypatch.setenv("FRED_API_KEY", "test")
+    app = stand_in()
+    fred = providers.Fred("http://fred", pool=pool_for(app))
+
+    async def many():
+        return await asyncio.gather(*(fred.fetch(["DGS10"], date(2025, 1, 1), date(2025, 6, 30)) for _ in range(40)))
+
+    results = fred.pool.run(many())
+    assert app.state.calls == ["DGS10"] and fred.counters["coalesced"] == 39
+    assert all(r["DGS10"].iloc[-1] == 4.2 for r in results)
+
+def test_batching_splits_by_batch_size(pool_for):
+
+    app = stand_in()
+    internal = providers.InternalSeries("http://internal", pool=pool_for(app))
+    internal.batch_size = 2
+    got = internal.pool.run(internal.fetch(["A", "B", "C"], date(2025, 6, 1), date(2025, 6, 30)))
+    assert sorted(got) == ["A", "B", "C"] and sorted(map(len, app.state.calls)) == [1, 2]
+
+def test_retries_then_breaker_serves_last_good(pool_for):
+
+    app = stand_in(fail_first=2)
+    yahoo = providers.YahooChart("http://yahoo", pool=pool_for(app), max_retries=3, backoff_s=0.001,
+                                 breaker=providers.CircuitBreaker(failures=2, reset_s=60))
+    window = (date(2025, 1, 1), date(2025, 6, 30))
+    first = yahoo.pool.run(yahoo.fetch(["XLK"], *window))["XLK"]
+    assert len(app.state.calls) == 3 and yahoo.counters["retries"] == 2
+
+    app.state.failures = 10 ** 6
+    yahoo.max_retries = 0
+    for _ in range(2):
+        assert yahoo.pool.run(yahoo.fetch(["XLK"], *window))["XLK"].equals(first)
+    assert yahoo.breaker.state == "open"
+    calls = len(app.state.calls)
+    yahoo.pool.run(yahoo.fetch(["XLK"], *window))   # open: no upstream call, last good value
+    assert len(app.state.calls) == calls and yahoo.counters["fallbacks"] == 3
+
+    with pytest.raises(providers.ProviderError):
+        yahoo.pool.run(yahoo.fetch(["XLE"], *window))
+    with pytest.raises(providers.ProviderError):   # last good is per window: May's series can't stand in for June's
+        yahoo.pool.run(yahoo.fetch(["XLK"], date(2025, 1, 1), date(2025, 7, 31)))
+
+def test_frame_stays_inside_the_window_and_does_not_carry_stale_values(pool_for, monkeypatch):
+
+    app = stand_in()
+    pool = pool_for(app)
+    monkeypatch.setattr(providers, "PROVIDERS", {"internal": providers.InternalSeries("http://internal", pool=pool)})
+    yahoo = providers.YahooChart("http://yahoo", pool=pool)
+    monkeypatch.setitem(providers.PROVIDERS, "yahoo", yahoo)
+    frame = pool.run(providers.afetch_frame({"XLK": "yahoo:XLK", "A": "internal:A"}, date(2025, 6, 1), date(2025, 7, 2)))
+    assert frame.index.min() == pd.Timestamp("2025-06-02") and frame.index.max() == pd.Timestamp("2025-07-02")
+    assert frame["A"].last_valid_index() == pd.Timestamp("2025-06-30") and frame["XLK"].notna().all()   # A stopped
+
+def test_malformed_payload_fails_and_does_not_strand_later_fetches(pool_for):
+
+    app = stand_in()
+    yahoo = providers.YahooChart("http://yahoo", pool=pool_for(app), max_retries=0)
+    window = (date(2025, 1, 1), date(2025, 6, 30))
+    for _ in range(2):   # the second call gets its own upstream request instead of waiting on a dead future
+        with pytest.raises(providers.ProviderError, match="malformed"):
+            yahoo.pool.run(yahoo.fetch(["BROKEN"], *window), timeout=2)
+    assert app.state.calls == ["BROKEN", "BROKEN"] and not yahoo._inflight and yahoo.breaker.failures == 2
+
+def test_fetch_kpis_end_to_end(pool_for, monkeypatch):
+
+    app = stand_in()
+    pool = pool_for(app)
+    monkeypatch.setenv("FRED_API_KEY", "test")
+    monkeypatch.setattr(providers, "POOL", pool)
+    monkeypatch.setattr(providers, "PROVIDERS", {"yahoo": providers.YahooChart("http://yahoo", pool=pool),
+                                                 "fred": providers.Fred("http://fred", pool=pool)})
+    kpis = providers.fetch_kpis(date(2025, 6, 30), "SPX_TR")
+
+    assert kpis["benchmark_name"] == "S&P 500 Total Return" and kpis["benchmark_return_pct"] > 0
+    assert kpis["ten_year_yield"] == 4.2 and kpis["inflation_yoy_pct"] > 0
+    assert kpis["sector_laggards"][0] == "Utilities"
+    assert len(app.state.calls) == len(SECTOR_ETF_MAP) + 4
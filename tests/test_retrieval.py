@@ -0,0 +1,69 @@
+import json, threading
+from app.tools import retrieval
+
+def _index(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "_CANDIDATES", [tmp_path])
+    return retrieval.SeedIndex()
+
+def test_seed_index_ranks_by_similarity(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("Equities rallied in 2024 as technology shares advanced 12%.\nUtilities lagged amid defensive rotation.", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("Treasury yields rose sharply as inflation surprised to the upside.", encoding="utf-8")
+    idx = _index(tmp_path, monkeypatch).refresh()
+    assert len(idx.snippets) == 3 and idx.matrix.shape == (3, retrieval.DIM)
+    assert "2024" not in idx.snippets[0] and "12%" not in idx.snippets[0]
+    assert idx.top_k("inflation treasury yields", 1)[0].startswith("Treasury yields rose")
+    assert idx.top_k(None, 2) == idx.snippets[:2]
+
+def test_seed_index_rebuilds_only_changed_files(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("Equities rallied as technology shares advanced.", encoding="utf-8")
+    idx = _index(tmp_path, monkeypatch).refresh()
+    rows_a = idx._files["a.txt"][2]
+    (tmp_path / "b.txt").write_text("Energy led while real estate lagged.", encoding="utf-8")
+    idx.refresh()
+    assert idx._files["a.txt"][2] is rows_a and len(idx.snippets) == 2
+
+def test_readers_never_see_a_half_published_rebuild(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("Equities rallied as technology shares advanced.", encoding="utf-8")
+    idx = _index(tmp_path, monkeypatch).refresh()
+    stop, errors = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            try:
+                snap = idx._snap
+                assert snap.matrix.shape[0] == len(snap.snippets)
+                idx.top_k("energy oil utilities", 1)
+            except Exception as e:
+                errors.append(e)
+                return
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(30):   # each rewrite changes the snippet count, so a torn read would misalign
+        (tmp_path / "b.txt").write_text("\n".join(f"Energy led {j}x while utilities lagged." for j in range(i % 5 + 1)), encoding="utf-8")
+        idx.refresh()
+    stop.set()
+    for t in readers:
+        t.join()
+    assert not errors and len(idx.snippets) == idx.matrix.shape[0]
+
+def test_persisted_index_is_read_only_as_a_matching_pair(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "PERSIST", True)
+    (tmp_path / "a.txt").write_text("Equities rallied as technology shares advanced.", encoding="utf-8")
+    _index(tmp_path, monkeypatch).refresh()
+    (tmp_path / "b.txt").write_text("Energy led while real estate lagged.", encoding="utf-8")
+    built = _index(tmp_path, monkeypatch).refresh()   # the rebuild replaces the matrix file and drops the old one
+    assert len(list((tmp_path / ".index").glob("tf*.npy"))) == 1
+
+    loaded = retrieval.SeedIndex._load_persisted(tmp_path)
+    assert sorted(loaded) == ["a.txt", "b.txt"] and (loaded["b.txt"][2] == built._files["b.txt"][2]).all()
+
+    manifest = tmp_path / ".index" / "manifest.json"   # a manifest from another build than the matrix: not used
+    m = json.loads(manifest.read_text(encoding="utf-8"))
+    manifest.write_text(json.dumps({**m, "rows": m["rows"] + 1}), encoding="utf-8")
+    assert retrieval.SeedIndex._load_persisted(tmp_path) == {}
+
+def test_build_query_uses_kpis():
+    q = retrieval.build_query({"benchmark_name": "S&P 500", "benchmark_return_pct": -1.0, "ten_year_change_bps": 12,
+                               "sector_leaders": ["Energy"], "sector_laggards": ["InfoTech"]}, "equities")
+    assert "yields rose" in q and "energy" in q and "technology" in q
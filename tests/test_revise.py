@@ -0,0 +1,81 @@
+import asyncio, json
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app import gen_cache, llm, pipeline, revise
+from app.gen_cache import GenerationCache
+from app.main import app
+from app.schemas import GenerateRequest, GenerateResponse, KPIBundle
+from app.tools.kpi_compute import load_kpis
+
+REQ = GenerateRequest(as_of_period_end="2025-06-30", strategy_name="NB Genesis Fund")
+OLD = load_kpis(REQ.as_of_period_end, "SPX_TR")
+TEXT = pipeline._template_text(OLD, REQ.as_of_period_end)
+PARAGRAPHS = ("The index returned 3.2% in June.\n\nVIX ended at 14.1 while the 10-year yield rose 5 bps to 4.22%.\n\n"
+              "InfoTech and Energy led; Utilities and RealEstate lagged.\n\nEPS grew 12.8% with 78.0% of companies beating.")
+
+def _previous(text=TEXT):
+    return GenerateResponse(text=text, kpis=KPIBundle(**OLD), assumptions={"style": "house"})
+
+def test_same_sign_revisions_are_patched_in_place_section_by_section():
+
+    new = {**OLD, "eps_beat_rate_pct": 81.25, "sector_leaders": ["Energy", "InfoTech"]}
+    rev = revise.plan(PARAGRAPHS, OLD, new)
+    assert rev.mode == "patch" and rev.sections == ["sectors", "earnings"] and rev.patched == {4, 6}
+    assert rev.text() == PARAGRAPHS.replace("InfoTech and Energy", "Energy and InfoTech").replace("78.0%", "81.25%")
+
+    rev = revise.plan(PARAGRAPHS, OLD, {**OLD, "ten_year_change_bps": 7})
+    assert rev.patched == {2} and "rose 7 bps" in rev.text() and rev.text().count("\n\n") == 3
+
+    assert revise.plan(TEXT, OLD, {**OLD, "inflation_yoy_pct": 3.1}).text() == TEXT.replace("3.0% YoY", "3.1% YoY")
+    assert revise.plan(TEXT, OLD, dict(OLD)).mode == "unchanged"
+
+def test_removed_fields_drop_their_sentences_and_sign_flips_need_a_rewrite():
+
+    rev = revise.plan(TEXT, OLD, {**OLD, "eps_growth_pct": None, "eps_beat_rate_pct": None})
+    assert rev.mode == "patch" and "EPS" not in rev.text() and rev.text().startswith(TEXT[:40])
+
+    rev = revise.plan(PARAGRAPHS, OLD, {**OLD, "benchmark_return_pct": -1.4, "vix_end": 15.0})
+    assert rev.reprompt == {0: ["benchmark_return_pct"]} and rev.patched == {2}
+
+    # never mentioned (CPI isn't in this text): worked into the paragraph holding its section
+    assert revise.plan(PARAGRAPHS, OLD, {**OLD, "inflation_yoy_pct": 3.1}).reprompt == {2: ["inflation_yoy_pct"]}
+
+    # the figure 3.0 would stand for two fields, so it can't be swapped blindly
+    assert revise.patch("CPI and EPS were both 3.0%.", ["inflation_yoy_pct"], {**OLD, "eps_growth_pct": 3.0},
+                        {**OLD, "inflation_yoy_pct": 3.1}) is None
+
+class _Client:
+
+    def __init__(self, reply):
+        self.prompts = []
+        async def create(**kw):
+            self.prompts.append(kw["messages"][-1]["content"])
+            return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+def test_only_the_affected_paragraph_is_reprompted_and_checked(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(gen_cache, "CACHE", GenerationCache(tmp_path / "gen.sqlite"))
+    client = _Client("The index fell 1.4% in June. It gained 9.9% on hopes of a rebound.")
+    monkeypatch.setattr(llm, "get_async_client", lambda: client)
+    new = {**OLD, "benchmark_return_pct": -1.4}
+
+    out = asyncio.run(revise.arevise(REQ, _previous(PARAGRAPHS), new, "none"))
+    summary = json.loads(out.assumptions["revision"])
+    assert summary["mode"] == "reprompt" and summary["sections"] == ["benchmark"] and len(client.prompts) == 1
+    assert "3.2%" in client.prompts[0] and "VIX" not in client.prompts[0]
+    assert out.text == PARAGRAPHS.replace("The index returned 3.2% in June.", "The index fell 1.4% in June.")
+    assert out.kpis.benchmark_return_pct == -1.4 and out.assumptions["style"] == "house"
+
+    rs = pipeline.resolve_strategy(REQ)   # client-supplied text never reaches the shared cache
+    assert not gen_cache.CACHE.has(gen_cache.cache_key("none", REQ.as_of_period_end, rs, new))
+
+def test_endpoint_falls_back_to_full_generation_without_a_model(monkeypatch):
+
+    monkeypatch.setattr(llm, "get_async_client", lambda: None)
+    body = {"request": json.loads(REQ.model_dump_json()), "previous": json.loads(_previous().model_dump_json()),
+            "kpis": {**OLD, "benchmark_return_pct": -1.4}}
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context/revise?backend=none", json=body)
+    assert r.status_code == 200 and json.loads(r.json()["assumptions"]["revision"])["mode"] == "full"
+    assert "returned -1.4%" in r.json()["text"]
@@ -0,0 +1,55 @@
+import importlib.util, shutil, sys
+from pathlib import Path
+import pytest
+
+pytest.importorskip("pdfplumber")
+ROOT = Path(__file__).resolve().parents[1]
+spec = importlib.util.spec_from_file_location("seed_style", ROOT / "scripts" / "seed_style.py")
+seed_style = sys.modules["seed_style"] = importlib.util.module_from_spec(spec)   # workers unpickle by module name
+spec.loader.exec_module(seed_style)
+
+BLANK_PDF = (b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+             b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\ntrailer<</Root 1 0 R>>\n%%EOF\n")
+LONG = "Equities rallied broadly as investors weighed shifting policy headlines and firmer growth data"
+
+def test_streaming_matches_joined_text_and_stops_at_section_end():
+
+    pages = [f"Intro sentence that is long enough to count as a snippet here. {LONG} and", f"across sectors. Market Context\n{LONG}. ",
+             f"{LONG} again today. Outlook\n{LONG} after the section."]
+    out = seed_style.snippets_from_pages(iter(pages))
+    assert out[0].startswith("Market Context Equities") and len(out) == 2
+
+    # without the heading the old join-everything result is reproduced, page breaks included
+    joined = seed_style.snippets_from_pages(iter([p.replace("Outlook\n", "") for p in pages]))
+    legacy = [seed_style.strip_numbers(s) for s in seed_style.extract_candidates(" ".join(p.replace("Outlook\n", "") for p in pages))]
+    assert joined == [s for s in legacy if 8 <= len(s.split()) <= 35][:5]
+
+def test_stops_reading_pages_once_enough_snippets():
+
+    read = []
+    def pages():
+        for i in range(100):
+            read.append(i)
+            yield f"Market Context {LONG}. " if i == 0 else f"{LONG} number {i}. "
+    assert len(seed_style.snippets_from_pages(pages(), max_snippets=3)) == 3
+    assert len(read) < 5
+
+def test_incremental_run_reproduces_committed_seeds(tmp_path):
+
+    raw, seeds = tmp_path / "raw", tmp_path / "seeds"
+    shutil.copytree(ROOT / "data" / "raw", raw)
+    first = seed_style.run(raw, seeds, workers=2)
+    assert len(first["written"]) == 3
+    for f in (ROOT / "data" / "seeds").glob("*.txt"):
+        assert (seeds / f.name).read_text(encoding="utf-8") == f.read_text(encoding="utf-8")
+
+    assert seed_style.run(raw, seeds)["unchanged"] == sorted(p.name for p in raw.glob("*.pdf"))
+    victim = sorted(raw.glob("*.pdf"))[0]
+    victim.unlink()
+    assert seed_style.run(raw, seeds)["removed"] == [victim.name] and not (seeds / (victim.stem + ".txt")).exists()
+    assert not list(seeds.glob("*.tmp"))
+
+    blanked = sorted(raw.glob("*.pdf"))[0]   # revised into a PDF with no usable text: its old seeds go too
+    blanked.write_bytes(BLANK_PDF)
+    assert seed_style.run(raw, seeds)["empty"] == [blanked.name] and not (seeds / (blanked.stem + ".txt")).exists()
+    assert seed_style.run(raw, seeds)["unchanged"] == sorted(p.name for p in raw.glob("*.pdf"))
@@ -0,0 +1,30 @@
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(l.split(": ", 1) for l in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+def test_stream_emits_tokens_then_final():
+    with TestClient(app) as c:
+        r = c.get("/generate/market-context/stream", params={"as_of_period_end": "2025-06-30",
+                                                             "strategy_name": "NB US Equity Fund", "cache": "false"})
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = _events(r.text)
+    tokens = [d["text"] for e, d in events if e == "token"]
+    assert len(tokens) > 5 and events[-1][0] == "final"
+    final = events[-1][1]
+    assert "".join(tokens).strip() in final["text"] and final["kpis"]["benchmark_return_pct"] == 3.2
+
+def test_get_stream_takes_style_as_json_and_rejects_bad_fields_with_422():
+    params = {"as_of_period_end": "2025-06-30", "strategy_name": "NB US Equity Fund", "cache": "false"}
+    with TestClient(app) as c:
+        r = c.get("/generate/market-context/stream", params={**params, "style": json.dumps({"benchmark_label": "S&P 500 Index"})})
+        assert "S&P 500 Index" in _events(r.text)[-1][1]["text"]
+        bad = c.get("/generate/market-context/stream", params={**params, "asset_class": "crypto"})
+        assert bad.status_code == 422 and bad.json()["detail"][0]["loc"] == ["query", "asset_class"]
+        assert c.get("/generate/market-context/stream", params={**params, "style": "{oops"}).status_code == 422
@@ -0,0 +1,45 @@
+import json
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app import telemetry
+from app.main import app
+
+def test_histogram_and_counter_render():
+
+    h = telemetry.Histogram("t_seconds", "test", buckets=(0.1, 1.0))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    lines = h.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 't_seconds_count{stage="a"} 2' in lines
+
+    c = telemetry.Counter("t_total", "test")
+    c.inc(3, kind="prompt")
+    assert 't_total{kind="prompt"} 3' in c.render()
+
+def test_stages_and_usage_land_in_trace(monkeypatch):
+
+    monkeypatch.setenv("LLM_PRICE_PER_1M", "1,2")
+    with telemetry.request("none") as t:
+        with telemetry.stage("writer_llm"):
+            telemetry.observe_llm("writer_llm", SimpleNamespace(usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=500)))
+    stages = t.summary()["stages"]
+    assert [s["stage"] for s in stages] == ["writer_llm", "writer_llm"]
+    assert stages[0]["cost_usd"] == 0.002 and stages[0]["completion_tokens"] == 500
+    assert telemetry.current() is None
+
+def test_metrics_endpoint_and_timings_in_response():
+
+    body = {"as_of_period_end": "2025-06-30", "strategy_name": "NB US Equity Fund"}
+    with TestClient(app) as c:
+        r = c.post("/generate/market-context", json=body, params={"cache": "false", "trace": "true"})
+        m = c.get("/metrics")
+
+    timings = json.loads(r.json()["assumptions"]["timings"])
+    assert timings["backend"] == "none"
+    assert {"kpis", "planner_render", "writer_render", "compliance_code"} <= {s["stage"] for s in timings["stages"]}
+
+    assert m.headers["content-type"].startswith("text/plain")
+    assert 'mc_request_seconds_count{backend="none"}' in m.text
+    assert 'stage="writer_render"' in m.text